@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Estadísticas del panel de administración calculadas en SQL
+Todos los contadores se obtienen en una sola consulta y se guardan en una
+instantánea de TTL corto, para que la portada del admin no dependa del
+tamaño de las tablas de pagos y membresías
+"""
+
+import threading
+import time
+
+
+class AdminStats:
+    """Instantánea cacheada de los contadores del dashboard administrativo"""
+
+    def __init__(self, ttl=30, recent_limit=5):
+        """
+        Args:
+            ttl: Segundos de vida de la instantánea
+            recent_limit: Usuarios y membresías recientes incluidos
+        """
+        self.ttl = ttl
+        self.recent_limit = recent_limit
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Contadores y listados recientes; solo consulta la base de datos al caducar"""
+        with self._lock:
+            if self._snapshot is not None and self._expires_at > time.monotonic():
+                return self._snapshot
+
+        snapshot = self.compute()
+        with self._lock:
+            self._snapshot = snapshot
+            self._expires_at = time.monotonic() + self.ttl
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def compute(self):
+        """Calcular la instantánea: una consulta para todos los agregados y una por listado"""
+        from app import db, User, Membership, Payment
+        from sqlalchemy.orm import joinedload
+
+        succeeded = Payment.status == 'succeeded'
+        counters = db.session.execute(db.select(
+            db.select(db.func.count(User.id)).scalar_subquery().label('total_users'),
+            db.select(db.func.count(Membership.id)).scalar_subquery().label('total_memberships'),
+            db.select(db.func.count(Membership.id)).where(
+                Membership.is_active == True  # noqa
+            ).scalar_subquery().label('active_memberships'),
+            db.select(db.func.count(Payment.id)).where(succeeded).scalar_subquery().label('total_payments'),
+            db.select(db.func.coalesce(db.func.sum(Payment.amount), 0)).where(
+                succeeded
+            ).scalar_subquery().label('revenue_cents'),
+        )).one()
+
+        # Los listados se guardan como diccionarios para no retener objetos del ORM
+        recent_users = [{
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+            'created_at': user.created_at,
+        } for user in User.query.order_by(User.created_at.desc()).limit(self.recent_limit)]
+
+        recent_memberships = [{
+            'user': {'first_name': membership.user.first_name, 'last_name': membership.user.last_name},
+            'membership_type': membership.membership_type,
+            'is_active': membership.is_active,
+            'created_at': membership.created_at,
+        } for membership in Membership.query.options(joinedload(Membership.user)).order_by(
+            Membership.created_at.desc()
+        ).limit(self.recent_limit)]
+
+        return {
+            'total_users': counters.total_users,
+            'total_memberships': counters.total_memberships,
+            'active_memberships': counters.active_memberships,
+            'total_payments': counters.total_payments,
+            'total_revenue': counters.revenue_cents / 100,
+            'recent_users': recent_users,
+            'recent_memberships': recent_memberships,
+        }
@@ -5,15 +5,30 @@ Backend Flask para gestión de usuarios y membresías
 """
 
 import sys
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import object_session
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import os
 import secrets
+import sqlite3
+import time
 import stripe
-from flask_mail import Mail, Message
+from flask_mail import Mail
+from email_queue import EmailQueue
+from membership_cache import MembershipCache, MembershipTier
+from event_pricing import apply_event_discount
+from admin_stats import AdminStats
+from membership_rollups import record_payment, record_subscription, series as membership_series
+from local_time import resolve_timezone, to_local
+import email_search
+import email_stats
+import notification_inbox
+from notification_stream import NotificationBroker, mark_changed as mark_notifications_changed, stream as notification_event_stream
 try:
     from email_service import EmailService
     from email_templates import (
@@ -40,7 +55,7 @@ app = Flask(__name__, template_folder='../templates', static_folder='../static')
 # Ensure module alias 'app' points to this instance even when running as __main__
 sys.modules.setdefault('app', sys.modules[__name__])
 app.config['SECRET_KEY'] = secrets.token_hex(16)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///relaticpanama.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///relaticpanama.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Configuración de Stripe
@@ -55,6 +70,36 @@ app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', 'your_email@gmail.com')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', 'your_app_password')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@relaticpanama.org')
 
+# Configuración de la cola de correo saliente
+app.config['EMAIL_QUEUE_WORKERS'] = int(os.getenv('EMAIL_QUEUE_WORKERS', 2))  # 0 = usar worker externo (email_queue.py)
+app.config['EMAIL_QUEUE_MAX_ATTEMPTS'] = int(os.getenv('EMAIL_QUEUE_MAX_ATTEMPTS', 3))
+app.config['EMAIL_QUEUE_RETRY_DELAY'] = int(os.getenv('EMAIL_QUEUE_RETRY_DELAY', 30))
+
+# Caché de membresías por proceso (cada worker de gunicorn tiene la suya; el TTL acota la desactualización)
+app.config['MEMBERSHIP_CACHE_SIZE'] = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 10000))
+app.config['MEMBERSHIP_CACHE_TTL'] = int(os.getenv('MEMBERSHIP_CACHE_TTL', 60))
+
+# Instantánea de contadores del panel de administración (segundos)
+app.config['ADMIN_STATS_TTL'] = int(os.getenv('ADMIN_STATS_TTL', 30))
+
+# Canal SSE de notificaciones: relectura sin aviso, keepalive y duración máxima (segundos)
+# Desactivado por defecto: cada conexión abierta ocupa un worker (o un hilo) durante
+# NOTIFICATION_STREAM_MAX_SECONDS, así que solo debe activarse con workers gthread o
+# gevent (ver README); sin él, el navbar consulta el contador cada minuto
+app.config['NOTIFICATION_STREAM_ENABLED'] = os.getenv('NOTIFICATION_STREAM_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+app.config['NOTIFICATION_STREAM_POLL'] = int(os.getenv('NOTIFICATION_STREAM_POLL', 30))
+app.config['NOTIFICATION_STREAM_KEEPALIVE'] = int(os.getenv('NOTIFICATION_STREAM_KEEPALIVE', 15))
+app.config['NOTIFICATION_STREAM_MAX_SECONDS'] = int(os.getenv('NOTIFICATION_STREAM_MAX_SECONDS', 300))
+for _setting in ('NOTIFICATION_STREAM_POLL', 'NOTIFICATION_STREAM_KEEPALIVE', 'NOTIFICATION_STREAM_MAX_SECONDS'):
+    if app.config[_setting] <= 0:
+        raise ValueError(f"{_setting} debe ser mayor que 0 (valor: {app.config[_setting]})")
+
+# Zona horaria en la que se escriben y muestran las fechas de slots y citas (se guardan en UTC)
+app.config['APP_TIMEZONE'] = os.getenv('APP_TIMEZONE', 'America/Panama')
+
+# Cabeceras X-Query-Count / X-Query-Time-Ms en cada respuesta (también activas en modo debug)
+app.config['QUERY_DEBUG_HEADERS'] = os.getenv('QUERY_DEBUG_HEADERS', 'false').lower() in ('1', 'true', 'yes')
+
 # Inicialización de extensiones
 db = SQLAlchemy(app)
 login_manager = LoginManager()
@@ -63,7 +108,21 @@ mail = Mail(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Por favor, inicia sesión para acceder a esta página.'
 
-# Inicializar servicio de correo
+# Inicializar cola de correo saliente y servicio de correo
+email_queue = EmailQueue(mail, app)
+
+# Caché de tipo de membresía activa por usuario
+membership_cache = MembershipCache(
+    maxsize=app.config['MEMBERSHIP_CACHE_SIZE'],
+    ttl=app.config['MEMBERSHIP_CACHE_TTL']
+)
+
+# Contadores del dashboard administrativo calculados en SQL
+admin_stats = AdminStats(ttl=app.config['ADMIN_STATS_TTL'])
+
+# Pub/sub en memoria que despierta los streams SSE de notificaciones
+notification_broker = NotificationBroker()
+
 if EMAIL_TEMPLATES_AVAILABLE:
     email_service = EmailService(mail)
 else:
@@ -84,6 +143,14 @@ class User(UserMixin, db.Model):
     
     # Relación con membresías
     memberships = db.relationship('Membership', backref='user', lazy=True)
+
+    # Índices para el listado administrativo (orden por alta y búsqueda por prefijo)
+    __table_args__ = (
+        db.Index('ix_user_created_at', 'created_at'),
+        db.Index('ix_user_email_lower', db.func.lower(email)),
+        db.Index('ix_user_first_name_lower', db.func.lower(first_name)),
+        db.Index('ix_user_last_name_lower', db.func.lower(last_name)),
+    )
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -92,6 +159,39 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
     def get_active_membership(self):
+        """Membresía activa del usuario, calculada una sola vez por petición"""
+        cache = _membership_request_cache()
+        if cache is not None and self.id in cache:
+            return cache[self.id]
+        
+        membership = self._load_active_membership()
+        if cache is not None:
+            cache[self.id] = membership
+        return membership
+    
+    def get_membership_tier(self):
+        """MembershipTier (tipo y vencimiento) de la membresía activa, o None; servido desde membership_cache"""
+        found, tier = membership_cache.get(self.id)
+        if found:
+            return tier
+        return _membership_tier(self.get_active_membership())
+    
+    def _load_active_membership(self):
+        found, tier = membership_cache.get(self.id)
+        if found:
+            if tier is None:
+                return None
+            # Solo una búsqueda por clave primaria del registro ya identificado
+            model = Subscription if tier.source == 'subscription' else Membership
+            record = model.query.get(tier.record_id)
+            if _membership_still_active(record):
+                return record
+        
+        membership = self._query_active_membership()
+        membership_cache.set(self.id, _membership_tier(membership))
+        return membership
+    
+    def _query_active_membership(self):
         # Buscar suscripción activa primero
         active_subscription = Subscription.query.filter_by(
             user_id=self.id, 
@@ -103,6 +203,44 @@ class User(UserMixin, db.Model):
         
         # Fallback al sistema anterior si existe
         return Membership.query.filter_by(user_id=self.id, is_active=True).first()
+    
+    def invalidate_membership_cache(self):
+        """Descartar la membresía memorizada (llamar tras crear o modificar suscripciones)"""
+        invalidate_membership_cache(self.id)
+
+
+def _membership_request_cache():
+    """Diccionario user_id -> membresía activa en flask.g, solo dentro de una petición"""
+    if not has_request_context():
+        return None
+    if 'active_memberships' not in g:
+        g.active_memberships = {}
+    return g.active_memberships
+
+
+def invalidate_membership_cache(user_id):
+    """Invalidar la membresía memorizada de un usuario (petición actual y caché de proceso)"""
+    membership_cache.invalidate(user_id)
+    cache = _membership_request_cache()
+    if cache is not None:
+        cache.pop(user_id, None)
+
+
+def _membership_tier(membership):
+    """Resumen cacheable de una Subscription o Membership"""
+    if membership is None:
+        return None
+    source = 'subscription' if isinstance(membership, Subscription) else 'membership'
+    return MembershipTier(membership.membership_type, membership.end_date, source, membership.id)
+
+
+def _membership_still_active(record):
+    """Mismos criterios que User._query_active_membership para un registro concreto"""
+    if record is None:
+        return False
+    if isinstance(record, Subscription):
+        return record.status == 'active' and record.end_date > datetime.utcnow()
+    return bool(record.is_active)
 
 class Membership(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -114,6 +252,10 @@ class Membership(db.Model):
     payment_status = db.Column(db.String(20), default='pending')  # 'pending', 'paid', 'failed'
     amount = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_membership_created_at', 'created_at', 'id'),
+    )
     
     def is_currently_active(self):
         """Verificar si la membresía está actualmente activa"""
@@ -153,6 +295,12 @@ class Subscription(db.Model):
     
     user = db.relationship('User', backref=db.backref('subscriptions', lazy=True))
     payment = db.relationship('Payment', backref=db.backref('subscription', uselist=False))
+
+    __table_args__ = (
+        db.Index('ix_subscription_status_end_date', 'status', 'end_date'),
+        db.Index('ix_subscription_created_at', 'created_at', 'id'),
+        db.Index('ix_subscription_user_status_end', 'user_id', 'status', 'end_date'),
+    )
     
     def is_currently_active(self):
         """Verificar si la suscripción está actualmente activa"""
@@ -163,6 +311,102 @@ class Subscription(db.Model):
         """Propiedad para compatibilidad con Membership"""
         return self.is_currently_active()
 
+def _mark_membership_dirty(mapper, connection, target):
+    """Anotar el usuario cuya membresía cambió; se invalida al confirmar la transacción"""
+    session = object_session(target)
+    if session is not None and target.user_id:
+        session.info.setdefault('membership_dirty_users', set()).add(target.user_id)
+
+
+for _membership_model in (Subscription, Membership):
+    for _membership_event in ('after_insert', 'after_update', 'after_delete'):
+        sa_event.listen(_membership_model, _membership_event, _mark_membership_dirty)
+
+
+@sa_event.listens_for(db.session, 'after_commit')
+def _invalidate_dirty_memberships(session):
+    for user_id in session.info.pop('membership_dirty_users', ()):
+        invalidate_membership_cache(user_id)
+
+
+@sa_event.listens_for(db.session, 'after_rollback')
+def _discard_dirty_memberships(session):
+    session.info.pop('membership_dirty_users', None)
+
+
+# lower() de SQLite solo convierte ASCII: unicode_lower() usa str.lower() de Python
+# para las búsquedas con acentos o eñes (ver _search_prefix)
+@sa_event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            'unicode_lower', 1, lambda value: value.lower() if isinstance(value, str) else value,
+            deterministic=True
+        )
+
+
+# Número de consultas y tiempo de base de datos por petición (cabeceras de depuración)
+@sa_event.listens_for(Engine, 'before_cursor_execute')
+def _query_timer_start(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('query_stats') is not None:
+        context._query_started_at = time.perf_counter()
+
+
+@sa_event.listens_for(Engine, 'after_cursor_execute')
+def _query_timer_stop(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, '_query_started_at', None)
+    if started_at is not None and has_request_context() and g.get('query_stats') is not None:
+        g.query_stats['count'] += 1
+        g.query_stats['seconds'] += time.perf_counter() - started_at
+
+
+@app.before_request
+def _start_query_stats():
+    if app.config['QUERY_DEBUG_HEADERS'] or app.debug:
+        g.query_stats = {'count': 0, 'seconds': 0.0, 'started_at': time.perf_counter()}
+
+
+@app.after_request
+def _add_query_debug_headers(response):
+    stats = g.get('query_stats')
+    if stats is not None:
+        response.headers['X-Query-Count'] = str(stats['count'])
+        response.headers['X-Query-Time-Ms'] = f"{stats['seconds'] * 1000:.1f}"
+        response.headers['X-Response-Time-Ms'] = f"{(time.perf_counter() - stats['started_at']) * 1000:.1f}"
+    return response
+
+
+class MembershipDailyStat(db.Model):
+    """Acumulado diario por tipo de membresía (mantenido de forma incremental)"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    membership_type = db.Column(db.String(50), nullable=False)
+    revenue_cents = db.Column(db.Integer, default=0, nullable=False)
+    payments = db.Column(db.Integer, default=0, nullable=False)
+    new_members = db.Column(db.Integer, default=0, nullable=False)
+    renewals = db.Column(db.Integer, default=0, nullable=False)
+    churned = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'membership_type', name='uq_membership_daily_stat'),
+    )
+
+
+class MembershipMonthlyStat(db.Model):
+    """Acumulado mensual por tipo de membresía (month = primer día del mes)"""
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False)
+    membership_type = db.Column(db.String(50), nullable=False)
+    revenue_cents = db.Column(db.Integer, default=0, nullable=False)
+    payments = db.Column(db.Integer, default=0, nullable=False)
+    new_members = db.Column(db.Integer, default=0, nullable=False)
+    renewals = db.Column(db.Integer, default=0, nullable=False)
+    churned = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('month', 'membership_type', name='uq_membership_monthly_stat'),
+    )
+
 # Modelos de Eventos
 class Event(db.Model):
     """Modelo para eventos según el diagrama de flujo - 5 pasos: Evento, Descripción, Publicidad, Certificado, Kahoot"""
@@ -227,6 +471,11 @@ class Event(db.Model):
     moderator = db.relationship('User', foreign_keys=[moderator_id], backref='moderated_events')
     administrator = db.relationship('User', foreign_keys=[administrator_id], backref='administered_events')
     speaker = db.relationship('User', foreign_keys=[speaker_id], backref='speaker_events')
+
+    __table_args__ = (
+        db.Index('ix_event_status_start', 'publish_status', 'start_date'),
+        db.Index('ix_event_status_end', 'publish_status', 'end_date'),
+    )
     
     def get_notification_recipients(self):
         """Obtiene todos los usuarios que deben recibir notificaciones del evento"""
@@ -270,10 +519,9 @@ class Event(db.Model):
         return '/static/images/default-event.jpg'
     
     def pricing_for_membership(self, membership_type=None):
-        """Calcula el precio final según el tipo de membresía"""
+        """Calcula el precio final según el tipo de membresía (para listas usar EventPricingMatrix)"""
         base_price = self.base_price or 0.0
         discount = None
-        final_price = base_price
         
         if membership_type:
             # Buscar descuento aplicable para este tipo de membresía
@@ -281,21 +529,57 @@ class Event(db.Model):
                 EventDiscount.event_id == self.id,
                 Discount.membership_tier == membership_type,
                 Discount.is_active == True
-            ).order_by(EventDiscount.priority.asc()).first()
+            ).order_by(EventDiscount.priority.asc(), EventDiscount.id.asc()).first()
             
             if event_discount:
                 discount = event_discount.discount
-                if discount.discount_type == 'percentage':
-                    final_price = base_price * (1 - discount.value / 100)
-                elif discount.discount_type == 'fixed':
-                    final_price = max(0, base_price - discount.value)
         
+        final_price = apply_event_discount(base_price, discount)
+
         return {
             'base_price': base_price,
             'final_price': final_price,
             'discount': discount
         }
 
+    def reserve_seat(self):
+        """
+        Reserva atómica de un cupo: un único UPDATE condicional que solo incrementa
+        registered_count si queda capacidad (capacity <= 0 significa sin límite).
+        En PostgreSQL el UPDATE bloquea la fila y reevalúa la condición; en SQLite
+        la escritura está serializada por el bloqueo de la base de datos.
+        El cupo queda tomado hasta el commit y se libera con un rollback.
+
+        Returns:
+            bool: True si se reservó el cupo, False si el evento está lleno
+        """
+        registered = db.func.coalesce(Event.registered_count, 0)
+        updated = Event.query.filter(
+            Event.id == self.id,
+            db.or_(
+                Event.capacity.is_(None),
+                Event.capacity <= 0,
+                registered < Event.capacity
+            )
+        ).update({Event.registered_count: registered + 1}, synchronize_session=False)
+        db.session.expire(self, ['registered_count'])
+        return updated == 1
+
+    def release_seat(self):
+        """Libera un cupo de forma atómica sin dejar el contador en negativo"""
+        updated = Event.query.filter(
+            Event.id == self.id,
+            Event.registered_count > 0
+        ).update({Event.registered_count: Event.registered_count - 1}, synchronize_session=False)
+        db.session.expire(self, ['registered_count'])
+        return updated == 1
+
+    def available_seats(self):
+        """Cupos libres según el contador de reservas (None si no hay límite)"""
+        if not self.capacity or self.capacity <= 0:
+            return None
+        return max(0, self.capacity - (self.registered_count or 0))
+
 class EventImage(db.Model):
     """Imágenes de galería para eventos"""
     id = db.Column(db.Integer, primary_key=True)
@@ -482,6 +766,12 @@ class Notification(db.Model):
     # Relaciones
     user = db.relationship('User', backref='notifications')
     event = db.relationship('Event', backref='notifications')
+
+    __table_args__ = (
+        db.Index('ix_notification_user_type_created', 'user_id', 'notification_type', 'created_at'),
+        db.Index('ix_notification_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_notification_user_read_created', 'user_id', 'is_read', 'created_at'),
+    )
     
     def mark_as_read(self):
         """Marcar notificación como leída"""
@@ -489,6 +779,36 @@ class Notification(db.Model):
         db.session.commit()
 
 
+class NotificationCounter(db.Model):
+    """No leídas por usuario, mantenido por triggers (ver notification_inbox.py)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    unread = db.Column(db.Integer, default=0, nullable=False)
+
+# Triggers del contador instalados al terminar db.create_all()
+notification_inbox.register(db.metadata)
+
+
+def _mark_notification_changed(mapper, connection, target):
+    """Anotar el destinatario de una notificación creada/modificada; se publica al confirmar"""
+    mark_notifications_changed(object_session(target), [target.user_id])
+
+
+for _notification_event in ('after_insert', 'after_update', 'after_delete'):
+    sa_event.listen(Notification, _notification_event, _mark_notification_changed)
+
+
+@sa_event.listens_for(db.session, 'after_commit')
+def _publish_notification_changes(session):
+    user_ids = session.info.pop('notification_changed_users', None)
+    if user_ids:
+        notification_broker.publish(user_ids)
+
+
+@sa_event.listens_for(db.session, 'after_rollback')
+def _discard_notification_changes(session):
+    session.info.pop('notification_changed_users', None)
+
+
 class EmailLog(db.Model):
     """Registro completo de todos los emails enviados por el sistema"""
     id = db.Column(db.Integer, primary_key=True)
@@ -509,6 +829,11 @@ class EmailLog(db.Model):
     
     # Relaciones
     recipient = db.relationship('User', backref='email_logs', foreign_keys=[recipient_id])
+
+    __table_args__ = (
+        db.Index('ix_email_log_created_at', 'created_at'),
+        db.Index('ix_email_log_status_type_created', 'status', 'email_type', 'created_at'),
+    )
     
     def to_dict(self):
         """Convertir a diccionario para JSON"""
@@ -526,6 +851,51 @@ class EmailLog(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+# Índice de texto completo (FTS5 / tsvector) creado junto con la tabla
+email_search.register(EmailLog.__table__)
+
+
+class EmailDailyStat(db.Model):
+    """Resumen diario por tipo de EmailLog, mantenido por triggers (ver email_stats.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    email_type = db.Column(db.String(50), nullable=False)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    sent = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    pending = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'email_type', name='uq_email_daily_stat'),
+    )
+
+# Triggers del resumen instalados al terminar db.create_all()
+email_stats.register(db.metadata)
+
+
+class EmailOutbox(db.Model):
+    """Cola persistente de emails salientes, vaciada en segundo plano por EmailQueue"""
+    id = db.Column(db.Integer, primary_key=True)
+    email_log_id = db.Column(db.Integer, db.ForeignKey('email_log.id'), nullable=True)  # Registro que refleja el resultado real
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'), nullable=True)  # Se marca email_sent al entregar
+    recipient_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(500), nullable=False)
+    html_content = db.Column(db.Text)  # Contenido completo (EmailLog guarda solo un extracto)
+    text_content = db.Column(db.Text)
+    sender = db.Column(db.String(120))
+    status = db.Column(db.String(20), default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)  # Momento en que un worker reclamó el envío
+    locked_by = db.Column(db.String(64))  # Identificador del worker que reclamó el lote
+    last_error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    email_log = db.relationship('EmailLog', backref='outbox_entries')
+    notification = db.relationship('Notification', backref='outbox_entries')
+
 
 class EventRegistration(db.Model):
     """Registro completo de eventos con flujo de email y almacenamiento"""
@@ -566,6 +936,8 @@ class EventRegistration(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('event_id', 'user_id', name='uq_event_registration'),
+        db.Index('ix_event_registration_event_status', 'event_id', 'registration_status'),
+        db.Index('ix_event_registration_user_event', 'user_id', 'event_id'),
     )
 
 
@@ -723,11 +1095,46 @@ class AppointmentSlot(db.Model):
     __table_args__ = (
         db.CheckConstraint('capacity >= 1', name='ck_slot_capacity_positive'),
         db.CheckConstraint('end_datetime > start_datetime', name='ck_slot_time_window'),
+        db.Index('ix_appointment_slot_type_available_start', 'appointment_type_id', 'is_available', 'start_datetime'),
     )
 
     def remaining_seats(self):
         return max(0, (self.capacity or 1) - (self.reserved_seats or 0))
 
+    def reserve_seat(self):
+        """
+        Reserva atómica de un cupo con un único UPDATE condicional
+        (reserved_seats < capacity) que además marca el slot como no disponible
+        cuando se ocupa el último cupo, en la misma sentencia.
+
+        Returns:
+            bool: True si se reservó el cupo, False si el slot ya no está disponible
+        """
+        reserved = db.func.coalesce(AppointmentSlot.reserved_seats, 0)
+        capacity = db.func.coalesce(AppointmentSlot.capacity, 1)
+        updated = AppointmentSlot.query.filter(
+            AppointmentSlot.id == self.id,
+            AppointmentSlot.is_available == True,  # noqa
+            reserved < capacity
+        ).update({
+            AppointmentSlot.reserved_seats: reserved + 1,
+            AppointmentSlot.is_available: reserved + 1 < capacity,
+        }, synchronize_session=False)
+        db.session.expire(self, ['reserved_seats', 'is_available'])
+        return updated == 1
+
+    def release_seat(self):
+        """Libera un cupo de forma atómica y vuelve a habilitar el slot"""
+        updated = AppointmentSlot.query.filter(
+            AppointmentSlot.id == self.id,
+            AppointmentSlot.reserved_seats > 0
+        ).update({
+            AppointmentSlot.reserved_seats: AppointmentSlot.reserved_seats - 1,
+            AppointmentSlot.is_available: True,
+        }, synchronize_session=False)
+        db.session.expire(self, ['reserved_seats', 'is_available'])
+        return updated == 1
+
 
 class Appointment(db.Model):
     """Reservas realizadas por miembros - Modelo inspirado en Odoo."""
@@ -777,6 +1184,35 @@ class Appointment(db.Model):
     user = db.relationship('User', backref='appointments')
     participants = db.relationship('AppointmentParticipant', backref='appointment', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_appointment_status_start', 'status', 'start_datetime'),
+        db.Index('ix_appointment_user_start', 'user_id', 'start_datetime'),
+    )
+
+    def cancel(self, reason, cancelled_by):
+        """
+        Cancela la cita con un UPDATE condicional y libera su cupo en el slot.
+        Si otra petición ya la canceló no hace nada, para no liberar el cupo dos veces.
+
+        Returns:
+            bool: True si esta llamada canceló la cita
+        """
+        updated = Appointment.query.filter(
+            Appointment.id == self.id,
+            Appointment.status != 'cancelled'
+        ).update({
+            Appointment.status: 'cancelled',
+            Appointment.cancellation_reason: reason,
+            Appointment.cancelled_by: cancelled_by,
+            Appointment.cancelled_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        db.session.expire(self, ['status', 'cancellation_reason', 'cancelled_by', 'cancelled_at'])
+        if updated != 1:
+            return False
+        if self.slot:
+            self.slot.release_seat()
+        return True
+
     def can_user_cancel(self):
         """Permite cancelar si faltan al menos 12 horas."""
         return self.start_datetime - datetime.utcnow() > timedelta(hours=12)
@@ -810,6 +1246,21 @@ class AppointmentParticipant(db.Model):
     invited_by = db.relationship('User', foreign_keys=[invited_by_id], backref='appointment_invitations', lazy=True)
 
 
+class AppointmentReminder(db.Model):
+    """Registro de recordatorios enviados: uno por cita y anticipación (horas)."""
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id'), nullable=False)
+    offset_hours = db.Column(db.Integer, nullable=False)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'))
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    appointment = db.relationship('Appointment', backref=db.backref('reminders', lazy=True, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'offset_hours', name='uq_appointment_reminder_offset'),
+    )
+
+
 class ActivityLog(db.Model):
     """Log de actividades administrativas"""
     id = db.Column(db.Integer, primary_key=True)
@@ -845,6 +1296,11 @@ def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.template_filter('local_datetime')
+def local_datetime_filter(value):
+    """Fecha UTC guardada (slots, citas) -> hora local de la organización para mostrar"""
+    return to_local(value, resolve_timezone())
+
 # Configuración del login manager
 @login_manager.user_loader
 def load_user(user_id):
@@ -924,10 +1380,9 @@ def logout():
 @login_required
 def dashboard():
     """Panel de control del usuario"""
-    from app import Appointment, EventRegistration, Event
+    from member_dashboard import load_dashboard
     
     active_membership = current_user.get_active_membership()
-    benefits = Benefit.query.filter_by(is_active=True).all()
     
     # Calcular días desde inicio y días restantes
     days_active = None
@@ -940,34 +1395,10 @@ def dashboard():
         if active_membership.end_date:
             days_remaining = (active_membership.end_date - now).days
     
-    # Estadísticas del usuario
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.user_id == current_user.id,
-        Appointment.start_datetime >= now,
-        Appointment.status.in_(['pending', 'confirmed'])
-    ).order_by(Appointment.start_datetime.asc()).limit(5).all()
-    
-    past_appointments_count = Appointment.query.filter(
-        Appointment.user_id == current_user.id,
-        Appointment.start_datetime < now
-    ).count()
-    
-    upcoming_events = EventRegistration.query.join(Event).filter(
-        EventRegistration.user_id == current_user.id,
-        EventRegistration.registration_status == 'confirmed',
-        Event.start_date >= now
-    ).order_by(Event.start_date.asc()).limit(5).all()
-    
-    registered_events_count = EventRegistration.query.filter(
-        EventRegistration.user_id == current_user.id,
-        EventRegistration.registration_status == 'confirmed'
-    ).count()
-    
-    # Obtener todos los eventos públicos para el calendario
-    all_public_events = Event.query.filter(
-        Event.publish_status == 'published',
-        Event.start_date.isnot(None)
-    ).order_by(Event.start_date.asc()).all()
+    # Estadísticas y próximas citas/eventos del usuario (tres consultas)
+    dashboard_data = load_dashboard(current_user, now)
+    
+    # El calendario carga sus eventos por mes desde /api/events/calendar
     
     # Detectar si es un usuario nuevo (creado en las últimas 24 horas)
     is_new_user = False
@@ -981,17 +1412,12 @@ def dashboard():
     
     return render_template('dashboard.html', 
                          membership=active_membership, 
-                         benefits=benefits,
                          days_active=days_active,
                          days_remaining=days_remaining,
                          now=now,
-                         upcoming_appointments=upcoming_appointments,
-                         past_appointments_count=past_appointments_count,
-                         upcoming_events=upcoming_events,
-                         registered_events_count=registered_events_count,
-                         all_public_events=all_public_events,
                          show_onboarding=show_onboarding,
-                         is_new_user=is_new_user)
+                         is_new_user=is_new_user,
+                         **dashboard_data)
 
 @app.route('/api/onboarding/seen', methods=['POST'])
 @login_required
@@ -1017,7 +1443,7 @@ def subscription_form():
 @login_required
 def benefits():
     """Página de beneficios"""
-    active_membership = current_user.get_active_membership()
+    active_membership = current_user.get_membership_tier()
     if not active_membership:
         flash('Necesitas una membresía activa para acceder a los beneficios.', 'warning')
         return redirect(url_for('membership'))
@@ -1078,21 +1504,25 @@ def settings():
 @app.route('/notifications')
 @login_required
 def notifications():
-    """Módulo de Notificaciones"""
-    # Obtener notificaciones del usuario
-    user_notifications = Notification.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Notification.created_at.desc()).all()
+    """Módulo de Notificaciones (paginado por cursor)"""
+    notification_type = request.args.get('type', 'all')
+    status = request.args.get('status', 'all')
+    cursor_param = request.args.get('cursor', '')
+    cursor = notification_inbox.decode_cursor(cursor_param) if cursor_param else None
+    if cursor_param and cursor is None:
+        flash('El cursor de paginación no es válido, se muestra la primera página.', 'warning')
     
-    # Contar no leídas
-    unread_count = Notification.query.filter_by(
-        user_id=current_user.id,
-        is_read=False
-    ).count()
+    user_notifications, next_cursor = notification_inbox.fetch_page(
+        current_user.id, notification_type, status, limit=50, cursor=cursor
+    )
     
     return render_template('notifications.html', 
                          notifications=user_notifications,
-                         unread_count=unread_count)
+                         unread_count=notification_inbox.unread_count(current_user.id),
+                         next_cursor=next_cursor,
+                         is_first_page=cursor is None,
+                         current_type=notification_type,
+                         current_status=status)
 
 @app.route('/help')
 @login_required
@@ -1149,6 +1579,7 @@ def create_payment_intent():
                 status='succeeded'  # Simular pago exitoso
             )
             db.session.add(payment)
+            record_payment(payment)
             db.session.commit()
             
             # Crear suscripción automáticamente
@@ -1161,7 +1592,9 @@ def create_payment_intent():
                 end_date=end_date
             )
             db.session.add(subscription)
+            record_subscription(subscription)
             db.session.commit()
+            invalidate_membership_cache(current_user.id)
             
             return jsonify({
                 'client_secret': 'demo_client_secret',
@@ -1250,11 +1683,19 @@ def handle_successful_payment(payment_intent):
         ).first()
         
         if payment:
-            # Actualizar estado del pago
-            payment.status = 'succeeded'
-            db.session.commit()
+            # Marcar el pago con un UPDATE condicional: los reintentos del webhook (o dos
+            # entregas simultáneas) no vuelven a sumar ingresos ni crear otra suscripción
+            updated = Payment.query.filter(
+                Payment.id == payment.id,
+                Payment.status != 'succeeded'
+            ).update({Payment.status: 'succeeded'}, synchronize_session=False)
+            db.session.expire(payment, ['status'])
+            if not updated:
+                db.session.rollback()
+                return
+            record_payment(payment)
             
-            # Crear suscripción
+            # Crear suscripción en la misma transacción que el cambio de estado
             end_date = datetime.utcnow() + timedelta(days=365)  # 1 año
             subscription = Subscription(
                 user_id=payment.user_id,
@@ -1264,12 +1705,15 @@ def handle_successful_payment(payment_intent):
                 end_date=end_date
             )
             db.session.add(subscription)
+            record_subscription(subscription)
             db.session.commit()
+            invalidate_membership_cache(payment.user_id)
             
             # Enviar notificación y email de confirmación
             NotificationEngine.notify_membership_payment(payment.user, payment, subscription)
             
     except Exception as e:
+        db.session.rollback()
         print(f"Error handling payment: {e}")
 
 class NotificationEngine:
@@ -1326,41 +1770,19 @@ class NotificationEngine:
                         <p>Puedes gestionar los registros desde el panel de administración.</p>
                         <p>Saludos,<br>Equipo RelaticPanama</p>
                         """
-                    msg = Message(
+                    email_queue.enqueue(
                         subject=f'[RelaticPanama] Nuevo registro: {event.title}',
                         recipients=[recipient.email],
-                        html=html_content
-                    )
-                    mail.send(msg)
-                    notification.email_sent = True
-                    notification.email_sent_at = datetime.utcnow()
-                    # Registrar en EmailLog
-                    log_email_sent(
-                        recipient_email=recipient.email,
-                        subject=f'[RelaticPanama] Nuevo registro: {event.title}',
                         html_content=html_content,
                         email_type='event_registration_notification',
                         related_entity_type='event',
                         related_entity_id=event.id,
                         recipient_id=recipient.id,
                         recipient_name=f"{recipient.first_name} {recipient.last_name}",
-                        status='sent'
+                        notification=notification
                     )
                 except Exception as e:
-                    print(f"Error enviando email de notificación a {recipient.email}: {e}")
-                    # Registrar fallo en EmailLog
-                    log_email_sent(
-                        recipient_email=recipient.email,
-                        subject=f'[RelaticPanama] Nuevo registro: {event.title}',
-                        html_content='',
-                        email_type='event_registration_notification',
-                        related_entity_type='event',
-                        related_entity_id=event.id,
-                        recipient_id=recipient.id,
-                        recipient_name=f"{recipient.first_name} {recipient.last_name}",
-                        status='failed',
-                        error_message=str(e)
-                    )
+                    print(f"Error encolando email de notificación a {recipient.email}: {e}")
             
             db.session.commit()
             
@@ -1410,40 +1832,19 @@ class NotificationEngine:
                         </ul>
                         <p>Saludos,<br>Equipo RelaticPanama</p>
                         """
-                    msg = Message(
+                    email_queue.enqueue(
                         subject=f'[RelaticPanama] Cancelación de registro: {event.title}',
                         recipients=[recipient.email],
-                        html=html_content
-                    )
-                    mail.send(msg)
-                    notification.email_sent = True
-                    notification.email_sent_at = datetime.utcnow()
-                    # Registrar en EmailLog
-                    log_email_sent(
-                        recipient_email=recipient.email,
-                        subject=f'[RelaticPanama] Cancelación de registro: {event.title}',
                         html_content=html_content,
                         email_type='event_cancellation_notification',
                         related_entity_type='event',
                         related_entity_id=event.id,
                         recipient_id=recipient.id,
                         recipient_name=f"{recipient.first_name} {recipient.last_name}",
-                        status='sent'
+                        notification=notification
                     )
                 except Exception as e:
-                    print(f"Error enviando email de cancelación a {recipient.email}: {e}")
-                    log_email_sent(
-                        recipient_email=recipient.email,
-                        subject=f'[RelaticPanama] Cancelación de registro: {event.title}',
-                        html_content='',
-                        email_type='event_cancellation_notification',
-                        related_entity_type='event',
-                        related_entity_id=event.id,
-                        recipient_id=recipient.id,
-                        recipient_name=f"{recipient.first_name} {recipient.last_name}",
-                        status='failed',
-                        error_message=str(e)
-                    )
+                    print(f"Error encolando email de cancelación a {recipient.email}: {e}")
             
             db.session.commit()
             
@@ -1493,40 +1894,19 @@ class NotificationEngine:
                         </ul>
                         <p>Saludos,<br>Equipo RelaticPanama</p>
                         """
-                    msg = Message(
+                    email_queue.enqueue(
                         subject=f'[RelaticPanama] Registro confirmado: {event.title}',
                         recipients=[recipient.email],
-                        html=html_content
-                    )
-                    mail.send(msg)
-                    notification.email_sent = True
-                    notification.email_sent_at = datetime.utcnow()
-                    # Registrar en EmailLog
-                    log_email_sent(
-                        recipient_email=recipient.email,
-                        subject=f'[RelaticPanama] Registro confirmado: {event.title}',
                         html_content=html_content,
                         email_type='event_confirmation_notification',
                         related_entity_type='event',
                         related_entity_id=event.id,
                         recipient_id=recipient.id,
                         recipient_name=f"{recipient.first_name} {recipient.last_name}",
-                        status='sent'
+                        notification=notification
                     )
                 except Exception as e:
-                    print(f"Error enviando email de confirmación a {recipient.email}: {e}")
-                    log_email_sent(
-                        recipient_email=recipient.email,
-                        subject=f'[RelaticPanama] Registro confirmado: {event.title}',
-                        html_content='',
-                        email_type='event_confirmation_notification',
-                        related_entity_type='event',
-                        related_entity_id=event.id,
-                        recipient_id=recipient.id,
-                        recipient_name=f"{recipient.first_name} {recipient.last_name}",
-                        status='failed',
-                        error_message=str(e)
-                    )
+                    print(f"Error encolando email de confirmación a {recipient.email}: {e}")
             
             db.session.commit()
             
@@ -1536,8 +1916,9 @@ class NotificationEngine:
     
     @staticmethod
     def notify_event_update(event, changes=None):
-        """Notificar cambios en un evento a todos los registrados"""
+        """Notificar cambios en un evento a todos los registrados (fan-out con inserciones masivas)"""
         try:
+            start_time = time.time()
             event_creator = User.query.get(event.created_by) if event.created_by else None
             
             if not event_creator:
@@ -1553,69 +1934,60 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            # Notificar a todos los registrados
-            registrations = EventRegistration.query.filter_by(
-                event_id=event.id,
-                registration_status='confirmed'
+            # Todos los registrados confirmados en una sola consulta
+            recipients = db.session.query(
+                User.id, User.email, User.first_name, User.last_name
+            ).join(
+                EventRegistration, EventRegistration.user_id == User.id
+            ).filter(
+                EventRegistration.event_id == event.id,
+                EventRegistration.registration_status == 'confirmed'
             ).all()
             
-            for reg in registrations:
-                user = User.query.get(reg.user_id)
-                if user:
-                    user_notification = Notification(
-                        user_id=user.id,
-                        event_id=event.id,
-                        notification_type='event_update',
-                        title=f'Actualización del evento: {event.title}',
-                        message=f'El evento "{event.title}" al que estás registrado ha sido actualizado. Revisa los detalles en la plataforma.'
-                    )
-                    db.session.add(user_notification)
-                    
-                    try:
-                        html_content = f"""
-                            <h2>Evento Actualizado</h2>
-                            <p>Hola {user.first_name},</p>
-                            <p>El evento "{event.title}" al que estás registrado ha sido actualizado.</p>
-                            <p>Te recomendamos revisar los detalles del evento en la plataforma.</p>
-                            <p>Saludos,<br>Equipo RelaticPanama</p>
-                            """
-                        msg = Message(
-                            subject=f'[RelaticPanama] Actualización: {event.title}',
-                            recipients=[user.email],
-                            html=html_content
-                        )
-                        mail.send(msg)
-                        user_notification.email_sent = True
-                        user_notification.email_sent_at = datetime.utcnow()
-                        # Registrar en EmailLog
-                        log_email_sent(
-                            recipient_email=user.email,
-                            subject=f'[RelaticPanama] Actualización: {event.title}',
-                            html_content=html_content,
-                            email_type='event_update',
-                            related_entity_type='event',
-                            related_entity_id=event.id,
-                            recipient_id=user.id,
-                            recipient_name=f"{user.first_name} {user.last_name}",
-                            status='sent'
-                        )
-                    except Exception as e:
-                        print(f"Error enviando email de actualización a {user.email}: {e}")
-                        log_email_sent(
-                            recipient_email=user.email,
-                            subject=f'[RelaticPanama] Actualización: {event.title}',
-                            html_content='',
-                            email_type='event_update',
-                            related_entity_type='event',
-                            related_entity_id=event.id,
-                            recipient_id=user.id,
-                            recipient_name=f"{user.first_name} {user.last_name}",
-                            status='failed',
-                            error_message=str(e)
-                        )
+            now = datetime.utcnow()
+            notification_rows = [{
+                'user_id': recipient.id,
+                'event_id': event.id,
+                'notification_type': 'event_update',
+                'title': f'Actualización del evento: {event.title}',
+                'message': f'El evento "{event.title}" al que estás registrado ha sido actualizado. Revisa los detalles en la plataforma.',
+                'is_read': False,
+                'email_sent': False,
+                'created_at': now
+            } for recipient in recipients]
+            if notification_rows:
+                db.session.bulk_insert_mappings(Notification, notification_rows, return_defaults=True)
+                mark_notifications_changed(db.session, [row['user_id'] for row in notification_rows])
+            
+            emails = []
+            for recipient, notification_row in zip(recipients, notification_rows):
+                html_content = f"""
+                    <h2>Evento Actualizado</h2>
+                    <p>Hola {recipient.first_name},</p>
+                    <p>El evento "{event.title}" al que estás registrado ha sido actualizado.</p>
+                    <p>Te recomendamos revisar los detalles del evento en la plataforma.</p>
+                    <p>Saludos,<br>Equipo RelaticPanama</p>
+                    """
+                emails.append({
+                    'subject': f'[RelaticPanama] Actualización: {event.title}',
+                    'recipient_email': recipient.email,
+                    'html_content': html_content,
+                    'email_type': 'event_update',
+                    'related_entity_type': 'event',
+                    'related_entity_id': event.id,
+                    'recipient_id': recipient.id,
+                    'recipient_name': f"{recipient.first_name} {recipient.last_name}",
+                    'notification_id': notification_row['id']
+                })
+            queued = email_queue.enqueue_many(emails)
             
             db.session.commit()
             
+            elapsed = time.time() - start_time
+            rate = queued / elapsed if elapsed > 0 else float(queued)
+            print(f"✅ Actualización del evento {event.id}: {queued} emails encolados en {elapsed:.2f}s ({rate:.0f} emails/s)")
+            return {'recipients': len(recipients), 'queued': queued, 'elapsed': elapsed, 'emails_per_second': rate}
+            
         except Exception as e:
             print(f"Error en notify_event_update: {e}")
             db.session.rollback()
@@ -1634,9 +2006,9 @@ class NotificationEngine:
             db.session.add(notification)
             
             # Enviar email
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_membership_payment_confirmation_email(user, payment, subscription)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject='Confirmación de Pago - RelaticPanama',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1644,15 +2016,12 @@ class NotificationEngine:
                     related_entity_type='payment',
                     related_entity_id=payment.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             else:
                 # Fallback al método anterior
-                send_payment_confirmation_email(user, payment, subscription)
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
+                send_payment_confirmation_email(user, payment, subscription, notification=notification)
             
             db.session.commit()
         except Exception as e:
@@ -1671,9 +2040,9 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_membership_expiring_email(user, subscription, days_left)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject=f'Tu Membresía Expirará en {days_left} Días - RelaticPanama',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1681,10 +2050,9 @@ class NotificationEngine:
                     related_entity_type='subscription',
                     related_entity_id=subscription.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
@@ -1703,9 +2071,9 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_membership_expired_email(user, subscription)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject='Tu Membresía Ha Expirado - RelaticPanama',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1713,16 +2081,91 @@ class NotificationEngine:
                     related_entity_type='subscription',
                     related_entity_id=subscription.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
             print(f"Error en notify_membership_expired: {e}")
             db.session.rollback()
     
+    @staticmethod
+    def _bulk_membership_notify(items, notification_type):
+        """
+        Crear notificaciones y encolar correos de membresía en lote (sin commit)
+
+        Args:
+            items: Lista de dicts con user, subscription, title, message, subject y html_content
+                (html_content es None si no hay plantillas de email)
+            notification_type: Tipo de notificación y de email
+
+        Returns:
+            int: Número de notificaciones creadas
+        """
+        now = datetime.utcnow()
+        notification_rows = [{
+            'user_id': item['user'].id,
+            'notification_type': notification_type,
+            'title': item['title'],
+            'message': item['message'],
+            'is_read': False,
+            'email_sent': False,
+            'created_at': now
+        } for item in items]
+        if not notification_rows:
+            return 0
+        db.session.bulk_insert_mappings(Notification, notification_rows, return_defaults=True)
+        mark_notifications_changed(db.session, [row['user_id'] for row in notification_rows])
+
+        if EMAIL_TEMPLATES_AVAILABLE:
+            email_queue.enqueue_many([{
+                'subject': item['subject'],
+                'recipient_email': item['user'].email,
+                'html_content': item['html_content'],
+                'email_type': notification_type,
+                'related_entity_type': 'subscription',
+                'related_entity_id': item['subscription'].id,
+                'recipient_id': item['user'].id,
+                'recipient_name': f"{item['user'].first_name} {item['user'].last_name}",
+                'notification_id': notification_row['id']
+            } for item, notification_row in zip(items, notification_rows)])
+        return len(notification_rows)
+
+    @staticmethod
+    def notify_memberships_expiring_bulk(entries):
+        """
+        Versión masiva de notify_membership_expiring para el escaneo nocturno (sin commit)
+
+        Args:
+            entries: Lista de tuplas (user, subscription, days_left)
+        """
+        return NotificationEngine._bulk_membership_notify([{
+            'user': user,
+            'subscription': subscription,
+            'title': f'Membresía Expirará en {days_left} Días',
+            'message': f'Tu membresía {subscription.membership_type.title()} expirará el {subscription.end_date.strftime("%d/%m/%Y")}. Renueva ahora para continuar disfrutando de todos los beneficios.',
+            'subject': f'Tu Membresía Expirará en {days_left} Días - RelaticPanama',
+            'html_content': get_membership_expiring_email(user, subscription, days_left) if EMAIL_TEMPLATES_AVAILABLE else None
+        } for user, subscription, days_left in entries], 'membership_expiring')
+
+    @staticmethod
+    def notify_memberships_expired_bulk(entries):
+        """
+        Versión masiva de notify_membership_expired para el escaneo nocturno (sin commit)
+
+        Args:
+            entries: Lista de tuplas (user, subscription)
+        """
+        return NotificationEngine._bulk_membership_notify([{
+            'user': user,
+            'subscription': subscription,
+            'title': 'Membresía Expirada',
+            'message': f'Tu membresía {subscription.membership_type.title()} ha expirado. Renueva ahora para reactivar tus beneficios.',
+            'subject': 'Tu Membresía Ha Expirado - RelaticPanama',
+            'html_content': get_membership_expired_email(user, subscription) if EMAIL_TEMPLATES_AVAILABLE else None
+        } for user, subscription in entries], 'membership_expired')
+
     @staticmethod
     def notify_membership_renewed(user, subscription):
         """Notificar renovación de membresía"""
@@ -1735,9 +2178,9 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_membership_renewed_email(user, subscription)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject='Membresía Renovada - RelaticPanama',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1745,10 +2188,9 @@ class NotificationEngine:
                     related_entity_type='subscription',
                     related_entity_id=subscription.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
@@ -1767,9 +2209,9 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_appointment_confirmation_email(appointment, user, advisor)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject='Cita Confirmada - RelaticPanama',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1777,16 +2219,22 @@ class NotificationEngine:
                     related_entity_type='appointment',
                     related_entity_id=appointment.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
             print(f"Error en notify_appointment_confirmation: {e}")
             db.session.rollback()
     
+    @staticmethod
+    def _appointment_reminder_message(appointment, advisor):
+        """Texto del recordatorio con la hora de la cita en hora local"""
+        start = to_local(appointment.start_datetime, resolve_timezone())
+        return (f'Recuerda que tienes una cita con {advisor.first_name} {advisor.last_name} '
+                f'el {start.strftime("%d/%m/%Y")} a las {start.strftime("%H:%M")}.')
+
     @staticmethod
     def notify_appointment_reminder(appointment, user, advisor, hours_before=24):
         """Notificar recordatorio de cita"""
@@ -1795,13 +2243,13 @@ class NotificationEngine:
                 user_id=user.id,
                 notification_type='appointment_reminder',
                 title=f'Recordatorio: Cita en {hours_before} horas',
-                message=f'Recuerda que tienes una cita con {advisor.first_name} {advisor.last_name} el {appointment.appointment_date.strftime("%d/%m/%Y")} a las {appointment.appointment_time}.'
+                message=NotificationEngine._appointment_reminder_message(appointment, advisor)
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_appointment_reminder_email(appointment, user, advisor, hours_before)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject=f'Recordatorio: Cita en {hours_before} horas - RelaticPanama',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1809,16 +2257,55 @@ class NotificationEngine:
                     related_entity_type='appointment',
                     related_entity_id=appointment.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
             print(f"Error en notify_appointment_reminder: {e}")
             db.session.rollback()
     
+    @staticmethod
+    def notify_appointment_reminders_bulk(entries):
+        """
+        Versión masiva de notify_appointment_reminder (sin commit)
+
+        Args:
+            entries: Lista de tuplas (appointment, user, advisor_user, hours_before)
+
+        Returns:
+            list: IDs de las notificaciones creadas, en el mismo orden que entries
+        """
+        if not entries:
+            return []
+        now = datetime.utcnow()
+        notification_rows = [{
+            'user_id': user.id,
+            'notification_type': 'appointment_reminder',
+            'title': f'Recordatorio: Cita en {hours_before} horas',
+            'message': NotificationEngine._appointment_reminder_message(appointment, advisor),
+            'is_read': False,
+            'email_sent': False,
+            'created_at': now
+        } for appointment, user, advisor, hours_before in entries]
+        db.session.bulk_insert_mappings(Notification, notification_rows, return_defaults=True)
+        mark_notifications_changed(db.session, [row['user_id'] for row in notification_rows])
+
+        if EMAIL_TEMPLATES_AVAILABLE:
+            email_queue.enqueue_many([{
+                'subject': f'Recordatorio: Cita en {hours_before} horas - RelaticPanama',
+                'recipient_email': user.email,
+                'html_content': get_appointment_reminder_email(appointment, user, advisor, hours_before),
+                'email_type': 'appointment_reminder',
+                'related_entity_type': 'appointment',
+                'related_entity_id': appointment.id,
+                'recipient_id': user.id,
+                'recipient_name': f"{user.first_name} {user.last_name}",
+                'notification_id': notification_row['id']
+            } for (appointment, user, advisor, hours_before), notification_row in zip(entries, notification_rows)])
+        return [notification_row['id'] for notification_row in notification_rows]
+
     @staticmethod
     def notify_welcome(user):
         """Notificar bienvenida a nuevo usuario"""
@@ -1831,9 +2318,9 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_welcome_email(user)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject='Bienvenido a RelaticPanama',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1841,10 +2328,9 @@ class NotificationEngine:
                     related_entity_type='user',
                     related_entity_id=user.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
@@ -1864,9 +2350,9 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_event_registration_email(event, user, registration)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject=f'Registro Confirmado: {event.title}',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1874,10 +2360,9 @@ class NotificationEngine:
                     related_entity_type='event',
                     related_entity_id=event.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
@@ -1897,9 +2382,9 @@ class NotificationEngine:
             )
             db.session.add(notification)
             
-            if EMAIL_TEMPLATES_AVAILABLE and email_service:
+            if EMAIL_TEMPLATES_AVAILABLE:
                 html_content = get_event_cancellation_email(event, user)
-                email_service.send_email(
+                email_queue.enqueue(
                     subject=f'Cancelación de Registro: {event.title}',
                     recipients=[user.email],
                     html_content=html_content,
@@ -1907,10 +2392,9 @@ class NotificationEngine:
                     related_entity_type='event',
                     related_entity_id=event.id,
                     recipient_id=user.id,
-                    recipient_name=f"{user.first_name} {user.last_name}"
+                    recipient_name=f"{user.first_name} {user.last_name}",
+                    notification=notification
                 )
-                notification.email_sent = True
-                notification.email_sent_at = datetime.utcnow()
             
             db.session.commit()
         except Exception as e:
@@ -1943,8 +2427,8 @@ def log_email_sent(recipient_email, subject, html_content, text_content=None,
         print(f"Error registrando email en log: {e}")
         db.session.rollback()
 
-def send_payment_confirmation_email(user, payment, subscription):
-    """Enviar email de confirmación de pago"""
+def send_payment_confirmation_email(user, payment, subscription, notification=None):
+    """Encolar email de confirmación de pago"""
     try:
         html_content = f"""
             <h2>¡Pago Confirmado!</h2>
@@ -1960,39 +2444,19 @@ def send_payment_confirmation_email(user, payment, subscription):
             <p>Ya puedes acceder a todos los beneficios de tu membresía.</p>
             <p>¡Gracias por ser parte de RelaticPanama!</p>
             """
-        msg = Message(
+        email_queue.enqueue(
             subject='Confirmación de Pago - RelaticPanama',
             recipients=[user.email],
-            html=html_content
-        )
-        mail.send(msg)
-        # Registrar en EmailLog
-        log_email_sent(
-            recipient_email=user.email,
-            subject='Confirmación de Pago - RelaticPanama',
             html_content=html_content,
             email_type='membership_payment',
             related_entity_type='payment',
             related_entity_id=payment.id,
             recipient_id=user.id,
             recipient_name=f"{user.first_name} {user.last_name}",
-            status='sent'
+            notification=notification
         )
     except Exception as e:
-        print(f"Error sending email: {e}")
-        # Registrar fallo en EmailLog
-        log_email_sent(
-            recipient_email=user.email,
-            subject='Confirmación de Pago - RelaticPanama',
-            html_content='',
-            email_type='membership_payment',
-            related_entity_type='payment',
-            related_entity_id=payment.id,
-            recipient_id=user.id,
-            recipient_name=f"{user.first_name} {user.last_name}",
-            status='failed',
-            error_message=str(e)
-        )
+        print(f"Error encolando email: {e}")
 
 @app.route('/api/user/membership')
 @login_required
@@ -2026,33 +2490,101 @@ def admin_required(f):
 @admin_required
 def admin_dashboard():
     """Panel de administración principal"""
-    total_users = User.query.count()
-    total_memberships = Membership.query.count()
-    active_memberships = Membership.query.filter_by(is_active=True).count()
-    total_payments = Payment.query.filter_by(status='succeeded').count()
-    total_revenue = sum([p.amount for p in Payment.query.filter_by(status='succeeded').all()]) / 100
-    
-    # Usuarios recientes
-    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    
-    # Membresías recientes
-    recent_memberships = Membership.query.order_by(Membership.created_at.desc()).limit(5).all()
-    
-    return render_template('admin/dashboard.html',
-                         total_users=total_users,
-                         total_memberships=total_memberships,
-                         active_memberships=active_memberships,
-                         total_payments=total_payments,
-                         total_revenue=total_revenue,
-                         recent_users=recent_users,
-                         recent_memberships=recent_memberships)
+    return render_template('admin/dashboard.html', **admin_stats.snapshot())
+
+
+@app.route('/admin/api/membership-stats')
+@admin_required
+def admin_membership_stats_api():
+    """Series de ingresos, altas, renovaciones y bajas leídas de las tablas de acumulados"""
+    period = 'monthly' if request.args.get('period') == 'monthly' else 'daily'
+    days = request.args.get('days', type=int) or (365 if period == 'monthly' else 90)
+    start = (datetime.utcnow() - timedelta(days=days)).date()
+    return jsonify({
+        'period': period,
+        'series': membership_series(period, start=start, membership_type=request.args.get('membership_type'))
+    })
 
 @app.route('/admin/users')
 @admin_required
 def admin_users():
-    """Gestión de usuarios"""
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('admin/users.html', users=users)
+    """Gestión de usuarios (paginada en el servidor, con búsqueda y filtros)"""
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 200)
+    search = request.args.get('search', '').strip()
+    role = request.args.get('role', 'all')
+    status = request.args.get('status', 'all')
+
+    query = User.query
+    if role == 'admin':
+        query = query.filter(User.is_admin == True)  # noqa
+    elif role == 'advisor':
+        query = query.filter(User.is_advisor == True)  # noqa
+    if status == 'active':
+        query = query.filter(User.is_active == True)  # noqa
+    elif status == 'inactive':
+        query = query.filter(User.is_active == False)  # noqa
+
+    # Cada palabra debe ser prefijo del email, nombre o apellido (sin distinguir mayúsculas)
+    for term in search.lower().split():
+        query = query.filter(db.or_(
+            _search_prefix(User.email, term),
+            _search_prefix(User.first_name, term),
+            _search_prefix(User.last_name, term)
+        ))
+
+    pagination = query.order_by(User.created_at.desc(), User.id.desc()).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    users = pagination.items
+
+    # Membresía activa de todos los usuarios de la página en una sola consulta
+    active_memberships = {}
+    if users:
+        subscriptions = Subscription.query.filter(
+            Subscription.user_id.in_([user.id for user in users]),
+            Subscription.status == 'active',
+            Subscription.end_date > datetime.utcnow()
+        ).order_by(Subscription.end_date.asc()).all()
+        for subscription in subscriptions:
+            active_memberships[subscription.user_id] = subscription.membership_type
+
+        # Igual que get_active_membership(): membresías del sistema anterior como respaldo
+        legacy_user_ids = [user.id for user in users if user.id not in active_memberships]
+        if legacy_user_ids:
+            legacy = Membership.query.filter(
+                Membership.user_id.in_(legacy_user_ids),
+                Membership.is_active == True  # noqa
+            ).order_by(Membership.id.asc()).all()
+            for membership in legacy:
+                active_memberships.setdefault(membership.user_id, membership.membership_type)
+
+    return render_template('admin/users.html',
+                         users=users,
+                         pagination=pagination,
+                         active_memberships=active_memberships,
+                         search=search,
+                         current_role=role,
+                         current_status=status)
+
+
+def _prefix_match(expression, prefix):
+    """expression LIKE 'prefix%' escrito como rango, para que use un índice B-tree"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return db.and_(expression >= prefix, expression < upper)
+
+
+def _search_prefix(column, term):
+    """
+    lower(column) empieza por term (ya en minúsculas con str.lower())
+
+    Usa el rango sobre lower(column), que aprovecha los índices ix_user_*_lower,
+    salvo en SQLite con términos no ASCII: allí lower() no convierte 'Á' ni 'Ñ',
+    así que se compara con unicode_lower() (sin índice, pero correcto).
+    """
+    if not term.isascii() and db.engine.dialect.name == 'sqlite':
+        return db.func.unicode_lower(column).startswith(term, autoescape=True)
+    return _prefix_match(db.func.lower(column), term)
 
 
 @app.route('/admin/users/<int:user_id>/update', methods=['POST'])
@@ -2096,9 +2628,43 @@ def admin_update_user(user_id):
 @app.route('/admin/memberships')
 @admin_required
 def admin_memberships():
-    """Gestión de membresías"""
-    memberships = Membership.query.order_by(Membership.created_at.desc()).all()
-    return render_template('admin/memberships.html', memberships=memberships)
+    """Gestión de membresías y suscripciones (listado unificado paginado por cursor)"""
+    from membership_listing import parse_filters, decode_cursor, fetch_page
+
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    filters = parse_filters(request.args)
+    cursor_param = request.args.get('cursor', '')
+    cursor = decode_cursor(cursor_param) if cursor_param else None
+    if cursor_param and cursor is None:
+        flash('El cursor de paginación no es válido, se muestra la primera página.', 'warning')
+
+    memberships, next_cursor = fetch_page(filters, limit=per_page, cursor=cursor)
+    membership_types = sorted(db.session.execute(db.union(
+        db.select(Subscription.membership_type), db.select(Membership.membership_type)
+    )).scalars())
+
+    return render_template('admin/memberships.html',
+                         memberships=memberships,
+                         next_cursor=next_cursor,
+                         is_first_page=cursor is None,
+                         filters=filters,
+                         per_page=per_page,
+                         membership_types=membership_types)
+
+@app.route('/admin/memberships/export.csv')
+@admin_required
+def admin_memberships_export():
+    """Exportar el listado unificado a CSV en streaming, con los mismos filtros"""
+    from flask import Response, stream_with_context
+    from membership_listing import parse_filters, iter_csv
+
+    filters = parse_filters(request.args)
+    filename = f"membresias_{datetime.utcnow().strftime('%Y%m%d_%H%M')}.csv"
+    return Response(
+        stream_with_context(iter_csv(filters)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 # Rutas administrativas para gestión de mensajería
 @app.route('/admin/messaging')
@@ -2122,13 +2688,8 @@ def admin_messaging():
         query = query.filter_by(status=status)
     
     if search:
-        query = query.filter(
-            db.or_(
-                EmailLog.recipient_email.ilike(f'%{search}%'),
-                EmailLog.subject.ilike(f'%{search}%'),
-                EmailLog.recipient_name.ilike(f'%{search}%')
-            )
-        )
+        # Índice de texto completo sobre destinatario, asunto y contenido
+        query = query.filter(email_search.search_filter(search))
     
     # Ordenar por fecha más reciente
     query = query.order_by(EmailLog.created_at.desc())
@@ -2137,21 +2698,16 @@ def admin_messaging():
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     emails = pagination.items
     
-    # Estadísticas
-    total_emails = EmailLog.query.count()
-    sent_emails = EmailLog.query.filter_by(status='sent').count()
-    failed_emails = EmailLog.query.filter_by(status='failed').count()
-    
-    # Tipos de email únicos para el filtro
-    email_types = db.session.query(EmailLog.email_type).distinct().all()
-    email_types = [t[0] for t in email_types if t[0]]
+    # Estadísticas y tipos de email para el filtro, desde el resumen diario
+    stats = email_stats.summary()
+    email_types = sorted(t for t in stats['by_type'] if t)
     
     return render_template('admin/messaging.html',
                          emails=emails,
                          pagination=pagination,
-                         total_emails=total_emails,
-                         sent_emails=sent_emails,
-                         failed_emails=failed_emails,
+                         total_emails=stats['total'],
+                         sent_emails=stats['sent'],
+                         failed_emails=stats['failed'],
                          email_types=email_types,
                          current_type=email_type,
                          current_status=status,
@@ -2173,35 +2729,16 @@ def admin_messaging_resend(email_id):
     if email_log.status == 'sent':
         flash('Este email ya fue enviado exitosamente.', 'info')
         return redirect(url_for('admin_messaging_detail', email_id=email_id))
-    
+
+    if any(item.status in ('pending', 'sending') for item in email_log.outbox_entries):
+        flash('Este email ya está en la cola de envío.', 'info')
+        return redirect(url_for('admin_messaging_detail', email_id=email_id))
+
     try:
-        # Intentar reenviar
-        if email_service:
-            success = email_service.send_email(
-                subject=email_log.subject,
-                recipients=[email_log.recipient_email],
-                html_content=email_log.html_content or '',
-                text_content=email_log.text_content,
-                email_type=email_log.email_type,
-                related_entity_type=email_log.related_entity_type,
-                related_entity_id=email_log.related_entity_id,
-                recipient_id=email_log.recipient_id,
-                recipient_name=email_log.recipient_name
-            )
-            
-            if success:
-                email_log.status = 'sent'
-                email_log.sent_at = datetime.utcnow()
-                email_log.error_message = None
-                db.session.commit()
-                flash('Email reenviado exitosamente.', 'success')
-            else:
-                email_log.status = 'failed'
-                email_log.retry_count += 1
-                db.session.commit()
-                flash('Error al reenviar el email. Verifica la configuración del servidor de correo.', 'error')
-        else:
-            flash('Servicio de email no disponible.', 'error')
+        # Reencolar: el worker actualiza este mismo registro con el resultado
+        email_queue.requeue(email_log)
+        db.session.commit()
+        flash('Email encolado para reenvío. El estado se actualizará al completarse el envío.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error al reenviar: {str(e)}', 'error')
@@ -2227,34 +2764,15 @@ def admin_messaging_delete(email_id):
 @app.route('/api/admin/messaging/stats')
 @admin_required
 def api_messaging_stats():
-    """API para obtener estadísticas de mensajería"""
-    total = EmailLog.query.count()
-    sent = EmailLog.query.filter_by(status='sent').count()
-    failed = EmailLog.query.filter_by(status='failed').count()
-    
-    # Estadísticas por tipo
-    from sqlalchemy import func
-    stats_by_type = db.session.query(
-        EmailLog.email_type,
-        func.count(EmailLog.id).label('count')
-    ).group_by(EmailLog.email_type).all()
-    
-    # Estadísticas por día (últimos 30 días)
-    from datetime import timedelta
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    stats_by_day = db.session.query(
-        func.date(EmailLog.created_at).label('date'),
-        func.count(EmailLog.id).label('count')
-    ).filter(
-        EmailLog.created_at >= thirty_days_ago
-    ).group_by(func.date(EmailLog.created_at)).all()
-    
+    """API para obtener estadísticas de mensajería (últimos 30 días por día)"""
+    stats = email_stats.summary(days=30)
     return jsonify({
-        'total': total,
-        'sent': sent,
-        'failed': failed,
-        'by_type': {t[0]: t[1] for t in stats_by_type},
-        'by_day': [{'date': str(d[0]), 'count': d[1]} for d in stats_by_day]
+        'total': stats['total'],
+        'sent': stats['sent'],
+        'failed': stats['failed'],
+        'pending': stats['pending'],
+        'by_type': stats['by_type'],
+        'by_day': stats['by_day']
     })
 
 # Registrar blueprints de eventos
@@ -2296,33 +2814,22 @@ def create_sample_data():
 @app.route('/api/notifications')
 @login_required
 def api_notifications():
-    """API para obtener notificaciones del usuario"""
+    """API para obtener notificaciones del usuario (paginada por cursor)"""
     # Obtener filtros de query params
     notification_type = request.args.get('type', 'all')
     status = request.args.get('status', 'all')  # all, read, unread
-    limit = int(request.args.get('limit', 50))
-    
-    # Construir query
-    query = Notification.query.filter_by(user_id=current_user.id)
-    
-    # Filtrar por tipo
-    if notification_type != 'all':
-        query = query.filter_by(notification_type=notification_type)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
     
-    # Filtrar por estado
-    if status == 'read':
-        query = query.filter_by(is_read=True)
-    elif status == 'unread':
-        query = query.filter_by(is_read=False)
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = notification_inbox.decode_cursor(request.args['cursor'])
+        if cursor is None:
+            return jsonify({'error': 'Cursor inválido'}), 400
     
-    # Obtener conteos
-    unread_count = Notification.query.filter_by(
-        user_id=current_user.id,
-        is_read=False
-    ).count()
-    
-    # Obtener notificaciones
-    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
+    notifications, next_cursor = notification_inbox.fetch_page(
+        current_user.id, notification_type, status, limit=limit, cursor=cursor
+    )
+    unread_count = notification_inbox.unread_count(current_user.id)
     
     return jsonify({
         'unread_count': unread_count,
@@ -2337,9 +2844,44 @@ def api_notifications():
             'created_at': n.created_at.isoformat() if n.created_at else None,
             'email_sent': n.email_sent,
             'email_sent_at': n.email_sent_at.isoformat() if n.email_sent_at else None
-        } for n in notifications]
+        } for n in notifications],
+        'next_cursor': next_cursor
     })
 
+@app.route('/api/notifications/unread-count')
+@login_required
+def api_notifications_unread_count():
+    """Contador de no leídas para el badge del navbar (una lectura por clave primaria)"""
+    return jsonify({'unread_count': notification_inbox.unread_count(current_user.id)})
+
+@app.route('/api/notifications/stream')
+@login_required
+def api_notifications_stream():
+    """Server-Sent Events con el contador de no leídas; solo consulta la base de datos cuando cambia"""
+    from flask import Response, stream_with_context
+    
+    if not app.config['NOTIFICATION_STREAM_ENABLED']:
+        return jsonify({'error': 'El canal en tiempo real de notificaciones está deshabilitado'}), 404
+    
+    user_id = current_user.id
+    
+    def read_unread_count():
+        try:
+            return notification_inbox.unread_count(user_id)
+        finally:
+            # No retener una conexión del pool mientras el stream espera
+            db.session.remove()
+    
+    response = Response(stream_with_context(notification_event_stream(
+        notification_broker, user_id, read_unread_count,
+        poll_interval=app.config['NOTIFICATION_STREAM_POLL'],
+        keepalive=app.config['NOTIFICATION_STREAM_KEEPALIVE'],
+        max_seconds=app.config['NOTIFICATION_STREAM_MAX_SECONDS']
+    )), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/notifications/<int:notification_id>/read', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
@@ -2360,6 +2902,7 @@ def mark_all_notifications_read():
             user_id=current_user.id,
             is_read=False
         ).update({'is_read': True})
+        mark_notifications_changed(db.session, [current_user.id])
         db.session.commit()
         return jsonify({'success': True, 'message': 'Todas las notificaciones han sido marcadas como leídas'})
     except Exception as e:
@@ -4,7 +4,7 @@ Rutas y vistas para la gestión de citas (appointments) tanto para miembros
 como para administradores, inspiradas en el flujo de Odoo.
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 
 from flask import (
@@ -18,6 +18,9 @@ from flask import (
 )
 from flask_login import current_user, login_required
 
+from interval_index import AdvisorIntervalIndex
+from local_time import resolve_timezone, to_utc
+
 # Blueprints
 appointments_bp = Blueprint('appointments', __name__, url_prefix='/appointments')
 admin_appointments_bp = Blueprint('admin_appointments', __name__, url_prefix='/admin/appointments')
@@ -101,12 +104,26 @@ def admin_required(f):
 
 def _active_membership_or_warning():
     """Devuelve la membresía activa del usuario o None, mostrando advertencia."""
-    membership = current_user.get_active_membership()
+    membership = current_user.get_membership_tier()
     if not membership:
         flash('Necesitas una membresía activa para reservar citas. Revisa tus planes disponibles.', 'warning')
     return membership
 
 
+def _advisor_timezone(advisor_id):
+    """Zona horaria del asesor (la de sus franjas de disponibilidad) o la de la aplicación."""
+    ensure_models()
+    availability = (
+        AdvisorAvailability.query.filter(
+            AdvisorAvailability.advisor_id == advisor_id,
+            AdvisorAvailability.timezone.isnot(None),
+        )
+        .order_by(AdvisorAvailability.is_active.desc(), AdvisorAvailability.id.asc())
+        .first()
+    )
+    return resolve_timezone(availability.timezone if availability else None)
+
+
 def _slot_queryset():
     ensure_models()
     return AppointmentSlot.query.filter(AppointmentSlot.start_datetime >= datetime.utcnow()).order_by(AppointmentSlot.start_datetime.asc())
@@ -116,7 +133,7 @@ def _slot_queryset():
 @login_required
 def appointments_home():
     ensure_models()
-    membership = current_user.get_active_membership()
+    membership = current_user.get_membership_tier()
     membership_type = membership.membership_type if membership else None
 
     appointment_types = AppointmentType.query.filter_by(is_active=True).order_by(AppointmentType.display_order.asc()).all()
@@ -148,7 +165,7 @@ def appointments_home():
 @login_required
 def appointment_type_detail(type_id):
     ensure_models()
-    membership = current_user.get_active_membership()
+    membership = current_user.get_membership_tier()
     membership_type = membership.membership_type if membership else None
 
     appointment_type = AppointmentType.query.get_or_404(type_id)
@@ -182,7 +199,14 @@ def book_appointment(slot_id):
         return redirect(request.referrer or url_for('appointments.appointments_home'))
 
     slot = AppointmentSlot.query.get_or_404(slot_id)
-    if not slot.is_available or slot.remaining_seats() <= 0:
+    # El asesor no puede tener otra cita activa que se cruce con este slot
+    busy = AdvisorIntervalIndex.load(
+        [slot.advisor_id], slot.start_datetime, slot.end_datetime,
+        include_slots=False, exclude_slot_id=slot.id
+    )
+    # Reserva atómica del cupo (queda tomado hasta el commit)
+    if busy.collides(slot.advisor_id, slot.start_datetime, slot.end_datetime) or not slot.reserve_seat():
+        db.session.rollback()
         flash('Este horario ya no está disponible. Intenta con otro slot.', 'warning')
         return redirect(url_for('appointments.appointment_type_detail', type_id=slot.appointment_type_id))
 
@@ -209,10 +233,6 @@ def book_appointment(slot_id):
         user_notes=notes,
     )
 
-    slot.reserved_seats = (slot.reserved_seats or 0) + 1
-    if slot.remaining_seats() == 0:
-        slot.is_available = False
-
     db.session.add(appointment)
     db.session.commit()
 
@@ -246,12 +266,10 @@ def cancel_appointment(appointment_id):
         flash('No puedes cancelar citas que ya iniciaron.', 'warning')
         return redirect(url_for('appointments.appointments_home'))
 
-    appointment.status = 'cancelled'
-    appointment.cancellation_reason = request.form.get('reason', 'Cancelada por el miembro.')
-
-    if appointment.slot:
-        appointment.slot.reserved_seats = max(0, (appointment.slot.reserved_seats or 1) - 1)
-        appointment.slot.is_available = True
+    if not appointment.cancel(request.form.get('reason', 'Cancelada por el miembro.'), 'user'):
+        db.session.rollback()
+        flash('La cita ya estaba cancelada.', 'info')
+        return redirect(url_for('appointments.appointments_home'))
 
     db.session.commit()
 
@@ -333,12 +351,10 @@ def admin_cancel_appointment(appointment_id):
         flash('La cita ya estaba cancelada.', 'info')
         return redirect(url_for('admin_appointments.admin_appointments_dashboard'))
 
-    appointment.status = 'cancelled'
-    appointment.cancellation_reason = request.form.get('reason', 'Cancelada por el administrador.')
-
-    if appointment.slot:
-        appointment.slot.reserved_seats = max(0, (appointment.slot.reserved_seats or 1) - 1)
-        appointment.slot.is_available = True
+    if not appointment.cancel(request.form.get('reason', 'Cancelada por el administrador.'), 'system'):
+        db.session.rollback()
+        flash('La cita ya estaba cancelada.', 'info')
+        return redirect(url_for('admin_appointments.admin_appointments_dashboard'))
 
     db.session.commit()
 
@@ -433,13 +449,19 @@ def create_manual_slot():
     advisor = Advisor.query.get_or_404(advisor_id)
 
     try:
-        start_datetime = datetime.strptime(start_raw, '%Y-%m-%dT%H:%M')
+        # El formulario usa la hora local del asesor; los slots se guardan en UTC como los autogenerados
+        start_datetime = to_utc(datetime.strptime(start_raw, '%Y-%m-%dT%H:%M'), _advisor_timezone(advisor.id))
     except ValueError:
         flash('Formato de fecha inválido.', 'error')
         return redirect(url_for('admin_appointments.admin_appointments_dashboard'))
 
     end_datetime = start_datetime + appointment_type.duration()
 
+    busy = AdvisorIntervalIndex.load([advisor.id], start_datetime, end_datetime)
+    if busy.collides(advisor.id, start_datetime, end_datetime):
+        flash('El asesor ya tiene un slot o una cita que se cruza con ese horario.', 'error')
+        return redirect(url_for('admin_appointments.admin_appointments_dashboard'))
+
     slot = AppointmentSlot(
         appointment_type_id=appointment_type.id,
         advisor_id=advisor.id,
@@ -466,6 +488,30 @@ def create_manual_slot():
     return redirect(url_for('admin_appointments.admin_appointments_dashboard'))
 
 
+@admin_appointments_bp.route('/slots/generate', methods=['POST'])
+@admin_required
+def generate_recurring_slots():
+    """Materializa los slots de las disponibilidades semanales de los asesores"""
+    ensure_models()
+    from slot_generator import generate_slots
+
+    days = request.form.get('days', type=int) or 90
+    stats = generate_slots(horizon_days=max(1, min(days, 366)), full=bool(request.form.get('full')))
+
+    ActivityLog.log_activity(
+        current_user.id,
+        'generate_slots',
+        'appointment_slot',
+        None,
+        f"Generó {stats['created']} slots recurrentes para {stats['advisors']} asesores",
+        request
+    )
+    db.session.commit()
+
+    flash(f"Se generaron {stats['created']} slots ({stats['skipped']} omitidos por solapamiento).", 'success')
+    return redirect(url_for('admin_appointments.admin_appointments_dashboard'))
+
+
 @admin_appointments_bp.route('/advisors')
 @admin_required
 def list_advisors():
@@ -533,8 +579,8 @@ def api_slots():
             'id': slot.id,
             'appointment_type': slot.appointment_type.name,
             'advisor': slot.advisor.user.first_name if slot.advisor and slot.advisor.user else None,
-            'start': slot.start_datetime.isoformat(),
-            'end': slot.end_datetime.isoformat(),
+            'start': slot.start_datetime.replace(tzinfo=timezone.utc).isoformat(),
+            'end': slot.end_datetime.replace(tzinfo=timezone.utc).isoformat(),
             'capacity': slot.capacity,
             'remaining': slot.remaining_seats(),
         }
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los índices compuestos de migrate_indexes.py
+Crea una base SQLite temporal con el esquema de los modelos (sin índices,
+como una base existente anterior a la migración), la llena con datos
+sintéticos y compara el plan (EXPLAIN QUERY PLAN) y el tiempo medio de las
+consultas más frecuentes antes y después de aplicar la migración
+
+Uso: python benchmark_indexes.py [--scale N] [--runs N]
+"""
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from migrate_indexes import apply_indexes
+
+TABLES = ['user', 'event', 'notification', 'event_registration', 'subscription',
+          'appointment_slot', 'appointment', 'email_log']
+
+EMAIL_TYPES = ['membership_payment', 'event_registration', 'appointment_confirmation',
+               'appointment_reminder', 'membership_expiring', 'welcome']
+EMAIL_STATUSES = ['sent'] * 17 + ['failed', 'failed', 'pending']
+NOTIFICATION_TYPES = ['event_registration', 'event_update', 'membership_renewal', 'appointment_reminder']
+REGISTRATION_STATUSES = ['confirmed', 'confirmed', 'confirmed', 'pending', 'cancelled']
+SUBSCRIPTION_STATUSES = ['expired', 'expired', 'active', 'cancelled']
+
+NOW = datetime(2026, 6, 1)
+
+
+def _ts(value):
+    """Mismo formato de fecha que guarda SQLAlchemy en SQLite"""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _past(rng, days):
+    return NOW - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def _around(rng, days):
+    return NOW + timedelta(seconds=rng.randrange(-days * 86400, days * 86400))
+
+
+def create_schema(conn):
+    """Tablas de los modelos (con sus restricciones únicas) sin los índices declarados"""
+    from sqlalchemy.dialects import sqlite
+    from sqlalchemy.schema import CreateTable
+    from app import db
+
+    for name in TABLES:
+        conn.execute(str(CreateTable(db.metadata.tables[name]).compile(dialect=sqlite.dialect())))
+
+
+def seed(conn, scale, rng):
+    """Datos sintéticos; devuelve el tamaño de cada tabla"""
+    sizes = {
+        'user': 10000 * scale,
+        'event': 500 * scale,
+        'notification': 400000 * scale,
+        'event_registration': 150000 * scale,
+        'subscription': 30000 * scale,
+        'appointment_slot': 100000 * scale,
+        'appointment': 80000 * scale,
+        'email_log': 300000 * scale,
+    }
+    users, events = sizes['user'], sizes['event']
+
+    conn.executemany(
+        'INSERT INTO "user" (id, email, password_hash, first_name, last_name, is_active, created_at) '
+        'VALUES (?, ?, ?, ?, ?, 1, ?)',
+        ((i, f'user{i}@example.com', 'x', f'Nombre{i}', f'Apellido{i}', _ts(_past(rng, 1500)))
+         for i in range(1, users + 1))
+    )
+    event_rows = []
+    for i in range(1, events + 1):
+        start = _around(rng, 365)
+        event_rows.append((i, f'Evento {i}', f'evento-{i}', _ts(start), _ts(start + timedelta(hours=4)),
+                           'published'))
+    conn.executemany(
+        'INSERT INTO event (id, title, slug, start_date, end_date, publish_status) VALUES (?, ?, ?, ?, ?, ?)',
+        event_rows
+    )
+    conn.executemany(
+        'INSERT INTO notification (user_id, notification_type, title, message, is_read, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        ((rng.randint(1, users), rng.choice(NOTIFICATION_TYPES), 'Aviso', 'Mensaje',
+          int(rng.random() < 0.85), _ts(_past(rng, 720)))
+         for _ in range(sizes['notification']))
+    )
+    pairs = set()
+    while len(pairs) < sizes['event_registration']:
+        pairs.add((rng.randint(1, events), rng.randint(1, users)))
+    conn.executemany(
+        'INSERT INTO event_registration (event_id, user_id, registration_status, registration_date) '
+        'VALUES (?, ?, ?, ?)',
+        ((event_id, user_id, rng.choice(REGISTRATION_STATUSES), _ts(_past(rng, 365)))
+         for event_id, user_id in pairs)
+    )
+    subscription_rows = []
+    for i in range(sizes['subscription']):
+        start = _past(rng, 1500)
+        subscription_rows.append((rng.randint(1, users), i + 1, 'pro', rng.choice(SUBSCRIPTION_STATUSES),
+                                  _ts(start), _ts(start + timedelta(days=365)), _ts(start)))
+    conn.executemany(
+        'INSERT INTO subscription (user_id, payment_id, membership_type, status, start_date, end_date, '
+        'created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        subscription_rows
+    )
+    slot_rows = []
+    for _ in range(sizes['appointment_slot']):
+        start = _around(rng, 180)
+        slot_rows.append((rng.randint(1, 20), rng.randint(1, 50), _ts(start), _ts(start + timedelta(hours=1)),
+                          int(rng.random() < 0.3)))
+    conn.executemany(
+        'INSERT INTO appointment_slot (appointment_type_id, advisor_id, start_datetime, end_datetime, '
+        'is_available) VALUES (?, ?, ?, ?, ?)',
+        slot_rows
+    )
+    appointment_rows = []
+    for _ in range(sizes['appointment']):
+        start = _around(rng, 365)
+        appointment_rows.append((rng.randint(1, 20), rng.randint(1, 50), rng.randint(1, users), _ts(start),
+                                 _ts(start + timedelta(hours=1)), rng.choice(['confirmed', 'pending', 'cancelled'])))
+    conn.executemany(
+        'INSERT INTO appointment (appointment_type_id, advisor_id, user_id, start_datetime, end_datetime, '
+        'status) VALUES (?, ?, ?, ?, ?, ?)',
+        appointment_rows
+    )
+    email_rows = []
+    for _ in range(sizes['email_log']):
+        created = _ts(_past(rng, 720))
+        email_rows.append((f'user{rng.randint(1, users)}@example.com', 'Asunto', rng.choice(EMAIL_TYPES),
+                           rng.choice(EMAIL_STATUSES), created, created))
+    conn.executemany(
+        'INSERT INTO email_log (recipient_email, subject, email_type, status, sent_at, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        email_rows
+    )
+    conn.commit()
+    return sizes
+
+
+def hot_queries(sizes):
+    """(descripción, SQL, generador de parámetros) de las consultas de la aplicación"""
+    users, events, now = sizes['user'], sizes['event'], _ts(NOW)
+    return [
+        ("Notificaciones no leídas del usuario (badge, marcar todas)",
+         "SELECT count(*) FROM notification WHERE user_id = ? AND is_read = 0",
+         lambda rng: (rng.randint(1, users),)),
+        ("Bandeja de no leídas más recientes",
+         "SELECT id, title, created_at FROM notification WHERE user_id = ? AND is_read = 0 "
+         "ORDER BY created_at DESC LIMIT 20",
+         lambda rng: (rng.randint(1, users),)),
+        ("Conteo de inscripciones por evento y estado (admin de evento)",
+         "SELECT count(*) FROM event_registration WHERE event_id = ? AND registration_status = ?",
+         lambda rng: (rng.randint(1, events), rng.choice(['pending', 'confirmed', 'cancelled']))),
+        ("Próximos eventos inscritos del usuario (dashboard)",
+         "SELECT event_registration.id FROM event_registration JOIN event ON event.id = event_registration.event_id "
+         "WHERE event_registration.user_id = ? AND event_registration.registration_status = 'confirmed' "
+         "AND event.start_date >= ? ORDER BY event.start_date LIMIT 5",
+         lambda rng: (rng.randint(1, users), now)),
+        ("Suscripción activa del usuario (get_active_membership)",
+         "SELECT id FROM subscription WHERE user_id = ? AND status = 'active' AND end_date > ? LIMIT 1",
+         lambda rng: (rng.randint(1, users), now)),
+        ("Slots disponibles por tipo de cita",
+         "SELECT id, start_datetime FROM appointment_slot WHERE appointment_type_id = ? AND is_available = 1 "
+         "AND start_datetime >= ? ORDER BY start_datetime LIMIT 50",
+         lambda rng: (rng.randint(1, 20), now)),
+        ("Próximas citas del usuario (dashboard)",
+         "SELECT id FROM appointment WHERE user_id = ? AND start_datetime >= ? ORDER BY start_datetime LIMIT 5",
+         lambda rng: (rng.randint(1, users), now)),
+        ("Citas pasadas del usuario (dashboard)",
+         "SELECT count(*) FROM appointment WHERE user_id = ? AND start_datetime < ?",
+         lambda rng: (rng.randint(1, users), now)),
+        ("Registro de emails, página reciente (admin mensajería)",
+         "SELECT id, subject FROM email_log ORDER BY created_at DESC LIMIT 50 OFFSET ?",
+         lambda rng: (rng.randrange(0, 500, 50),)),
+        ("Registro de emails filtrado por estado y tipo",
+         "SELECT id, subject FROM email_log WHERE status = ? AND email_type = ? ORDER BY created_at DESC LIMIT 50",
+         lambda rng: (rng.choice(['failed', 'pending']), rng.choice(EMAIL_TYPES))),
+    ]
+
+
+def measure(conn, sql, params, runs, rng):
+    """Plan de la consulta y tiempo medio en milisegundos"""
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params(rng))]
+    started = time.perf_counter()
+    for _ in range(runs):
+        conn.execute(sql, params(rng)).fetchall()
+    return plan, (time.perf_counter() - started) * 1000 / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planes y tiempos de las consultas antes/después de los índices")
+    parser.add_argument('--scale', type=int, default=1, help="Multiplicador del volumen de datos")
+    parser.add_argument('--runs', type=int, default=20, help="Ejecuciones por consulta")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    workdir = Path(tempfile.mkdtemp(prefix='relatic-bench-'))
+    conn = sqlite3.connect(str(workdir / 'benchmark.db'))
+    try:
+        print("📦 Creando esquema y datos de prueba...")
+        create_schema(conn)
+        sizes = seed(conn, args.scale, rng)
+        conn.execute("ANALYZE")
+        for table, size in sizes.items():
+            print(f"   - {table}: {size:,} filas")
+
+        queries = hot_queries(sizes)
+        before = [measure(conn, sql, params, args.runs, random.Random(7)) for _, sql, params in queries]
+
+        print("\n➕ Aplicando migrate_indexes.apply_indexes()...")
+        started = time.perf_counter()
+        created = apply_indexes(conn, verbose=False)
+        print(f"   {len(created)} índices creados en {time.perf_counter() - started:.1f}s")
+        after = [measure(conn, sql, params, args.runs, random.Random(7)) for _, sql, params in queries]
+
+        print()
+        for (label, _, _), (plan_before, ms_before), (plan_after, ms_after) in zip(queries, before, after):
+            print(f"📊 {label}")
+            print(f"   antes:   {ms_before:9.3f} ms  | {' / '.join(plan_before)}")
+            print(f"   después: {ms_after:9.3f} ms  | {' / '.join(plan_after)}")
+            print(f"   mejora:  x{ms_before / max(ms_after, 1e-6):.1f}\n")
+    finally:
+        conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
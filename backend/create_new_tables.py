@@ -22,6 +22,7 @@ with app.app_context():
         print("   - event_workshop")
         print("   - event_topic")
         print("   - event_registration")
+        print("   - appointment_reminder")
         print("\n✨ Proceso completado!")
     except Exception as e:
         print(f"❌ Error al crear las tablas: {e}")
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Cola persistente de correos salientes para RelaticPanama
+Los handlers solo encolan (tabla email_outbox) y un pool de workers en
+segundo plano se encarga del envío SMTP, reintentos y registro en EmailLog
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+from sqlalchemy import and_, event, or_
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class EmailQueue:
+    """Outbox en base de datos + pool de workers que la vacía"""
+
+    def __init__(self, mail_instance, app=None, workers=2, max_attempts=3, retry_delay=30,
+                 poll_interval=2.0, batch_size=50, lock_timeout=600):
+        """
+        Inicializar la cola de correo
+
+        Args:
+            mail_instance: Instancia de Flask-Mail
+            app: Aplicación Flask (opcional, ver init_app)
+            workers: Número de hilos que vacían la cola (0 = solo proceso externo)
+            max_attempts: Intentos de envío antes de marcar el correo como fallido
+            retry_delay: Segundos base de espera entre reintentos (crece con cada intento)
+            poll_interval: Segundos de espera de un worker cuando la cola está vacía
+            batch_size: Correos que reclama un worker en cada pasada
+            lock_timeout: Segundos tras los cuales un correo 'sending' se considera abandonado
+        """
+        self.mail = mail_instance
+        self.app = None
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self._threads = []
+        self._owner_pid = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Leer configuración y arrancar los workers con la primera petición"""
+        self.app = app
+        self.workers = app.config.get('EMAIL_QUEUE_WORKERS', self.workers)
+        self.max_attempts = app.config.get('EMAIL_QUEUE_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_delay = app.config.get('EMAIL_QUEUE_RETRY_DELAY', self.retry_delay)
+
+        from app import db
+
+        @event.listens_for(db.session, 'after_commit')
+        def _wake_workers(session):
+            if session.info.pop('email_queue_wake', False):
+                self._wake.set()
+
+        app.before_request(self.start)
+
+    # ------------------------------------------------------------------
+    # Productores
+    # ------------------------------------------------------------------
+    def enqueue(self, subject, recipients, html_content, text_content=None, sender=None,
+                email_type=None, related_entity_type=None, related_entity_id=None,
+                recipient_id=None, recipient_name=None, notification=None):
+        """
+        Encolar un correo. No hace commit: el correo se envía cuando el
+        llamador confirma su transacción, junto con la notificación asociada.
+
+        Args:
+            subject: Asunto del correo
+            recipients: Lista de destinatarios o string único
+            html_content: Contenido HTML del correo
+            text_content: Contenido de texto plano (opcional)
+            sender: Remitente (opcional, usa el configurado por defecto)
+            email_type: Tipo de email (membership_payment, event_registration, etc.)
+            related_entity_type: Tipo de entidad relacionada (membership, event, etc.)
+            related_entity_id: ID de la entidad relacionada
+            recipient_id: ID del usuario destinatario (opcional)
+            recipient_name: Nombre del destinatario (opcional)
+            notification: Notification que se marcará como enviada al entregarse
+
+        Returns:
+            list: Filas EmailOutbox creadas (una por destinatario)
+        """
+        from app import db, EmailLog, EmailOutbox
+
+        if isinstance(recipients, str):
+            recipients = [recipients]
+
+        items = []
+        for recipient_email in recipients:
+            email_log = EmailLog(
+                recipient_id=recipient_id,
+                recipient_email=recipient_email,
+                recipient_name=recipient_name or recipient_email,
+                subject=subject,
+                html_content=html_content[:5000] if html_content else None,
+                text_content=text_content[:5000] if text_content else None,
+                email_type=email_type or 'general',
+                related_entity_type=related_entity_type,
+                related_entity_id=related_entity_id,
+                status='pending',
+                retry_count=0,
+                sent_at=None
+            )
+            item = EmailOutbox(
+                email_log=email_log,
+                notification=notification,
+                recipient_email=recipient_email,
+                subject=subject,
+                html_content=html_content,
+                text_content=text_content,
+                sender=sender,
+                max_attempts=self.max_attempts
+            )
+            db.session.add(item)
+            items.append(item)
+
+        db.session.info['email_queue_wake'] = True
+        return items
+
+    def enqueue_many(self, emails, chunk_size=500):
+        """
+        Encolar muchos correos con inserciones masivas (fan-out a miles de destinatarios).
+        Como enqueue(), no hace commit.
+
+        Args:
+            emails: Lista de diccionarios con keys: subject, recipient_email, html_content,
+                text_content, sender, email_type, related_entity_type, related_entity_id,
+                recipient_id, recipient_name, notification_id
+            chunk_size: Filas por sentencia INSERT
+
+        Returns:
+            int: Número de correos encolados
+        """
+        from app import db, EmailLog, EmailOutbox
+
+        total = 0
+        for start in range(0, len(emails), chunk_size):
+            chunk = emails[start:start + chunk_size]
+            now = datetime.utcnow()
+            log_rows = [{
+                'recipient_id': data.get('recipient_id'),
+                'recipient_email': data['recipient_email'],
+                'recipient_name': data.get('recipient_name') or data['recipient_email'],
+                'subject': data['subject'],
+                'html_content': data['html_content'][:5000] if data.get('html_content') else None,
+                'text_content': data['text_content'][:5000] if data.get('text_content') else None,
+                'email_type': data.get('email_type') or 'general',
+                'related_entity_type': data.get('related_entity_type'),
+                'related_entity_id': data.get('related_entity_id'),
+                'status': 'pending',
+                'retry_count': 0,
+                'sent_at': None,
+                'created_at': now
+            } for data in chunk]
+            db.session.bulk_insert_mappings(EmailLog, log_rows, return_defaults=True)
+
+            db.session.bulk_insert_mappings(EmailOutbox, [{
+                'email_log_id': log_row['id'],
+                'notification_id': data.get('notification_id'),
+                'recipient_email': data['recipient_email'],
+                'subject': data['subject'],
+                'html_content': data.get('html_content'),
+                'text_content': data.get('text_content'),
+                'sender': data.get('sender'),
+                'status': 'pending',
+                'attempts': 0,
+                'max_attempts': self.max_attempts,
+                'next_attempt_at': now,
+                'created_at': now
+            } for data, log_row in zip(chunk, log_rows)])
+            total += len(chunk)
+
+        db.session.info['email_queue_wake'] = True
+        return total
+
+    def requeue(self, email_log):
+        """Volver a encolar un correo registrado en EmailLog (reenvío manual)"""
+        from app import db, EmailOutbox
+
+        email_log.status = 'pending'
+        email_log.error_message = None
+        item = EmailOutbox(
+            email_log=email_log,
+            recipient_email=email_log.recipient_email,
+            subject=email_log.subject,
+            html_content=email_log.html_content or '',
+            text_content=email_log.text_content,
+            attempts=email_log.retry_count or 0,
+            max_attempts=(email_log.retry_count or 0) + self.max_attempts
+        )
+        db.session.add(item)
+        db.session.info['email_queue_wake'] = True
+        return item
+
+    # ------------------------------------------------------------------
+    # Consumidores
+    # ------------------------------------------------------------------
+    def _claimable(self, EmailOutbox, now):
+        stale = now - timedelta(seconds=self.lock_timeout)
+        return or_(
+            and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+            and_(EmailOutbox.status == 'sending', EmailOutbox.locked_at < stale)
+        )
+
+    def _claim_batch(self):
+        """Reservar hasta batch_size correos pendientes; seguro entre hilos y procesos"""
+        from app import db, EmailOutbox
+
+        now = datetime.utcnow()
+        token = f"{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:8]}"
+        candidate_ids = [row[0] for row in db.session.query(EmailOutbox.id).filter(
+            self._claimable(EmailOutbox, now)
+        ).order_by(EmailOutbox.id.asc()).limit(self.batch_size).all()]
+        if not candidate_ids:
+            return []
+
+        # Un solo UPDATE condicionado: solo se quedan las filas que nadie más reclamó
+        EmailOutbox.query.filter(
+            EmailOutbox.id.in_(candidate_ids),
+            self._claimable(EmailOutbox, now)
+        ).update({'status': 'sending', 'locked_at': now, 'locked_by': token}, synchronize_session=False)
+        db.session.commit()
+
+        return EmailOutbox.query.filter(
+            EmailOutbox.id.in_(candidate_ids),
+            EmailOutbox.status == 'sending',
+            EmailOutbox.locked_by == token
+        ).order_by(EmailOutbox.id.asc()).all()
+
+    def _mark_failed(self, item, error):
+        item.attempts = (item.attempts or 0) + 1
+        item.last_error = str(error)[:1000]
+        item.locked_at = None
+        item.locked_by = None
+        if item.attempts >= (item.max_attempts or self.max_attempts):
+            item.status = 'failed'
+            logger.error(f"Falló el envío de email a {item.recipient_email} después de {item.attempts} intentos")
+        else:
+            item.status = 'pending'
+            item.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * item.attempts)
+        if item.email_log:
+            item.email_log.retry_count = item.attempts
+            item.email_log.error_message = item.last_error
+            if item.status == 'failed':
+                item.email_log.status = 'failed'
+
+    def _mark_sent(self, items):
+        """Registrar entregas del lote con UPDATEs agrupados en EmailLog y Notification"""
+        from app import EmailLog, Notification
+
+        now = datetime.utcnow()
+        logs_by_retry = {}
+        notification_ids = []
+        for item in items:
+            item.attempts = (item.attempts or 0) + 1
+            item.status = 'sent'
+            item.sent_at = now
+            item.locked_at = None
+            item.locked_by = None
+            item.last_error = None
+            if item.email_log_id:
+                logs_by_retry.setdefault(item.attempts - 1, []).append(item.email_log_id)
+            if item.notification_id:
+                notification_ids.append(item.notification_id)
+
+        for retry_count, log_ids in logs_by_retry.items():
+            EmailLog.query.filter(EmailLog.id.in_(log_ids)).update({
+                'status': 'sent',
+                'sent_at': now,
+                'retry_count': retry_count,
+                'error_message': None
+            }, synchronize_session=False)
+        if notification_ids:
+            Notification.query.filter(Notification.id.in_(notification_ids)).update({
+                'email_sent': True,
+                'email_sent_at': now
+            }, synchronize_session=False)
+
+    def _build_message(self, item):
+        return Message(
+            subject=item.subject,
+            recipients=[item.recipient_email],
+            html=item.html_content,
+            body=item.text_content,
+            sender=item.sender
+        )
+
+    def process_batch(self):
+        """
+        Enviar un lote de correos pendientes reutilizando una sola conexión SMTP
+
+        Returns:
+            int: Número de correos procesados (enviados o fallidos)
+        """
+        from app import db
+
+        items = self._claim_batch()
+        if not items:
+            return 0
+
+        start_time = time.time()
+        sent = []
+        connection = None
+        try:
+            for item in items:
+                try:
+                    if connection is None:
+                        connection = self.mail.connect()
+                        connection.__enter__()
+                    connection.send(self._build_message(item))
+                except Exception as e:
+                    logger.error(f"Error enviando email a {item.recipient_email} (intento {(item.attempts or 0) + 1}): {e}")
+                    self._mark_failed(item, e)
+                    # La conexión puede haber quedado inutilizable: abrir otra para el resto del lote
+                    self._close(connection)
+                    connection = None
+                else:
+                    sent.append(item)
+        finally:
+            self._close(connection)
+
+        self._mark_sent(sent)
+        db.session.commit()
+
+        elapsed = time.time() - start_time
+        rate = len(sent) / elapsed if elapsed > 0 else float(len(sent))
+        logger.info(f"Lote de correo: {len(sent)}/{len(items)} enviados en {elapsed:.2f}s ({rate:.1f} emails/s)")
+        return len(items)
+
+    @staticmethod
+    def _close(connection):
+        if connection is None:
+            return
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def drain(self):
+        """Procesar la cola hasta que no queden correos listos para enviar"""
+        total = 0
+        while True:
+            processed = self.process_batch()
+            if not processed:
+                return total
+            total += processed
+
+    def _run(self):
+        from app import db
+
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    processed = self.process_batch()
+                except Exception as e:
+                    logger.error(f"Error en worker de la cola de correo: {e}")
+                    db.session.rollback()
+                    processed = 0
+                finally:
+                    db.session.remove()
+                if not processed:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+
+    def start(self):
+        """Arrancar los workers en este proceso (idempotente, seguro tras fork)"""
+        if self.app is None or not self.workers:
+            return
+        if self._owner_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._owner_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'email-queue-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._owner_pid = os.getpid()
+            logger.info(f"Cola de correo iniciada con {self.workers} workers")
+
+    def stop(self, timeout=5):
+        """Detener los workers de este proceso"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._owner_pid = None
+
+
+if __name__ == '__main__':
+    # Worker independiente: python email_queue.py [--once]
+    from app import app, email_queue
+
+    with app.app_context():
+        if '--once' in sys.argv:
+            print(f"✅ Correos procesados: {email_queue.drain()}")
+            sys.exit(0)
+
+    email_queue.workers = email_queue.workers or 1
+    email_queue.start()
+    try:
+        while True:
+            email_queue._stop.wait(60)
+    except KeyboardInterrupt:
+        email_queue.stop()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Índice de texto completo del registro de emails (EmailLog)
+SQLite usa una tabla virtual FTS5 de contenido externo mantenida con
+triggers; PostgreSQL una columna tsvector generada con índice GIN. En ambos
+casos la base de datos sincroniza el índice en cada INSERT, sea cual sea el
+camino que registra el email (log_email_sent, EmailService, EmailQueue)
+"""
+
+import re
+import sys
+
+
+FTS_TABLE = 'email_log_fts'
+FTS_COLUMNS = ('recipient_email', 'recipient_name', 'subject', 'html_content', 'text_content')
+PG_CONFIG = 'spanish'
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {', '.join(FTS_COLUMNS)},
+        content='email_log', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS email_log_fts_insert AFTER INSERT ON email_log BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS email_log_fts_delete AFTER DELETE ON email_log BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS email_log_fts_update AFTER UPDATE OF {', '.join(FTS_COLUMNS)} ON email_log BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+]
+
+_POSTGRES_DDL = [
+    f"""ALTER TABLE email_log ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{PG_CONFIG}', coalesce(subject, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(recipient_email, '') || ' ' || coalesce(recipient_name, '')), 'A') ||
+        setweight(to_tsvector('{PG_CONFIG}', coalesce(text_content, '') || ' ' || coalesce(html_content, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_email_log_search ON email_log USING gin (search_vector)",
+]
+
+# Motores en los que el índice existe (clave: URL del engine)
+_available = {}
+
+
+def ensure_search_index(connection, rebuild=False):
+    """
+    Crear el índice si no existe (idempotente)
+
+    Args:
+        connection: Conexión SQLAlchemy
+        rebuild: Reindexar las filas existentes (necesario la primera vez en SQLite)
+
+    Returns:
+        bool: True si el índice está disponible
+    """
+    from sqlalchemy import text
+    from sqlalchemy.exc import DBAPIError
+
+    dialect = connection.dialect.name
+    key = str(connection.engine.url)
+    try:
+        if dialect == 'sqlite':
+            existed = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ), {'name': FTS_TABLE}).first() is not None
+            for statement in _SQLITE_DDL:
+                connection.execute(text(statement))
+            if rebuild or not existed:
+                connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            # La columna generada se calcula también para las filas existentes
+            for statement in _POSTGRES_DDL:
+                connection.execute(text(statement))
+        else:
+            _available[key] = False
+            return False
+    except DBAPIError as e:
+        # Por ejemplo SQLite compilado sin FTS5: se sigue usando la búsqueda con LIKE
+        print(f"⚠️ No se pudo crear el índice de búsqueda de emails: {e}")
+        _available[key] = False
+        return False
+
+    _available[key] = True
+    return True
+
+
+def _on_email_log_created(target, connection, **kw):
+    ensure_search_index(connection, rebuild=True)
+
+
+def register(email_log_table):
+    """Crear el índice junto con la tabla email_log en db.create_all()"""
+    from sqlalchemy import event
+    event.listen(email_log_table, 'after_create', _on_email_log_created)
+
+
+def is_available():
+    """¿Existe el índice en la base de datos actual? Se comprueba una vez por engine"""
+    from app import db
+
+    key = str(db.engine.url)
+    if key not in _available:
+        from sqlalchemy import inspect
+        inspector = inspect(db.engine)
+        if db.engine.dialect.name == 'sqlite':
+            _available[key] = FTS_TABLE in inspector.get_table_names()
+        elif db.engine.dialect.name == 'postgresql':
+            _available[key] = any(c['name'] == 'search_vector' for c in inspector.get_columns('email_log'))
+        else:
+            _available[key] = False
+    return _available[key]
+
+
+def _fts5_query(search):
+    """Convertir el texto del usuario en una consulta FTS5 segura: todos los términos, por prefijo"""
+    terms = [term.replace('"', '') for term in re.split(r'\s+', search.strip())]
+    return ' '.join(f'"{term}"*' for term in terms if term)
+
+
+def search_filter(search):
+    """
+    Criterio sobre EmailLog para el texto buscado
+
+    Usa el índice de texto completo si está disponible (destinatario, asunto
+    y contenido); si no, la búsqueda anterior con ILIKE sobre destinatario y asunto.
+    """
+    from app import db, EmailLog
+
+    if is_available():
+        if db.engine.dialect.name == 'sqlite':
+            query = _fts5_query(search)
+            if query:
+                matches = db.select(db.literal_column('rowid')).select_from(
+                    db.table(FTS_TABLE)
+                ).where(db.literal_column(FTS_TABLE).op('MATCH')(query))
+                return EmailLog.id.in_(matches)
+        else:
+            return db.literal_column('email_log.search_vector').op('@@')(
+                db.func.websearch_to_tsquery(PG_CONFIG, search)
+            )
+
+    return db.or_(
+        EmailLog.recipient_email.ilike(f'%{search}%'),
+        EmailLog.subject.ilike(f'%{search}%'),
+        EmailLog.recipient_name.ilike(f'%{search}%')
+    )
+
+
+if __name__ == '__main__':
+    # Uso: python email_search.py --rebuild
+    from app import app, db
+
+    if '--rebuild' not in sys.argv:
+        print("Uso: python email_search.py --rebuild")
+        sys.exit(1)
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if ensure_search_index(connection, rebuild=True):
+                print("✅ Índice de búsqueda de emails creado/reconstruido")
+            else:
+                print("❌ El motor de base de datos no soporta el índice de búsqueda")
+                sys.exit(1)
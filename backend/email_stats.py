@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Resumen diario por tipo del registro de emails (tabla email_daily_stat)
+Los contadores los mantienen triggers de la base de datos en cada INSERT,
+DELETE y cambio de estado de email_log (pending -> sent/failed ocurre en
+UPDATEs masivos de EmailQueue), de modo que las estadísticas de mensajería
+leen O(días x tipos) filas en lugar de recorrer todo el log
+"""
+
+import sys
+from datetime import datetime, timedelta
+
+
+STAT_COUNTERS = ('total', 'sent', 'failed', 'pending')
+_TRIGGERS = ('email_daily_stat_insert', 'email_daily_stat_delete', 'email_daily_stat_update')
+
+
+def _sqlite_counts(row, sign):
+    """Columnas a sumar para la fila old/new en los triggers de SQLite"""
+    return {
+        'total': f"{sign}1",
+        'sent': f"{sign}({row}.status = 'sent')",
+        'failed': f"{sign}({row}.status = 'failed')",
+        'pending': f"{sign}({row}.status = 'pending')",
+    }
+
+
+def _sqlite_apply(row, sign):
+    day = f"date(coalesce({row}.created_at, CURRENT_TIMESTAMP))"
+    counts = _sqlite_counts(row, sign)
+    return (
+        f"INSERT OR IGNORE INTO email_daily_stat (day, email_type, {', '.join(STAT_COUNTERS)}) "
+        f"VALUES ({day}, {row}.email_type, 0, 0, 0, 0); "
+        f"UPDATE email_daily_stat SET {', '.join(f'{c} = {c} + {v}' for c, v in counts.items())} "
+        f"WHERE day = {day} AND email_type = {row}.email_type;"
+    )
+
+
+_SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS email_daily_stat_insert AFTER INSERT ON email_log BEGIN
+        {_sqlite_apply('new', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS email_daily_stat_delete AFTER DELETE ON email_log BEGIN
+        {_sqlite_apply('old', '-')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS email_daily_stat_update AFTER UPDATE OF status, email_type, created_at ON email_log
+    WHEN old.status IS NOT new.status OR old.email_type IS NOT new.email_type
+        OR date(old.created_at) IS NOT date(new.created_at)
+    BEGIN
+        {_sqlite_apply('old', '-')}
+        {_sqlite_apply('new', '+')}
+    END""",
+]
+
+_POSTGRES_DDL = [
+    """CREATE OR REPLACE FUNCTION email_daily_stat_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE email_daily_stat SET
+                total = total - 1,
+                sent = sent - (OLD.status = 'sent')::int,
+                failed = failed - (OLD.status = 'failed')::int,
+                pending = pending - (OLD.status = 'pending')::int
+            WHERE day = coalesce(OLD.created_at, now())::date AND email_type = OLD.email_type;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO email_daily_stat (day, email_type, total, sent, failed, pending)
+            VALUES (coalesce(NEW.created_at, now())::date, NEW.email_type, 1,
+                    (NEW.status = 'sent')::int, (NEW.status = 'failed')::int, (NEW.status = 'pending')::int)
+            ON CONFLICT (day, email_type) DO UPDATE SET
+                total = email_daily_stat.total + 1,
+                sent = email_daily_stat.sent + EXCLUDED.sent,
+                failed = email_daily_stat.failed + EXCLUDED.failed,
+                pending = email_daily_stat.pending + EXCLUDED.pending;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS email_daily_stat_insert ON email_log",
+    "DROP TRIGGER IF EXISTS email_daily_stat_delete ON email_log",
+    "DROP TRIGGER IF EXISTS email_daily_stat_update ON email_log",
+    """CREATE TRIGGER email_daily_stat_insert AFTER INSERT ON email_log
+        FOR EACH ROW EXECUTE PROCEDURE email_daily_stat_sync()""",
+    """CREATE TRIGGER email_daily_stat_delete AFTER DELETE ON email_log
+        FOR EACH ROW EXECUTE PROCEDURE email_daily_stat_sync()""",
+    """CREATE TRIGGER email_daily_stat_update AFTER UPDATE OF status, email_type, created_at ON email_log
+        FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status
+            OR OLD.email_type IS DISTINCT FROM NEW.email_type
+            OR OLD.created_at::date IS DISTINCT FROM NEW.created_at::date)
+        EXECUTE PROCEDURE email_daily_stat_sync()""",
+]
+
+# Motores en los que los triggers existen (clave: URL del engine)
+_available = {}
+
+
+def _installed(connection):
+    """Triggers de resumen ya presentes en la base de datos"""
+    from sqlalchemy import text
+
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))
+    else:
+        rows = connection.execute(text(
+            "SELECT tgname FROM pg_trigger WHERE tgrelid = 'email_log'::regclass AND NOT tgisinternal"
+        ))
+    return {row[0] for row in rows} & set(_TRIGGERS)
+
+
+def _grouped_log(email_log):
+    """email_log agrupado por (día, tipo) con los mismos contadores que el resumen"""
+    from sqlalchemy import case, func, select
+
+    day = func.date(email_log.c.created_at)
+    return select(
+        day.label('day'),
+        email_log.c.email_type.label('email_type'),
+        func.count(email_log.c.id).label('total'),
+        *[func.sum(case((email_log.c.status == status, 1), else_=0)).label(status)
+          for status in STAT_COUNTERS[1:]]
+    ).group_by(day, email_log.c.email_type)
+
+
+def rebuild(connection, metadata):
+    """Recalcular email_daily_stat desde email_log (una sola consulta agrupada)"""
+    table = metadata.tables['email_daily_stat']
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(
+        ['day', 'email_type', *STAT_COUNTERS], _grouped_log(metadata.tables['email_log'])
+    ))
+
+
+def ensure_stats_triggers(connection, metadata, rebuild_stats=False):
+    """
+    Instalar los triggers si faltan (idempotente)
+
+    La primera vez, o con rebuild_stats, recalcula el resumen en la misma
+    transacción para que los contadores partan del estado real del log.
+
+    Returns:
+        bool: True si el resumen se mantiene con triggers en este motor
+    """
+    from sqlalchemy import text
+
+    dialect = connection.dialect.name
+    key = str(connection.engine.url)
+    if dialect not in ('sqlite', 'postgresql'):
+        _available[key] = False
+        return False
+
+    missing = len(_installed(connection)) < len(_TRIGGERS)
+    if missing:
+        for statement in (_SQLITE_DDL if dialect == 'sqlite' else _POSTGRES_DDL):
+            connection.execute(text(statement))
+    if missing or rebuild_stats:
+        rebuild(connection, metadata)
+    _available[key] = True
+    return True
+
+
+def _on_create_all(target, connection, **kw):
+    if 'email_log' in target.tables and 'email_daily_stat' in target.tables:
+        ensure_stats_triggers(connection, target)
+
+
+def register(metadata):
+    """Instalar los triggers al terminar db.create_all() (ambas tablas ya existen)"""
+    from sqlalchemy import event
+    event.listen(metadata, 'after_create', _on_create_all)
+
+
+def is_available():
+    """¿Se mantiene el resumen en la base de datos actual? Se comprueba una vez por engine"""
+    from app import db
+
+    key = str(db.engine.url)
+    if key not in _available:
+        if db.engine.dialect.name in ('sqlite', 'postgresql'):
+            with db.engine.connect() as connection:
+                _available[key] = len(_installed(connection)) == len(_TRIGGERS)
+        else:
+            _available[key] = False
+    return _available[key]
+
+
+def _source():
+    """Filas (day, email_type, contadores): el resumen o, si no existe, email_log agrupado"""
+    from app import EmailLog, EmailDailyStat
+
+    if is_available():
+        return EmailDailyStat.__table__
+    return _grouped_log(EmailLog.__table__).subquery()
+
+
+def summary(days=30, now=None):
+    """
+    Totales, desglose por tipo y serie diaria de los últimos `days` días, en una consulta
+
+    Se agrupa por tipo y por día solo dentro de la ventana (los días
+    anteriores colapsan en una fila por tipo), así que devuelve como mucho
+    tipos x (days + 1) filas.
+    """
+    from app import db
+    from membership_rollups import _as_date
+
+    source = _source()
+    cutoff = ((now or datetime.utcnow()) - timedelta(days=days)).date()
+    recent_day = db.case((source.c.day >= cutoff, source.c.day), else_=None)
+    rows = db.session.execute(db.select(
+        recent_day, source.c.email_type, *[db.func.sum(source.c[c]) for c in STAT_COUNTERS]
+    ).group_by(recent_day, source.c.email_type)).all()
+
+    totals = dict.fromkeys(STAT_COUNTERS, 0)
+    by_type = {}
+    by_day = {}
+    for day, email_type, *counts in rows:
+        counts = dict(zip(STAT_COUNTERS, (int(count or 0) for count in counts)))
+        if not counts['total']:
+            continue
+        for counter, count in counts.items():
+            totals[counter] += count
+        by_type[email_type] = by_type.get(email_type, 0) + counts['total']
+        if day is not None:
+            day = _as_date(day)
+            by_day[day] = by_day.get(day, 0) + counts['total']
+
+    return dict(
+        totals,
+        by_type=by_type,
+        by_day=[{'date': day.isoformat(), 'count': count} for day, count in sorted(by_day.items())]
+    )
+
+
+if __name__ == '__main__':
+    # Uso: python email_stats.py --rebuild
+    from app import app, db
+
+    if '--rebuild' not in sys.argv:
+        print("Uso: python email_stats.py --rebuild")
+        sys.exit(1)
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if ensure_stats_triggers(connection, db.metadata, rebuild_stats=True):
+                print("✅ Resumen diario de emails reconstruido")
+            else:
+                print("❌ El motor de base de datos no soporta los triggers del resumen")
+                sys.exit(1)
@@ -5,6 +5,7 @@ Sistema de templates HTML para diferentes tipos de notificaciones
 """
 
 from datetime import datetime
+from local_time import resolve_timezone, to_local
 
 def get_email_template_base():
     """Template base HTML para todos los correos"""
@@ -360,6 +361,7 @@ def get_appointment_confirmation_email(appointment, user, advisor):
 
 def get_appointment_reminder_email(appointment, user, advisor, hours_before=24):
     """Template para recordatorio de cita"""
+    start = to_local(appointment.start_datetime, resolve_timezone())
     content = f"""
         <h2>Recordatorio de Cita</h2>
         <p>Hola <strong>{user.first_name} {user.last_name}</strong>,</p>
@@ -369,9 +371,9 @@ def get_appointment_reminder_email(appointment, user, advisor, hours_before=24):
             <h3 style="margin-top: 0;">Detalles de la Cita:</h3>
             <ul>
                 <li><strong>Asesor:</strong> {advisor.first_name} {advisor.last_name}</li>
-                <li><strong>Fecha:</strong> {appointment.appointment_date.strftime('%d/%m/%Y')}</li>
-                <li><strong>Hora:</strong> {appointment.appointment_time}</li>
-                <li><strong>Duración:</strong> {appointment.duration} minutos</li>
+                <li><strong>Fecha:</strong> {start.strftime('%d/%m/%Y')}</li>
+                <li><strong>Hora:</strong> {start.strftime('%H:%M')}</li>
+                <li><strong>Duración:</strong> {appointment.get_duration_minutes()} minutos</li>
             </ul>
         </div>
         
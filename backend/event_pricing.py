@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Motor de precios de eventos por tipo de membresía
+Carga en una sola consulta todos los descuentos activos de un conjunto de
+eventos y resuelve la matriz (event_id, membership_tier) -> precio final
+"""
+
+
+def apply_event_discount(base_price, discount):
+    """Precio final tras aplicar un Discount (o None) al precio base"""
+    final_price = base_price
+    if discount:
+        if discount.discount_type == 'percentage':
+            final_price = base_price * (1 - discount.value / 100)
+        elif discount.discount_type == 'fixed':
+            final_price = max(0, base_price - discount.value)
+    return final_price
+
+
+class EventPricingMatrix:
+    """Descuento ganador por (evento, tipo de membresía) para un lote de eventos"""
+
+    def __init__(self, discounts=None):
+        # (event_id, membership_tier) -> Discount
+        self.discounts = discounts or {}
+
+    @classmethod
+    def load(cls, events):
+        """
+        Construir la matriz para una lista de eventos con una única consulta
+
+        Args:
+            events: Lista de instancias Event
+        """
+        from app import db, EventDiscount, Discount
+
+        event_ids = [evt.id for evt in events]
+        if not event_ids:
+            return cls()
+
+        rows = db.session.query(EventDiscount.event_id, Discount).join(
+            Discount, EventDiscount.discount_id == Discount.id
+        ).filter(
+            EventDiscount.event_id.in_(event_ids),
+            Discount.membership_tier.isnot(None),
+            Discount.is_active == True  # noqa
+        ).order_by(
+            EventDiscount.event_id.asc(),
+            EventDiscount.priority.asc(),
+            EventDiscount.id.asc()
+        ).all()
+
+        # Misma precedencia que Event.pricing_for_membership: el primero por prioridad gana
+        discounts = {}
+        for event_id, discount in rows:
+            discounts.setdefault((event_id, discount.membership_tier), discount)
+        return cls(discounts)
+
+    def pricing(self, event, membership_type=None):
+        """Mismo resultado que event.pricing_for_membership(membership_type), sin consultas"""
+        base_price = event.base_price or 0.0
+        discount = self.discounts.get((event.id, membership_type)) if membership_type else None
+        return {
+            'base_price': base_price,
+            'final_price': apply_event_discount(base_price, discount),
+            'discount': discount
+        }
@@ -5,6 +5,8 @@ panel administrativo, el portal de miembros y APIs públicas.
 """
 
 from datetime import datetime, timedelta
+import base64
+import binascii
 import os
 import re
 import unicodedata
@@ -20,9 +22,14 @@ from flask import (
     url_for,
 )
 from flask_login import current_user, login_required
-from sqlalchemy import or_
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 from werkzeug.utils import secure_filename
 
+from event_pricing import EventPricingMatrix
+from response_cache import ResponseCache
+
 from functools import wraps
 
 # Decorador admin_required
@@ -145,31 +152,74 @@ def _save_file(storage, prefix='event'):
     return f"/static/uploads/events/{new_name}"
 
 
-def _serialize_event(event, membership_type=None):
-    data = {
-        'id': event.id,
-        'slug': event.slug,
-        'title': event.title,
-        'summary': event.summary,
-        'description': event.description,
-        'category': event.category,
-        'format': event.format,
-        'tags': event.tags,
-        'currency': event.currency,
-        'start_date': event.start_date.isoformat() if event.start_date else None,
-        'end_date': event.end_date.isoformat() if event.end_date else None,
-        'registration_deadline': event.registration_deadline.isoformat() if event.registration_deadline else None,
-        'cover_image': event.cover_url(),
-        'is_virtual': event.is_virtual,
-        'location': event.location,
-        'country': event.country,
-        'has_certificate': event.has_certificate,
-        'certificate_instructions': event.certificate_instructions,
-        'visibility': event.visibility,
-        'publish_status': event.publish_status,
-        'featured': event.featured,
-    }
-    pricing = event.pricing_for_membership(membership_type)
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+# Campo de la API -> (columnas de Event que necesita, extractor)
+EVENT_API_FIELDS = {
+    'id': (('id',), lambda evt: evt.id),
+    'slug': (('slug',), lambda evt: evt.slug),
+    'title': (('title',), lambda evt: evt.title),
+    'summary': (('summary',), lambda evt: evt.summary),
+    'description': (('description',), lambda evt: evt.description),
+    'category': (('category',), lambda evt: evt.category),
+    'format': (('format',), lambda evt: evt.format),
+    'tags': (('tags',), lambda evt: evt.tags),
+    'currency': (('currency',), lambda evt: evt.currency),
+    'start_date': (('start_date',), lambda evt: _iso(evt.start_date)),
+    'end_date': (('end_date',), lambda evt: _iso(evt.end_date)),
+    'registration_deadline': (('registration_deadline',), lambda evt: _iso(evt.registration_deadline)),
+    'cover_image': (('cover_image',), lambda evt: evt.cover_url()),
+    'is_virtual': (('is_virtual',), lambda evt: evt.is_virtual),
+    'location': (('location',), lambda evt: evt.location),
+    'country': (('country',), lambda evt: evt.country),
+    'has_certificate': (('has_certificate',), lambda evt: evt.has_certificate),
+    'certificate_instructions': (('certificate_instructions',), lambda evt: evt.certificate_instructions),
+    'visibility': (('visibility',), lambda evt: evt.visibility),
+    'publish_status': (('publish_status',), lambda evt: evt.publish_status),
+    'featured': (('featured',), lambda evt: evt.featured),
+    'pricing': (('base_price',), None),
+}
+
+
+def _parse_fields(raw):
+    """
+    Interpretar el parámetro fields= (lista separada por comas)
+
+    Returns:
+        tuple: (campos solicitados o None para todos, campos desconocidos)
+    """
+    if not raw:
+        return None, []
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if name and name not in fields:
+            fields.append(name)
+    unknown = [name for name in fields if name not in EVENT_API_FIELDS]
+    return tuple(fields) or None, unknown
+
+
+def _event_load_columns(fields):
+    """Columnas mínimas de Event para serializar los campos pedidos y paginar"""
+    columns = {'id', 'start_date', 'updated_at'}
+    for name in fields:
+        columns.update(EVENT_API_FIELDS[name][0])
+    return [getattr(Event, column) for column in sorted(columns)]
+
+
+def _serialize_event(event, membership_type=None, pricing=None, fields=None):
+    data = {}
+    for name in fields or EVENT_API_FIELDS:
+        if name == 'pricing':
+            continue
+        data[name] = EVENT_API_FIELDS[name][1](event)
+
+    if fields is not None and 'pricing' not in fields:
+        return data
+    if pricing is None:
+        pricing = event.pricing_for_membership(membership_type)
     data['pricing'] = {
         'base_price': pricing['base_price'],
         'final_price': pricing['final_price'],
@@ -183,6 +233,15 @@ def _serialize_event(event, membership_type=None):
     return data
 
 
+def _invalidate_events_api_cache():
+    """Descartar las respuestas cacheadas de la API pública tras cambios en eventos o descuentos"""
+    events_api_cache.invalidate()
+
+
+# Caché de respuestas de la API pública, clave ('list', status, límite, cursor, campos, membership_type)
+# o ('detail', slug, membership_type)
+events_api_cache = ResponseCache(maxsize=512, ttl=int(os.getenv('EVENTS_API_CACHE_TTL', 60)))
+
 # Blueprints
 events_bp = Blueprint('events', __name__, url_prefix='/events')
 admin_events_bp = Blueprint('admin_events', __name__, url_prefix='/admin/events')
@@ -196,7 +255,7 @@ events_api_bp = Blueprint('events_api', __name__, url_prefix='/api/events')
 @login_required
 def list_events():
     ensure_models()
-    membership = current_user.get_active_membership()
+    membership = current_user.get_membership_tier()
     membership_type = membership.membership_type if membership else None
     status = request.args.get('status', 'published')
     category = request.args.get('category', '').strip()
@@ -217,6 +276,7 @@ def list_events():
     return render_template(
         'events/list.html',
         events=events,
+        pricing_matrix=EventPricingMatrix.load(events),
         categories=categories,
         active_category=category,
         search=search,
@@ -231,7 +291,7 @@ def list_events():
 def event_detail(slug):
     ensure_models()
     event = Event.query.filter_by(slug=slug).first_or_404()
-    membership = current_user.get_active_membership()
+    membership = current_user.get_membership_tier()
     membership_type = membership.membership_type if membership else None
     pricing = event.pricing_for_membership(membership_type)
     
@@ -241,16 +301,11 @@ def event_detail(slug):
         user_id=current_user.id
     ).first() if EventRegistration else None
     
-    # Verificar capacidad disponible
-    is_full = False
-    available_spots = None
-    if event.capacity and event.capacity > 0:
-        registered_count = EventRegistration.query.filter_by(
-            event_id=event.id,
-            registration_status='confirmed'
-        ).count() if EventRegistration else 0
-        available_spots = event.capacity - registered_count
-        is_full = available_spots <= 0
+    # Cupos libres según el mismo contador que usa la reserva: las inscripciones
+    # pendientes de pago también ocupan cupo, así que no se ofrecen plazas que
+    # register_to_event rechazaría
+    available_spots = event.available_seats()
+    is_full = available_spots is not None and available_spots <= 0
     
     return render_template(
         'events/detail.html',
@@ -269,7 +324,7 @@ def register_to_event(slug):
     """Registrar usuario a un evento"""
     ensure_models()
     event = Event.query.filter_by(slug=slug).first_or_404()
-    membership = current_user.get_active_membership()
+    membership = current_user.get_membership_tier()
     membership_type = membership.membership_type if membership else None
     
     # Verificar si ya está registrado
@@ -282,15 +337,11 @@ def register_to_event(slug):
         flash('Ya estás registrado en este evento.', 'info')
         return redirect(url_for('events.event_detail', slug=slug))
     
-    # Verificar capacidad
-    if event.capacity and event.capacity > 0:
-        registered_count = EventRegistration.query.filter_by(
-            event_id=event.id,
-            registration_status='confirmed'
-        ).count() if EventRegistration else 0
-        if registered_count >= event.capacity:
-            flash('Lo sentimos, este evento ya está lleno.', 'error')
-            return redirect(url_for('events.event_detail', slug=slug))
+    # Reservar cupo de forma atómica (queda tomado hasta el commit)
+    if not event.reserve_seat():
+        db.session.rollback()
+        flash('Lo sentimos, este evento ya está lleno.', 'error')
+        return redirect(url_for('events.event_detail', slug=slug))
     
     # Calcular precio con descuentos
     pricing = event.pricing_for_membership(membership_type)
@@ -311,11 +362,6 @@ def register_to_event(slug):
     
     db.session.add(registration)
     
-    # Actualizar contador de registrados
-    if event.registered_count is None:
-        event.registered_count = 0
-    event.registered_count += 1
-    
     # Log de actividad
     ActivityLog.log_activity(
         current_user.id,
@@ -326,7 +372,13 @@ def register_to_event(slug):
         request
     )
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Registro duplicado concurrente del mismo usuario: el rollback devuelve el cupo
+        db.session.rollback()
+        flash('Ya estás registrado en este evento.', 'info')
+        return redirect(url_for('events.event_detail', slug=slug))
     
     # Notificar al responsable del evento
     if NotificationEngine:
@@ -351,11 +403,18 @@ def cancel_event_registration(slug):
         flash('No tienes un registro activo para este evento.', 'error')
         return redirect(url_for('events.event_detail', slug=slug))
     
-    registration.registration_status = 'cancelled'
+    # Cancelar solo si sigue activo, para no liberar el cupo dos veces
+    cancelled = EventRegistration.query.filter(
+        EventRegistration.id == registration.id,
+        EventRegistration.registration_status != 'cancelled'
+    ).update({EventRegistration.registration_status: 'cancelled'}, synchronize_session=False)
+    db.session.expire(registration, ['registration_status'])
+    if not cancelled:
+        db.session.rollback()
+        flash('Tu registro a este evento ya estaba cancelado.', 'info')
+        return redirect(url_for('events.event_detail', slug=slug))
     
-    # Actualizar contador
-    if event.registered_count and event.registered_count > 0:
-        event.registered_count -= 1
+    event.release_seat()
     
     # Log de actividad
     ActivityLog.log_activity(
@@ -394,14 +453,13 @@ def confirm_event_registration(event_id, registration_id):
     old_status = registration.registration_status
     registration.registration_status = 'confirmed'
     
-    # Enviar email de confirmación al usuario
+    # Encolar email de confirmación al usuario
     try:
-        from flask_mail import Message
-        from app import mail
-        msg = Message(
+        from app import email_queue
+        email_queue.enqueue(
             subject=f'[RelaticPanama] Registro confirmado: {event.title}',
             recipients=[user.email],
-            html=f"""
+            html_content=f"""
             <h2>¡Registro Confirmado!</h2>
             <p>Hola {user.first_name},</p>
             <p>Tu registro al evento <strong>{event.title}</strong> ha sido confirmado.</p>
@@ -413,13 +471,17 @@ def confirm_event_registration(event_id, registration_id):
             </ul>
             <p>Te esperamos en el evento. Si tienes alguna pregunta, no dudes en contactarnos.</p>
             <p>Saludos,<br>Equipo RelaticPanama</p>
-            """
+            """,
+            email_type='event_confirmation',
+            related_entity_type='event',
+            related_entity_id=event.id,
+            recipient_id=user.id,
+            recipient_name=f"{user.first_name} {user.last_name}"
         )
-        mail.send(msg)
         registration.confirmation_email_sent = True
         registration.confirmation_email_sent_at = datetime.utcnow()
     except Exception as e:
-        print(f"Error enviando email de confirmación: {e}")
+        print(f"Error encolando email de confirmación: {e}")
     
     # Notificar al responsable del evento
     if NotificationEngine:
@@ -443,30 +505,174 @@ def confirm_event_registration(event_id, registration_id):
 # ------------------------------------------------------------------------------
 # API pública
 # ------------------------------------------------------------------------------
+def _last_modified(events):
+    stamps = [evt.updated_at for evt in events if evt.updated_at]
+    return max(stamps) if stamps else None
+
+
+def _encode_cursor(event):
+    """Cursor opaco con la posición (start_date, id) del último evento de la página"""
+    raw = f"{event.start_date.isoformat()}|{event.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    """Devuelve (start_date, id) o None si el cursor no es válido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        start_date, event_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(start_date), int(event_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+
+
+# Tamaño de página por defecto y máximo de la API pública
+EVENTS_API_PAGE_SIZE = int(os.getenv('EVENTS_API_PAGE_SIZE', 50))
+EVENTS_API_MAX_PAGE_SIZE = int(os.getenv('EVENTS_API_MAX_PAGE_SIZE', 200))
+
+
 @events_api_bp.route('/', methods=['GET'])
 def api_events():
+    """
+    Listado público paginado por cursor (keyset sobre start_date, id)
+
+    Parámetros: status, membership_type, limit (tamaño de página), cursor
+    (valor next_cursor de la página anterior) y fields (campos separados por comas)
+    """
     ensure_models()
     status = request.args.get('status', 'published')
-    limit = request.args.get('limit', type=int)
+    limit = request.args.get('limit', type=int) or EVENTS_API_PAGE_SIZE
+    limit = max(1, min(limit, EVENTS_API_MAX_PAGE_SIZE))
     membership_type = request.args.get('membership_type')
+    cursor = request.args.get('cursor') or None
+
+    fields, unknown = _parse_fields(request.args.get('fields'))
+    if unknown:
+        return jsonify({'error': f"Campos desconocidos: {', '.join(unknown)}"}), 400
+
+    position = None
+    if cursor:
+        position = _decode_cursor(cursor)
+        if position is None:
+            return jsonify({'error': 'Cursor inválido'}), 400
+
+    cache_key = ('list', status, limit, cursor, fields, membership_type)
+    cached = events_api_cache.get(cache_key)
+    if cached is None:
+        query = Event.query
+        if fields is not None:
+            query = query.options(load_only(*_event_load_columns(fields)))
+        if status != 'all':
+            query = query.filter(Event.publish_status == status)
+        if position is not None:
+            start_date, event_id = position
+            query = query.filter(or_(
+                Event.start_date > start_date,
+                and_(Event.start_date == start_date, Event.id > event_id)
+            ))
+        # Una fila extra indica si existe página siguiente
+        events = query.order_by(Event.start_date.asc(), Event.id.asc()).limit(limit + 1).all()
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        pricing_matrix = None
+        if fields is None or 'pricing' in fields:
+            pricing_matrix = EventPricingMatrix.load(events)
+        body = jsonify({
+            'events': [
+                _serialize_event(
+                    evt,
+                    membership_type,
+                    pricing_matrix.pricing(evt, membership_type) if pricing_matrix else None,
+                    fields
+                )
+                for evt in events
+            ],
+            'next_cursor': _encode_cursor(events[-1]) if has_more else None,
+        }).get_data()
+        cached = events_api_cache.set(cache_key, body, _last_modified(events))
+
+    return events_api_cache.make_response(cached)
+
+
+# Columnas que necesita el calendario del dashboard
+CALENDAR_COLUMNS = ('id', 'title', 'slug', 'start_date', 'end_date', 'featured',
+                    'category', 'location', 'is_virtual', 'updated_at')
+
+
+def _calendar_event(event):
+    """Evento en el formato de FullCalendar"""
+    color = '#dc3545' if event.featured else '#008ee2'
+    return {
+        'id': event.id,
+        'title': event.title,
+        'start': _iso(event.start_date),
+        'end': _iso(event.end_date),
+        'url': url_for('events.event_detail', slug=event.slug),
+        'backgroundColor': color,
+        'borderColor': color,
+        'textColor': '#ffffff',
+        'extendedProps': {
+            'category': event.category or '',
+            'location': event.location or '',
+            'is_virtual': bool(event.is_virtual),
+        },
+    }
 
-    query = Event.query
-    if status != 'all':
-        query = query.filter(Event.publish_status == status)
-    query = query.order_by(Event.start_date.asc())
-    if limit:
-        query = query.limit(limit)
 
-    events = query.all()
-    return jsonify({'events': [_serialize_event(evt, membership_type) for evt in events]})
+@events_api_bp.route('/calendar', methods=['GET'])
+def api_events_calendar():
+    """
+    Eventos publicados que se solapan con un mes (?month=AAAA-MM, por defecto el actual)
+
+    Solo carga las columnas del calendario y la respuesta se cachea por mes,
+    así el coste no crece con el histórico de eventos.
+    """
+    ensure_models()
+    month = request.args.get('month') or datetime.utcnow().strftime('%Y-%m')
+    try:
+        if not re.fullmatch(r'\d{4}-\d{2}', month):
+            raise ValueError(month)
+        month_start = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': 'Mes inválido, use el formato AAAA-MM'}), 400
+    month_end = (month_start + timedelta(days=32)).replace(day=1)
+
+    cache_key = ('calendar', month)
+    cached = events_api_cache.get(cache_key)
+    if cached is None:
+        # Dos rangos por índice: los que empiezan en el mes (por start_date) y los que
+        # empezaron antes y siguen en curso (por end_date, que no recorre el histórico)
+        events = Event.query.options(load_only(*[getattr(Event, c) for c in CALENDAR_COLUMNS])).filter(
+            Event.publish_status == 'published',
+            or_(
+                and_(Event.start_date >= month_start, Event.start_date < month_end),
+                and_(Event.end_date >= month_start, Event.start_date < month_start)
+            )
+        ).order_by(Event.start_date.asc(), Event.id.asc()).all()
+        body = jsonify({
+            'month': month,
+            'events': [_calendar_event(evt) for evt in events],
+        }).get_data()
+        cached = events_api_cache.set(cache_key, body, _last_modified(events))
+
+    return events_api_cache.make_response(cached)
 
 
 @events_api_bp.route('/<string:slug>', methods=['GET'])
 def api_event_detail(slug):
     ensure_models()
-    event = Event.query.filter_by(slug=slug).first_or_404()
     membership_type = request.args.get('membership_type')
-    return jsonify({'event': _serialize_event(event, membership_type)})
+
+    cache_key = ('detail', slug, membership_type)
+    cached = events_api_cache.get(cache_key)
+    if cached is None:
+        event = Event.query.filter_by(slug=slug).first_or_404()
+        body = jsonify({'event': _serialize_event(event, membership_type)}).get_data()
+        cached = events_api_cache.set(cache_key, body, event.updated_at)
+
+    return events_api_cache.make_response(cached)
 
 
 # ------------------------------------------------------------------------------
@@ -633,6 +839,7 @@ def create_event():
                 ))
 
         db.session.commit()
+        _invalidate_events_api_cache()
         ActivityLog.log_activity(
             current_user.id,
             'create_event',
@@ -753,6 +960,7 @@ def edit_event(event_id):
                 ))
 
         db.session.commit()
+        _invalidate_events_api_cache()
         ActivityLog.log_activity(
             current_user.id,
             'update_event',
@@ -794,6 +1002,7 @@ def delete_event(event_id):
 
     db.session.delete(event)
     db.session.commit()
+    _invalidate_events_api_cache()
 
     ActivityLog.log_activity(
         current_user.id,
@@ -844,6 +1053,7 @@ def create_discount():
         )
         db.session.add(discount)
         db.session.commit()
+        _invalidate_events_api_cache()
 
         ActivityLog.log_activity(
             current_user.id,
@@ -880,6 +1090,7 @@ def edit_discount(discount_id):
         discount.end_date = _parse_datetime('end_date')
 
         db.session.commit()
+        _invalidate_events_api_cache()
         ActivityLog.log_activity(
             current_user.id,
             'update_discount',
@@ -902,6 +1113,7 @@ def delete_discount(discount_id):
     name = discount.name
     db.session.delete(discount)
     db.session.commit()
+    _invalidate_events_api_cache()
 
     ActivityLog.log_activity(
         current_user.id,
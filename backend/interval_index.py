@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Índice en memoria de intervalos ocupados por asesor
+Se construye con una sola consulta (slots + citas activas) y responde
+"¿[start, end) colisiona?" en O(log n) mediante búsqueda binaria
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+
+
+class IntervalIndex:
+    """Intervalos ocupados fusionados en una lista disjunta y ordenada"""
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def collides(self, start, end):
+        """¿Se solapa [start, end) con algún intervalo ocupado?"""
+        i = bisect_right(self.starts, start)
+        if i > 0 and self.ends[i - 1] > start:
+            return True
+        return i < len(self.starts) and self.starts[i] < end
+
+    def add(self, start, end):
+        """Marcar [start, end) como ocupado, fusionando con los vecinos que toque"""
+        i = bisect_right(self.starts, start)
+        if i > 0 and self.ends[i - 1] >= start:
+            i -= 1
+            start = self.starts[i]
+        j = i
+        while j < len(self.starts) and self.starts[j] <= end:
+            end = max(end, self.ends[j])
+            j += 1
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+
+class AdvisorIntervalIndex:
+    """Un IntervalIndex por asesor con sus slots y citas no canceladas"""
+
+    def __init__(self):
+        self.advisors = defaultdict(IntervalIndex)
+
+    @classmethod
+    def load(cls, advisor_ids, start, end, include_slots=True, exclude_slot_id=None):
+        """
+        Construir el índice para el rango [start, end) con una única consulta
+
+        Args:
+            advisor_ids: Asesores a indexar
+            start, end: Rango de fechas (UTC) que interesa consultar
+            include_slots: Incluir los slots publicados además de las citas
+            exclude_slot_id: Ignorar este slot y las citas asociadas a él
+        """
+        from app import db, AppointmentSlot, Appointment
+
+        index = cls()
+        advisor_ids = list(advisor_ids)
+        if not advisor_ids:
+            return index
+
+        appointments = db.select(
+            Appointment.advisor_id, Appointment.start_datetime, Appointment.end_datetime
+        ).where(
+            Appointment.advisor_id.in_(advisor_ids),
+            Appointment.status != 'cancelled',
+            Appointment.end_datetime > start,
+            Appointment.start_datetime < end
+        )
+        if exclude_slot_id is not None:
+            appointments = appointments.where(db.or_(
+                Appointment.slot_id.is_(None),
+                Appointment.slot_id != exclude_slot_id
+            ))
+
+        statement = appointments
+        if include_slots:
+            slots = db.select(
+                AppointmentSlot.advisor_id, AppointmentSlot.start_datetime, AppointmentSlot.end_datetime
+            ).where(
+                AppointmentSlot.advisor_id.in_(advisor_ids),
+                AppointmentSlot.end_datetime > start,
+                AppointmentSlot.start_datetime < end
+            )
+            if exclude_slot_id is not None:
+                slots = slots.where(AppointmentSlot.id != exclude_slot_id)
+            statement = db.union_all(slots, appointments)
+
+        intervals = defaultdict(list)
+        for advisor_id, busy_start, busy_end in db.session.execute(statement):
+            intervals[advisor_id].append((busy_start, busy_end))
+        for advisor_id, busy in intervals.items():
+            index.advisors[advisor_id] = IntervalIndex(busy)
+        return index
+
+    def collides(self, advisor_id, start, end):
+        index = self.advisors.get(advisor_id)
+        return index is not None and index.collides(start, end)
+
+    def add(self, advisor_id, start, end):
+        self.advisors[advisor_id].add(start, end)
+
+    def reserve(self, advisor_id, start, end):
+        """Marcar el intervalo como ocupado si está libre; devuelve False si colisiona"""
+        if self.collides(advisor_id, start, end):
+            return False
+        self.add(advisor_id, start, end)
+        return True
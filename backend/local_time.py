@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Conversión entre la hora local de la organización y UTC
+Las fechas de slots y citas se guardan como UTC naive (igual que
+datetime.utcnow(), con el que se comparan en filtros y recordatorios); se
+convierten a hora local solo al leer formularios y al mostrarlas
+
+La zona por defecto es app.config['APP_TIMEZONE'] dentro de la aplicación y
+la variable de entorno APP_TIMEZONE en scripts sin contexto de Flask
+"""
+
+import os
+from datetime import timezone as dt_timezone
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    try:
+        from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    except ImportError:
+        ZoneInfo = None
+        ZoneInfoNotFoundError = Exception
+
+
+DEFAULT_TIMEZONE = os.getenv('APP_TIMEZONE', 'America/Panama')
+_timezones = {}
+
+
+def default_timezone_name():
+    """APP_TIMEZONE de la aplicación activa o, fuera de ella, DEFAULT_TIMEZONE"""
+    from flask import current_app, has_app_context
+
+    if has_app_context():
+        return current_app.config.get('APP_TIMEZONE') or DEFAULT_TIMEZONE
+    return DEFAULT_TIMEZONE
+
+
+def resolve_timezone(name=None):
+    """Zona horaria por nombre (None = zona por defecto); devuelve None si no se puede resolver (UTC)"""
+    name = name or default_timezone_name()
+    if name not in _timezones:
+        tz = None
+        if ZoneInfo is not None:
+            try:
+                tz = ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                print(f"⚠️ Zona horaria desconocida '{name}', se usará UTC")
+        else:
+            print(f"⚠️ zoneinfo no disponible, la zona '{name}' se tratará como UTC")
+        _timezones[name] = tz
+    return _timezones[name]
+
+
+def to_utc(local_dt, tz):
+    """Hora local naive -> datetime UTC naive (como se guarda en la base de datos)"""
+    if local_dt is None or tz is None:
+        return local_dt
+    return local_dt.replace(tzinfo=tz).astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+
+def to_local(utc_dt, tz):
+    """datetime UTC naive guardado -> hora local naive para mostrar"""
+    if utc_dt is None or tz is None:
+        return utc_dt
+    return utc_dt.replace(tzinfo=dt_timezone.utc).astimezone(tz).replace(tzinfo=None)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Datos del dashboard del miembro con un número fijo de consultas
+Los contadores salen de una sola consulta agregada y las listas de próximas
+citas y eventos se cargan con sus relaciones, para que la plantilla no
+dispare consultas perezosas por cada fila
+"""
+
+from datetime import datetime
+
+from sqlalchemy.orm import contains_eager, joinedload
+
+
+def load_dashboard(user, now=None, upcoming_limit=5):
+    """
+    Contadores y próximas citas/eventos del usuario en tres consultas
+
+    Returns:
+        dict con upcoming_appointments, past_appointments_count,
+        upcoming_events y registered_events_count
+    """
+    from app import db, Advisor, Appointment, Event, EventRegistration
+
+    now = now or datetime.utcnow()
+
+    counts = db.session.execute(db.select(
+        db.select(db.func.count(Appointment.id)).where(
+            Appointment.user_id == user.id,
+            Appointment.start_datetime < now
+        ).scalar_subquery().label('past_appointments'),
+        db.select(db.func.count(EventRegistration.id)).where(
+            EventRegistration.user_id == user.id,
+            EventRegistration.registration_status == 'confirmed'
+        ).scalar_subquery().label('registered_events'),
+    )).one()
+
+    upcoming_appointments = Appointment.query.options(
+        joinedload(Appointment.appointment_type),
+        joinedload(Appointment.advisor_profile).joinedload(Advisor.user)
+    ).filter(
+        Appointment.user_id == user.id,
+        Appointment.start_datetime >= now,
+        Appointment.status.in_(['pending', 'confirmed'])
+    ).order_by(Appointment.start_datetime.asc()).limit(upcoming_limit).all()
+
+    upcoming_events = EventRegistration.query.join(EventRegistration.event).options(
+        contains_eager(EventRegistration.event)
+    ).filter(
+        EventRegistration.user_id == user.id,
+        EventRegistration.registration_status == 'confirmed',
+        Event.start_date >= now
+    ).order_by(Event.start_date.asc()).limit(upcoming_limit).all()
+
+    return {
+        'upcoming_appointments': upcoming_appointments,
+        'past_appointments_count': counts.past_appointments,
+        'upcoming_events': upcoming_events,
+        'registered_events_count': counts.registered_events,
+    }
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Caché de proceso para el tipo de membresía activa de cada usuario
+LRU con TTL: cada entrada caduca al cumplirse el TTL o al llegar el end_date
+de la membresía, lo que ocurra primero
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+
+# Resumen de la membresía activa: tipo, vencimiento y registro de origen
+MembershipTier = namedtuple('MembershipTier', ['membership_type', 'end_date', 'source', 'record_id'])
+
+
+class MembershipCache:
+    """Mapa user_id -> MembershipTier (o None si no tiene membresía), seguro entre hilos"""
+
+    def __init__(self, maxsize=10000, ttl=60):
+        """
+        Args:
+            maxsize: Número máximo de usuarios en caché (se descartan los menos usados)
+            ttl: Segundos máximos de vida de una entrada
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """
+        Returns:
+            tuple: (encontrado, MembershipTier o None)
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return True, entry[0]
+
+    def set(self, user_id, tier):
+        """Guardar el resumen de membresía (None = usuario sin membresía activa)"""
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        if tier is not None and tier.end_date and tier.end_date < expires_at:
+            expires_at = tier.end_date
+        with self._lock:
+            self._entries[user_id] = (tier, expires_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
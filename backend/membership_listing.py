@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Listado unificado de membresías (tabla Membership heredada) y suscripciones
+Ambas fuentes se leen con una sola consulta UNION ALL que ya trae los datos
+del usuario, paginada por cursor sobre (created_at, origen, id), de modo que
+el coste de cada página no depende de cuántas filas haya antes
+
+created_at admite NULL (filas antiguas insertadas a mano): esas filas van al
+final del listado, ordenadas por origen e id, y se leen con su propia
+consulta por rama para no perder el índice de las filas con fecha
+"""
+
+import base64
+import binascii
+import csv
+import io
+from datetime import datetime, timedelta
+
+
+MEMBERSHIP_SOURCES = ('subscription', 'membership')
+MEMBERSHIP_STATUSES = ('active', 'expired', 'cancelled', 'inactive')
+
+CSV_COLUMNS = (
+    ('source', 'Origen'),
+    ('id', 'ID'),
+    ('user_id', 'ID Usuario'),
+    ('email', 'Email'),
+    ('first_name', 'Nombre'),
+    ('last_name', 'Apellido'),
+    ('membership_type', 'Tipo'),
+    ('status', 'Estado'),
+    ('start_date', 'Fecha Inicio'),
+    ('end_date', 'Fecha Fin'),
+    ('amount', 'Monto'),
+    ('payment_status', 'Pago'),
+    ('created_at', 'Creada'),
+)
+
+
+def encode_cursor(row):
+    """Cursor opaco con la posición (created_at, origen, id) de la última fila de la página"""
+    created_at = row['created_at'].isoformat() if row['created_at'] is not None else ''
+    raw = f"{created_at}|{row['source']}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Devuelve (created_at, origen, id) o None si el cursor no es válido (created_at None = fila sin fecha)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, source, row_id = raw.split('|')
+        if source not in MEMBERSHIP_SOURCES:
+            return None
+        return (datetime.fromisoformat(created_at) if created_at else None), source, int(row_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+
+
+def parse_filters(args):
+    """
+    Leer los filtros de la query string
+
+    Returns:
+        dict con source, status, membership_type y expires_within (días o None)
+    """
+    source = args.get('source', 'all')
+    status = args.get('status', 'all')
+    expires_within = args.get('expires_within', type=int)
+    return {
+        'source': source if source in MEMBERSHIP_SOURCES else 'all',
+        'status': status if status in MEMBERSHIP_STATUSES else 'all',
+        'membership_type': args.get('type', 'all') or 'all',
+        'expires_within': expires_within if expires_within and expires_within > 0 else None,
+    }
+
+
+def _keyset(created_at, row_id, source, cursor, dated):
+    """
+    Condición de "después del cursor" para una rama; el origen es constante en cada rama
+
+    dated indica si la consulta lee las filas con created_at o las que no lo
+    tienen, que van siempre después de todas las fechadas.
+    """
+    from app import db
+
+    if cursor is None:
+        return None
+    cursor_created, cursor_source, cursor_id = cursor
+    if not dated:
+        if cursor_created is not None:
+            return None
+        if source == cursor_source:
+            return row_id < cursor_id
+        return db.true() if source < cursor_source else db.false()
+    if cursor_created is None:
+        return db.false()
+    if source == cursor_source:
+        return db.or_(created_at < cursor_created, db.and_(created_at == cursor_created, row_id < cursor_id))
+    # Orden descendente por origen: 'subscription' va antes que 'membership' a igual fecha
+    if source < cursor_source:
+        return created_at <= cursor_created
+    return created_at < cursor_created
+
+
+def _ordered_parts(query, created_at, row_id, source, cursor, limit):
+    """Filas con fecha (índice por created_at) y sin fecha (por id) de una rama, cada una limitada"""
+    parts = []
+    for dated in (True, False):
+        part = query.where(created_at.isnot(None) if dated else created_at.is_(None))
+        after = _keyset(created_at, row_id, source, cursor, dated)
+        if after is not None:
+            part = part.where(after)
+        order = (created_at.desc(), row_id.desc()) if dated else (row_id.desc(),)
+        parts.append(part.order_by(*order).limit(limit))
+    return parts
+
+
+def _subscription_branch(filters, cursor, limit, now):
+    from app import db, User, Payment, Subscription
+
+    status = db.case(
+        (db.and_(Subscription.status == 'active', Subscription.end_date < now), 'expired'),
+        else_=Subscription.status
+    )
+    query = db.select(
+        db.literal('subscription').label('source'),
+        Subscription.id.label('id'),
+        Subscription.user_id.label('user_id'),
+        User.email.label('email'),
+        User.first_name.label('first_name'),
+        User.last_name.label('last_name'),
+        Subscription.membership_type.label('membership_type'),
+        status.label('status'),
+        Subscription.start_date.label('start_date'),
+        Subscription.end_date.label('end_date'),
+        (db.func.coalesce(Payment.amount, 0) / 100.0).label('amount'),
+        Payment.status.label('payment_status'),
+        Subscription.created_at.label('created_at'),
+    ).join(User, Subscription.user_id == User.id).outerjoin(Payment, Subscription.payment_id == Payment.id)
+
+    if filters['status'] == 'active':
+        query = query.where(Subscription.status == 'active', Subscription.end_date >= now)
+    elif filters['status'] == 'expired':
+        query = query.where(db.or_(
+            Subscription.status == 'expired',
+            db.and_(Subscription.status == 'active', Subscription.end_date < now)
+        ))
+    elif filters['status'] in ('cancelled', 'inactive'):
+        query = query.where(Subscription.status == 'cancelled')
+    if filters['membership_type'] != 'all':
+        query = query.where(Subscription.membership_type == filters['membership_type'])
+    if filters['expires_within']:
+        query = query.where(
+            Subscription.end_date >= now,
+            Subscription.end_date <= now + timedelta(days=filters['expires_within'])
+        )
+    return _ordered_parts(query, Subscription.created_at, Subscription.id, 'subscription', cursor, limit)
+
+
+def _membership_branch(filters, cursor, limit, now):
+    from app import db, User, Membership
+
+    status = db.case(
+        (Membership.is_active == False, 'inactive'),  # noqa
+        (Membership.end_date < now, 'expired'),
+        else_='active'
+    )
+    query = db.select(
+        db.literal('membership').label('source'),
+        Membership.id.label('id'),
+        Membership.user_id.label('user_id'),
+        User.email.label('email'),
+        User.first_name.label('first_name'),
+        User.last_name.label('last_name'),
+        Membership.membership_type.label('membership_type'),
+        status.label('status'),
+        Membership.start_date.label('start_date'),
+        Membership.end_date.label('end_date'),
+        Membership.amount.label('amount'),
+        Membership.payment_status.label('payment_status'),
+        Membership.created_at.label('created_at'),
+    ).join(User, Membership.user_id == User.id)
+
+    if filters['status'] == 'active':
+        query = query.where(Membership.is_active == True, Membership.end_date >= now)  # noqa
+    elif filters['status'] == 'expired':
+        query = query.where(Membership.is_active == True, Membership.end_date < now)  # noqa
+    elif filters['status'] in ('cancelled', 'inactive'):
+        query = query.where(Membership.is_active == False)  # noqa
+    if filters['membership_type'] != 'all':
+        query = query.where(Membership.membership_type == filters['membership_type'])
+    if filters['expires_within']:
+        query = query.where(
+            Membership.end_date >= now,
+            Membership.end_date <= now + timedelta(days=filters['expires_within'])
+        )
+    return _ordered_parts(query, Membership.created_at, Membership.id, 'membership', cursor, limit)
+
+
+def fetch_page(filters, limit=50, cursor=None, now=None):
+    """
+    Una página del listado unificado, con una sola consulta
+
+    Cada rama se ordena y limita por su cuenta (usando el índice por created_at)
+    antes de unirlas, así la base de datos nunca ordena más de 4 * (limit + 1) filas
+    (filas con y sin fecha de cada origen).
+
+    Returns:
+        (rows, next_cursor): rows es una lista de diccionarios; next_cursor es None en la última página
+    """
+    from app import db
+
+    now = now or datetime.utcnow()
+    parts = []
+    if filters['source'] in ('all', 'subscription'):
+        parts += _subscription_branch(filters, cursor, limit + 1, now)
+    if filters['source'] in ('all', 'membership'):
+        parts += _membership_branch(filters, cursor, limit + 1, now)
+
+    union = db.union_all(*[db.select(part.subquery()) for part in parts]).subquery()
+    statement = db.select(union).order_by(
+        union.c.created_at.desc().nulls_last(), union.c.source.desc(), union.c.id.desc()
+    ).limit(limit + 1)
+
+    rows = [dict(row._mapping) for row in db.session.execute(statement)]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def iter_csv(filters, batch_size=1000):
+    """Generar el CSV por lotes de batch_size filas, sin cargar el listado completo en memoria"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    writer.writerow([title for _, title in CSV_COLUMNS])
+    yield flush()
+
+    now = datetime.utcnow()
+    cursor = None
+    while True:
+        rows, next_cursor = fetch_page(filters, limit=batch_size, cursor=cursor, now=now)
+        for row in rows:
+            writer.writerow([
+                row[key].isoformat() if isinstance(row[key], datetime) else
+                ('' if row[key] is None else row[key])
+                for key, _ in CSV_COLUMNS
+            ])
+        yield flush()
+        if not next_cursor:
+            break
+        cursor = decode_cursor(next_cursor)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Acumulados diarios y mensuales de ingresos y membresías por tipo de membresía
+Se actualizan de forma incremental dentro de la misma transacción que cambia
+el estado (pagos, suscripciones, vencimientos), de modo que los gráficos del
+admin leen O(días) filas en lugar de recorrer pagos y suscripciones
+"""
+
+import sys
+from datetime import date, datetime
+
+from sqlalchemy.orm import aliased
+
+
+ROLLUP_COUNTERS = ('revenue_cents', 'payments', 'new_members', 'renewals', 'churned')
+
+
+def _as_date(value):
+    """db.func.date() devuelve texto en SQLite y date en PostgreSQL"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _upsert(model, key_column, key, membership_type, deltas):
+    """Sumar deltas a la fila (clave, membership_type), creándola si no existe"""
+    from app import db
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        values = {counter: deltas.get(counter, 0) for counter in ROLLUP_COUNTERS}
+        statement = insert(table).values({key_column: key, 'membership_type': membership_type, **values})
+        statement = statement.on_conflict_do_update(
+            index_elements=[key_column, 'membership_type'],
+            set_={counter: table.c[counter] + statement.excluded[counter] for counter in deltas}
+        )
+        db.session.execute(statement)
+        return
+
+    # Otros motores: UPDATE atómico y, si la fila aún no existe, INSERT
+    updated = model.query.filter(
+        getattr(model, key_column) == key,
+        model.membership_type == membership_type
+    ).update({
+        getattr(model, counter): getattr(model, counter) + delta for counter, delta in deltas.items()
+    }, synchronize_session=False)
+    if not updated:
+        values = {counter: deltas.get(counter, 0) for counter in ROLLUP_COUNTERS}
+        db.session.add(model(**{key_column: key, 'membership_type': membership_type}, **values))
+
+
+def bump(day, membership_type, **deltas):
+    """
+    Incrementar los contadores de un día (y de su mes). No hace commit: debe
+    ejecutarse en la misma transacción que el cambio de estado que registra.
+    """
+    from app import MembershipDailyStat, MembershipMonthlyStat
+
+    deltas = {counter: delta for counter, delta in deltas.items() if delta}
+    if not deltas or not membership_type:
+        return
+    _upsert(MembershipDailyStat, 'day', day, membership_type, deltas)
+    _upsert(MembershipMonthlyStat, 'month', day.replace(day=1), membership_type, deltas)
+
+
+def _created_day(row):
+    """
+    Día de created_at de la fila, el mismo que agrupa backfill(); si la fila
+    aún no se insertó se fija ahora para que ambos caminos coincidan
+    """
+    if row.created_at is None:
+        row.created_at = datetime.utcnow()
+    return row.created_at.date()
+
+
+def record_payment(payment):
+    """Registrar un pago exitoso en el día de creación del pago (igual que backfill)"""
+    bump(_created_day(payment), payment.membership_type, revenue_cents=payment.amount or 0, payments=1)
+
+
+def record_subscription(subscription):
+    """Registrar una suscripción nueva: alta si es la primera del usuario, renovación si no"""
+    from app import db, Subscription
+
+    with db.session.no_autoflush:
+        previous = Subscription.query.filter(Subscription.user_id == subscription.user_id)
+        if subscription.id is not None:
+            previous = previous.filter(Subscription.id != subscription.id)
+        is_renewal = db.session.query(previous.exists()).scalar()
+
+    day = _created_day(subscription)
+    if is_renewal:
+        bump(day, subscription.membership_type, renewals=1)
+    else:
+        bump(day, subscription.membership_type, new_members=1)
+
+
+def churn_counts(*criteria):
+    """
+    Bajas por (día de vencimiento, tipo) entre las suscripciones que cumplen
+    criteria: vencidas sin otra suscripción del usuario que las continúe
+    """
+    from app import db, Subscription
+
+    later = aliased(Subscription)
+    renewed = db.session.query(later.id).filter(
+        later.user_id == Subscription.user_id,
+        later.id != Subscription.id,
+        later.end_date > Subscription.end_date,
+        later.created_at <= Subscription.end_date
+    ).exists()
+    rows = db.session.query(
+        db.func.date(Subscription.end_date), Subscription.membership_type, db.func.count(Subscription.id)
+    ).filter(*criteria, ~renewed).group_by(
+        db.func.date(Subscription.end_date), Subscription.membership_type
+    ).all()
+    return [(_as_date(day), membership_type, count) for day, membership_type, count in rows]
+
+
+def record_churn(counts):
+    """Registrar bajas calculadas con churn_counts()"""
+    for day, membership_type, count in counts:
+        bump(day, membership_type, churned=count)
+
+
+def backfill():
+    """Reconstruir los acumulados desde Payment y Subscription (idempotente)"""
+    from app import db, Payment, Subscription, MembershipDailyStat, MembershipMonthlyStat
+
+    MembershipDailyStat.query.delete(synchronize_session=False)
+    MembershipMonthlyStat.query.delete(synchronize_session=False)
+
+    payments = db.session.query(
+        db.func.date(Payment.created_at), Payment.membership_type,
+        db.func.coalesce(db.func.sum(Payment.amount), 0), db.func.count(Payment.id)
+    ).filter(Payment.status == 'succeeded').group_by(
+        db.func.date(Payment.created_at), Payment.membership_type
+    ).all()
+    for day, membership_type, revenue_cents, count in payments:
+        bump(_as_date(day), membership_type, revenue_cents=revenue_cents, payments=count)
+
+    first_subscriptions = db.select(db.func.min(Subscription.id)).group_by(Subscription.user_id)
+    subscriptions = db.session.query(
+        db.func.date(Subscription.created_at), Subscription.membership_type,
+        db.func.count(Subscription.id),
+        db.func.sum(db.case((Subscription.id.in_(first_subscriptions), 1), else_=0))
+    ).group_by(
+        db.func.date(Subscription.created_at), Subscription.membership_type
+    ).all()
+    for day, membership_type, total, new_members in subscriptions:
+        new_members = new_members or 0
+        bump(_as_date(day), membership_type, new_members=new_members, renewals=total - new_members)
+
+    record_churn(churn_counts(Subscription.status == 'expired'))
+    db.session.commit()
+    print(f"✅ Acumulados reconstruidos: {MembershipDailyStat.query.count()} filas diarias, "
+          f"{MembershipMonthlyStat.query.count()} mensuales")
+
+
+def series(period='daily', start=None, end=None, membership_type=None):
+    """
+    Serie temporal para gráficos, leída solo de las tablas de acumulados
+
+    Args:
+        period: 'daily' o 'monthly'
+        start, end: Fechas límite inclusivas (opcionales)
+        membership_type: Filtrar por tipo de membresía (opcional)
+    """
+    from app import MembershipDailyStat, MembershipMonthlyStat
+
+    model, key = (MembershipMonthlyStat, 'month') if period == 'monthly' else (MembershipDailyStat, 'day')
+    column = getattr(model, key)
+    query = model.query
+    if start:
+        query = query.filter(column >= (start.replace(day=1) if period == 'monthly' else start))
+    if end:
+        query = query.filter(column <= end)
+    if membership_type:
+        query = query.filter(model.membership_type == membership_type)
+
+    return [{
+        key: getattr(row, key).isoformat(),
+        'membership_type': row.membership_type,
+        'revenue': row.revenue_cents / 100,
+        'payments': row.payments,
+        'new_members': row.new_members,
+        'renewals': row.renewals,
+        'churned': row.churned,
+    } for row in query.order_by(column.asc(), model.membership_type.asc())]
+
+
+if __name__ == '__main__':
+    # Uso: python membership_rollups.py --backfill
+    from app import app
+
+    if '--backfill' not in sys.argv:
+        print("Uso: python membership_rollups.py --backfill")
+        sys.exit(1)
+
+    with app.app_context():
+        backfill()
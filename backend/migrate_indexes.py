@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Script de migración para crear los índices declarados en los modelos
+db.create_all() solo crea índices al crear la tabla, así que las bases de
+datos existentes no los reciben; este script los agrega con
+CREATE INDEX IF NOT EXISTS (se puede ejecutar varias veces) y actualiza las
+estadísticas del planificador con ANALYZE
+"""
+import sqlite3
+from pathlib import Path
+
+# (nombre, tabla, columnas requeridas, expresión indexada) - igual que __table_args__ en app.py
+INDEXES = [
+    ('ix_user_created_at', 'user', ('created_at',), 'created_at'),
+    ('ix_user_email_lower', 'user', ('email',), 'lower(email)'),
+    ('ix_user_first_name_lower', 'user', ('first_name',), 'lower(first_name)'),
+    ('ix_user_last_name_lower', 'user', ('last_name',), 'lower(last_name)'),
+    ('ix_membership_created_at', 'membership', ('created_at', 'id'), 'created_at, id'),
+    ('ix_subscription_status_end_date', 'subscription', ('status', 'end_date'), 'status, end_date'),
+    ('ix_subscription_created_at', 'subscription', ('created_at', 'id'), 'created_at, id'),
+    ('ix_subscription_user_status_end', 'subscription', ('user_id', 'status', 'end_date'),
+     'user_id, status, end_date'),
+    ('ix_event_status_start', 'event', ('publish_status', 'start_date'), 'publish_status, start_date'),
+    ('ix_event_status_end', 'event', ('publish_status', 'end_date'), 'publish_status, end_date'),
+    ('ix_notification_user_type_created', 'notification', ('user_id', 'notification_type', 'created_at'),
+     'user_id, notification_type, created_at'),
+    ('ix_notification_user_created', 'notification', ('user_id', 'created_at', 'id'), 'user_id, created_at, id'),
+    ('ix_notification_user_read_created', 'notification', ('user_id', 'is_read', 'created_at'),
+     'user_id, is_read, created_at'),
+    ('ix_email_log_created_at', 'email_log', ('created_at',), 'created_at'),
+    ('ix_email_log_status_type_created', 'email_log', ('status', 'email_type', 'created_at'),
+     'status, email_type, created_at'),
+    ('ix_event_registration_event_status', 'event_registration', ('event_id', 'registration_status'),
+     'event_id, registration_status'),
+    ('ix_event_registration_user_event', 'event_registration', ('user_id', 'event_id'), 'user_id, event_id'),
+    ('ix_appointment_slot_type_available_start', 'appointment_slot',
+     ('appointment_type_id', 'is_available', 'start_datetime'), 'appointment_type_id, is_available, start_datetime'),
+    ('ix_appointment_status_start', 'appointment', ('status', 'start_datetime'), 'status, start_datetime'),
+    ('ix_appointment_user_start', 'appointment', ('user_id', 'start_datetime'), 'user_id, start_datetime'),
+]
+
+
+def apply_indexes(conn, verbose=True):
+    """
+    Crear los índices que falten (idempotente)
+
+    Las tablas o columnas que aún no existen se omiten: db.create_all() y
+    migrate_database.py las crean con sus índices.
+
+    Returns:
+        list: Nombres de los índices creados
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+    existing_indexes = {row[0] for row in cursor.fetchall()}
+
+    created = []
+    columns_by_table = {}
+    for name, table, columns, expression in INDEXES:
+        if name in existing_indexes:
+            continue
+        if table not in columns_by_table:
+            cursor.execute(f'PRAGMA table_info("{table}")')
+            columns_by_table[table] = {col[1] for col in cursor.fetchall()}
+        if not columns_by_table[table]:
+            if verbose:
+                print(f"⚠️  Omitiendo '{name}': la tabla '{table}' no existe")
+            continue
+        missing = [column for column in columns if column not in columns_by_table[table]]
+        if missing:
+            if verbose:
+                print(f"⚠️  Omitiendo '{name}': faltan columnas en '{table}' ({', '.join(missing)})")
+            continue
+        if verbose:
+            print(f"➕ Creando índice '{name}' en '{table}' ({expression})...")
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({expression})')
+        created.append(name)
+
+    if created:
+        # Estadísticas para que el planificador elija los índices nuevos
+        cursor.execute("ANALYZE")
+    conn.commit()
+    return created
+
+
+if __name__ == '__main__':
+    # Ruta a la base de datos
+    db_path = Path(__file__).parent / 'instance' / 'relaticpanama.db'
+
+    if not db_path.exists():
+        # Si no existe en instance, buscar en el directorio actual
+        db_path = Path(__file__).parent / 'relaticpanama.db'
+
+    if not db_path.exists():
+        print(f"❌ Base de datos no encontrada en: {db_path}")
+        exit(1)
+
+    print(f"📦 Conectando a la base de datos: {db_path}")
+
+    conn = sqlite3.connect(str(db_path))
+
+    try:
+        migrations = apply_indexes(conn)
+
+        if migrations:
+            print("\n✅ Índices creados exitosamente:")
+            for migration in migrations:
+                print(f"   - {migration}")
+        else:
+            print("\n✅ No se requieren índices nuevos. La base de datos está actualizada.")
+
+        print("\n📝 Nota: El índice de texto completo y los resúmenes mantenidos por triggers")
+        print("   se instalan con: python email_search.py --rebuild, python email_stats.py --rebuild")
+        print("   y python notification_inbox.py --rebuild")
+
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"\n❌ Error durante la migración: {e}")
+        exit(1)
+    finally:
+        conn.close()
+
+    print("\n✨ Migración completada!")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Script de migración para pasar a UTC los slots manuales y sus citas
+Antes los slots creados a mano desde el panel se guardaban con la hora local
+escrita en el formulario, mientras que los autogenerados y las comparaciones
+con datetime.utcnow() usan UTC. Este script convierte una sola vez los slots
+no autogenerados (y las citas reservadas en ellos) desde la zona horaria del
+asesor (la de sus franjas de disponibilidad o APP_TIMEZONE) a UTC
+
+Deja una marca en la tabla data_migration: una segunda ejecución no hace nada.
+Ejecutarlo al desplegar la versión que guarda los slots manuales en UTC; si se
+crearon slots manuales después del despliegue, indicar con --before la fecha
+(UTC) del despliegue para no convertirlos dos veces.
+
+Uso: python migrate_slot_timezone.py [--before "AAAA-MM-DD HH:MM"]
+"""
+import argparse
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from local_time import resolve_timezone, to_utc
+
+MIGRATION_NAME = 'manual_slots_to_utc'
+
+
+def _parse(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _ts(value):
+    """Mismo formato de fecha que guarda SQLAlchemy en SQLite"""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f') if value else None
+
+
+def _advisor_timezones(cursor):
+    """Zona horaria de cada asesor: la de sus franjas (activas primero)"""
+    cursor.execute(
+        "SELECT advisor_id, timezone FROM advisor_availability WHERE timezone IS NOT NULL "
+        "ORDER BY is_active DESC, id ASC"
+    )
+    timezones = {}
+    for advisor_id, name in cursor.fetchall():
+        timezones.setdefault(advisor_id, name)
+    return timezones
+
+
+def convert_manual_slots(conn, before=None, verbose=True):
+    """
+    Convertir a UTC los slots manuales y sus citas (una sola vez)
+
+    Args:
+        before: Solo convertir slots creados antes de esta fecha UTC (None = todos)
+
+    Returns:
+        tuple: (slots convertidos, citas convertidas) o None si ya se aplicó
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS data_migration (name VARCHAR(100) PRIMARY KEY, applied_at DATETIME NOT NULL)"
+    )
+    cursor.execute("SELECT applied_at FROM data_migration WHERE name = ?", (MIGRATION_NAME,))
+    applied = cursor.fetchone()
+    if applied:
+        if verbose:
+            print(f"✅ La conversión ya se aplicó el {applied[0]}; no hay nada que hacer")
+        return None
+
+    timezones = _advisor_timezones(cursor)
+    query = "SELECT id, advisor_id, start_datetime, end_datetime FROM appointment_slot WHERE is_auto_generated = 0"
+    params = ()
+    if before is not None:
+        query += " AND (created_at IS NULL OR created_at < ?)"
+        params = (_ts(before),)
+    cursor.execute(query, params)
+    slots = cursor.fetchall()
+
+    converted_appointments = 0
+    for slot_id, advisor_id, start, end in slots:
+        tz = resolve_timezone(timezones.get(advisor_id))
+        if verbose:
+            print(f"➕ Slot {slot_id}: {start} -> {_ts(to_utc(_parse(start), tz))} UTC")
+        cursor.execute(
+            "UPDATE appointment_slot SET start_datetime = ?, end_datetime = ? WHERE id = ?",
+            (_ts(to_utc(_parse(start), tz)), _ts(to_utc(_parse(end), tz)), slot_id)
+        )
+        cursor.execute("SELECT id, start_datetime, end_datetime FROM appointment WHERE slot_id = ?", (slot_id,))
+        for appointment_id, appointment_start, appointment_end in cursor.fetchall():
+            cursor.execute(
+                "UPDATE appointment SET start_datetime = ?, end_datetime = ? WHERE id = ?",
+                (_ts(to_utc(_parse(appointment_start), tz)), _ts(to_utc(_parse(appointment_end), tz)),
+                 appointment_id)
+            )
+            converted_appointments += 1
+
+    cursor.execute(
+        "INSERT INTO data_migration (name, applied_at) VALUES (?, ?)",
+        (MIGRATION_NAME, _ts(datetime.utcnow()))
+    )
+    conn.commit()
+    return len(slots), converted_appointments
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convierte a UTC los slots manuales y sus citas")
+    parser.add_argument('--before', type=datetime.fromisoformat, default=None,
+                        help="Solo slots creados antes de esta fecha UTC (fecha del despliegue)")
+    args = parser.parse_args()
+
+    # Ruta a la base de datos
+    db_path = Path(__file__).parent / 'instance' / 'relaticpanama.db'
+
+    if not db_path.exists():
+        # Si no existe en instance, buscar en el directorio actual
+        db_path = Path(__file__).parent / 'relaticpanama.db'
+
+    if not db_path.exists():
+        print(f"❌ Base de datos no encontrada en: {db_path}")
+        exit(1)
+
+    print(f"📦 Conectando a la base de datos: {db_path}")
+
+    conn = sqlite3.connect(str(db_path))
+
+    try:
+        result = convert_manual_slots(conn, before=args.before)
+
+        if result is not None:
+            slots, appointments = result
+            print(f"\n✅ Convertidos a UTC: {slots} slots manuales y {appointments} citas")
+
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"\n❌ Error durante la migración: {e}")
+        exit(1)
+    finally:
+        conn.close()
+
+    print("\n✨ Migración completada!")
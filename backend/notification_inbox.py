@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Bandeja de notificaciones paginada por cursor y contador de no leídas
+El contador por usuario (tabla notification_counter) lo mantienen triggers
+de la base de datos en cada INSERT, cambio de is_read y DELETE de
+notification, cubriendo tanto los inserts del ORM como los masivos de
+NotificationEngine y el "marcar todas como leídas"; el badge del navbar
+solo lee una fila por clave primaria
+"""
+
+import base64
+import binascii
+import sys
+from datetime import datetime
+
+
+_TRIGGERS = ('notification_counter_insert', 'notification_counter_delete', 'notification_counter_update')
+
+# Una notificación cuenta como no leída si is_read no es verdadero (incluye NULL)
+_SQLITE_UNREAD = "coalesce({row}.is_read, 0) = 0"
+
+
+def _sqlite_bump(row, delta):
+    return (
+        f"INSERT OR IGNORE INTO notification_counter (user_id, unread) VALUES ({row}.user_id, 0); "
+        f"UPDATE notification_counter SET unread = unread + ({delta}) WHERE user_id = {row}.user_id;"
+    )
+
+
+_SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS notification_counter_insert AFTER INSERT ON notification
+    WHEN {_SQLITE_UNREAD.format(row='new')} BEGIN
+        {_sqlite_bump('new', 1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS notification_counter_delete AFTER DELETE ON notification
+    WHEN {_SQLITE_UNREAD.format(row='old')} BEGIN
+        {_sqlite_bump('old', -1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS notification_counter_update AFTER UPDATE OF is_read, user_id ON notification
+    WHEN ({_SQLITE_UNREAD.format(row='old')}) IS NOT ({_SQLITE_UNREAD.format(row='new')})
+        OR old.user_id IS NOT new.user_id
+    BEGIN
+        UPDATE notification_counter SET unread = unread - 1
+        WHERE user_id = old.user_id AND {_SQLITE_UNREAD.format(row='old')};
+        INSERT OR IGNORE INTO notification_counter (user_id, unread) VALUES (new.user_id, 0);
+        UPDATE notification_counter SET unread = unread + 1
+        WHERE user_id = new.user_id AND {_SQLITE_UNREAD.format(row='new')};
+    END""",
+]
+
+_POSTGRES_DDL = [
+    """CREATE OR REPLACE FUNCTION notification_counter_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND NOT coalesce(OLD.is_read, false) THEN
+            UPDATE notification_counter SET unread = unread - 1 WHERE user_id = OLD.user_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NOT coalesce(NEW.is_read, false) THEN
+            INSERT INTO notification_counter (user_id, unread) VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET unread = notification_counter.unread + 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS notification_counter_insert ON notification",
+    "DROP TRIGGER IF EXISTS notification_counter_delete ON notification",
+    "DROP TRIGGER IF EXISTS notification_counter_update ON notification",
+    """CREATE TRIGGER notification_counter_insert AFTER INSERT ON notification
+        FOR EACH ROW EXECUTE PROCEDURE notification_counter_sync()""",
+    """CREATE TRIGGER notification_counter_delete AFTER DELETE ON notification
+        FOR EACH ROW EXECUTE PROCEDURE notification_counter_sync()""",
+    """CREATE TRIGGER notification_counter_update AFTER UPDATE OF is_read, user_id ON notification
+        FOR EACH ROW WHEN (coalesce(OLD.is_read, false) IS DISTINCT FROM coalesce(NEW.is_read, false)
+            OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+        EXECUTE PROCEDURE notification_counter_sync()""",
+]
+
+# Motores en los que los triggers existen (clave: URL del engine)
+_available = {}
+
+
+def _installed(connection):
+    """Triggers del contador ya presentes en la base de datos"""
+    from sqlalchemy import text
+
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))
+    else:
+        rows = connection.execute(text(
+            "SELECT tgname FROM pg_trigger WHERE tgrelid = 'notification'::regclass AND NOT tgisinternal"
+        ))
+    return {row[0] for row in rows} & set(_TRIGGERS)
+
+
+def rebuild(connection, metadata):
+    """Recalcular notification_counter desde notification (una sola consulta agrupada)"""
+    from sqlalchemy import false, func, or_, select
+
+    counter = metadata.tables['notification_counter']
+    notification = metadata.tables['notification']
+    connection.execute(counter.delete())
+    connection.execute(counter.insert().from_select(
+        ['user_id', 'unread'],
+        select(notification.c.user_id, func.count(notification.c.id)).where(or_(
+            notification.c.is_read == false(), notification.c.is_read.is_(None)
+        )).group_by(notification.c.user_id)
+    ))
+
+
+def ensure_counter_triggers(connection, metadata, rebuild_counters=False):
+    """
+    Instalar los triggers si faltan (idempotente)
+
+    La primera vez, o con rebuild_counters, recalcula los contadores en la
+    misma transacción.
+
+    Returns:
+        bool: True si el contador se mantiene con triggers en este motor
+    """
+    from sqlalchemy import text
+
+    dialect = connection.dialect.name
+    key = str(connection.engine.url)
+    if dialect not in ('sqlite', 'postgresql'):
+        _available[key] = False
+        return False
+
+    missing = len(_installed(connection)) < len(_TRIGGERS)
+    if missing:
+        for statement in (_SQLITE_DDL if dialect == 'sqlite' else _POSTGRES_DDL):
+            connection.execute(text(statement))
+    if missing or rebuild_counters:
+        rebuild(connection, metadata)
+    _available[key] = True
+    return True
+
+
+def _on_create_all(target, connection, **kw):
+    if 'notification' in target.tables and 'notification_counter' in target.tables:
+        ensure_counter_triggers(connection, target)
+
+
+def register(metadata):
+    """Instalar los triggers al terminar db.create_all() (ambas tablas ya existen)"""
+    from sqlalchemy import event
+    event.listen(metadata, 'after_create', _on_create_all)
+
+
+def is_available():
+    """¿Se mantiene el contador en la base de datos actual? Se comprueba una vez por engine"""
+    from app import db
+
+    key = str(db.engine.url)
+    if key not in _available:
+        if db.engine.dialect.name in ('sqlite', 'postgresql'):
+            with db.engine.connect() as connection:
+                _available[key] = len(_installed(connection)) == len(_TRIGGERS)
+        else:
+            _available[key] = False
+    return _available[key]
+
+
+def unread_count(user_id):
+    """No leídas del usuario: una lectura por clave primaria (COUNT si no hay triggers)"""
+    from app import db, Notification, NotificationCounter
+
+    if is_available():
+        counter = db.session.get(NotificationCounter, user_id)
+        return max(counter.unread, 0) if counter else 0
+    return Notification.query.filter(
+        Notification.user_id == user_id,
+        db.or_(Notification.is_read == False, Notification.is_read.is_(None))  # noqa
+    ).count()
+
+
+def encode_cursor(notification):
+    """Cursor opaco con la posición (created_at, id) de la última notificación de la página"""
+    created_at = notification.created_at.isoformat() if notification.created_at is not None else ''
+    raw = f"{created_at}|{notification.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Devuelve (created_at, id) o None si el cursor no es válido (created_at None = notificación sin fecha)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, notification_id = raw.rsplit('|', 1)
+        return (datetime.fromisoformat(created_at) if created_at else None), int(notification_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        return None
+
+
+def fetch_page(user_id, notification_type='all', status='all', limit=50, cursor=None):
+    """
+    Una página de la bandeja, de la más reciente a la más antigua; las
+    notificaciones sin created_at van al final, ordenadas solo por id
+
+    Args:
+        notification_type: Prefijo del tipo ('event' incluye event_registration, etc.) o 'all'
+        status: 'all', 'read' o 'unread'
+        cursor: Posición (created_at, id) devuelta por decode_cursor()
+
+    Returns:
+        (notifications, next_cursor): next_cursor es None en la última página
+    """
+    from app import db, Notification, _prefix_match
+
+    query = Notification.query.filter(Notification.user_id == user_id)
+    if notification_type and notification_type != 'all':
+        query = query.filter(_prefix_match(Notification.notification_type, notification_type))
+    if status == 'read':
+        query = query.filter(Notification.is_read == True)  # noqa
+    elif status == 'unread':
+        query = query.filter(db.or_(Notification.is_read == False, Notification.is_read.is_(None)))  # noqa
+    if cursor is not None:
+        created_at, notification_id = cursor
+        if created_at is None:
+            # El cursor ya está en la cola sin fecha: solo quedan las de id menor
+            query = query.filter(Notification.created_at.is_(None), Notification.id < notification_id)
+        else:
+            query = query.filter(db.or_(
+                Notification.created_at < created_at,
+                db.and_(Notification.created_at == created_at, Notification.id < notification_id),
+                Notification.created_at.is_(None)
+            ))
+
+    # Una fila extra indica si existe página siguiente
+    notifications = query.order_by(
+        Notification.created_at.desc().nulls_last(), Notification.id.desc()
+    ).limit(limit + 1).all()
+    next_cursor = encode_cursor(notifications[limit - 1]) if len(notifications) > limit else None
+    return notifications[:limit], next_cursor
+
+
+if __name__ == '__main__':
+    # Uso: python notification_inbox.py --rebuild
+    from app import app, db
+
+    if '--rebuild' not in sys.argv:
+        print("Uso: python notification_inbox.py --rebuild")
+        sys.exit(1)
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if ensure_counter_triggers(connection, db.metadata, rebuild_counters=True):
+                print("✅ Contadores de notificaciones no leídas reconstruidos")
+            else:
+                print("❌ El motor de base de datos no soporta los triggers del contador")
+                sys.exit(1)
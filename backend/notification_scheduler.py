@@ -4,137 +4,357 @@ Sistema de tareas programadas para notificaciones
 Verifica membresías expirando, citas próximas, etc.
 """
 
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from app import app, db, User, Subscription, Appointment, NotificationEngine, Notification
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from app import (
+    app, db, User, Subscription, Appointment, AppointmentReminder, Advisor,
+    NotificationEngine, Notification
+)
+from membership_rollups import churn_counts, record_churn
+
+
+# Días de anticipación con los que se avisa del vencimiento de una membresía
+EXPIRING_THRESHOLDS = (30, 15, 7, 1)
+
+
+def _not_notified_since(notification_type, since):
+    """Anti-join: el usuario de la suscripción no tiene notificaciones de este tipo desde `since`"""
+    return ~db.session.query(Notification.id).filter(
+        Notification.user_id == Subscription.user_id,
+        Notification.notification_type == notification_type,
+        Notification.created_at >= since
+    ).exists()
 
 
 def check_expiring_memberships():
     """Verificar membresías que están por expirar y enviar notificaciones"""
     with app.app_context():
         try:
-            # Buscar membresías que expiran en 30, 15, 7 y 1 día
-            today = datetime.utcnow().date()
-            check_dates = [
-                (today + timedelta(days=30), 30),
-                (today + timedelta(days=15), 15),
-                (today + timedelta(days=7), 7),
-                (today + timedelta(days=1), 1)
+            start_time = time.time()
+            now = datetime.utcnow()
+            today = datetime.combine(now.date(), datetime.min.time())
+
+            # Una sola consulta: rangos semiabiertos sobre end_date (usan el índice
+            # status+end_date), unida a usuarios y sin quienes ya fueron avisados hoy
+            expiring_ranges = [
+                db.and_(
+                    Subscription.end_date >= today + timedelta(days=days_left),
+                    Subscription.end_date < today + timedelta(days=days_left + 1)
+                )
+                for days_left in EXPIRING_THRESHOLDS
             ]
-            
-            for check_date, days_left in check_dates:
-                # Buscar suscripciones activas que expiran en la fecha específica
-                subscriptions = Subscription.query.filter(
-                    Subscription.status == 'active',
-                    db.func.date(Subscription.end_date) == check_date
-                ).all()
-                
-                for subscription in subscriptions:
-                    user = User.query.get(subscription.user_id)
-                    if user:
-                        # Verificar si ya se envió notificación para este día
-                        existing_notification = Notification.query.filter(
-                            Notification.user_id == user.id,
-                            Notification.notification_type == 'membership_expiring',
-                            Notification.created_at >= datetime.utcnow() - timedelta(days=1)
-                        ).first()
-                        
-                        if not existing_notification:
-                            NotificationEngine.notify_membership_expiring(user, subscription, days_left)
-                            print(f"✅ Notificación enviada a {user.email}: membresía expira en {days_left} días")
-            
-            # Verificar membresías expiradas
-            expired_subscriptions = Subscription.query.filter(
+            expiring = db.session.query(Subscription, User).join(
+                User, User.id == Subscription.user_id
+            ).filter(
                 Subscription.status == 'active',
-                db.func.date(Subscription.end_date) < today
+                db.or_(*expiring_ranges),
+                _not_notified_since('membership_expiring', today)
+            ).order_by(Subscription.end_date.asc()).all()
+
+            entries = []
+            seen_users = set()
+            for subscription, user in expiring:
+                if user.id in seen_users:
+                    continue
+                seen_users.add(user.id)
+                entries.append((user, subscription, (subscription.end_date - today).days))
+            expiring_sent = NotificationEngine.notify_memberships_expiring_bulk(entries)
+
+            # Membresías vencidas (end_date ya pasó, como en get_active_membership):
+            # avisar a quienes no se avisó hoy...
+            expired_filter = (
+                Subscription.status == 'active',
+                Subscription.end_date < now
+            )
+            expired = db.session.query(Subscription, User).join(
+                User, User.id == Subscription.user_id
+            ).filter(
+                *expired_filter,
+                _not_notified_since('membership_expired', today)
             ).all()
-            
-            for subscription in expired_subscriptions:
-                user = User.query.get(subscription.user_id)
-                if user:
-                    # Marcar suscripción como expirada
-                    subscription.status = 'expired'
-                    
-                    # Verificar si ya se envió notificación
-                    existing_notification = Notification.query.filter(
-                        Notification.user_id == user.id,
-                        Notification.notification_type == 'membership_expired',
-                        Notification.created_at >= datetime.utcnow() - timedelta(days=1)
-                    ).first()
-                    
-                    if not existing_notification:
-                        NotificationEngine.notify_membership_expired(user, subscription)
-                        print(f"✅ Notificación enviada a {user.email}: membresía expirada")
-            
+
+            # Deduplicar solo entre vencidas: el aviso "por expirar" es de otro tipo
+            expired_entries = []
+            expired_seen = set()
+            for subscription, user in expired:
+                if user.id not in expired_seen:
+                    expired_seen.add(user.id)
+                    expired_entries.append((user, subscription))
+            expired_sent = NotificationEngine.notify_memberships_expired_bulk(expired_entries)
+
+            # ...y marcarlas como expiradas con un único UPDATE. Al no pasar por el ORM
+            # no se disparan los listeners, así que se anotan los usuarios para que el
+            # commit invalide su membresía en caché
+            expired_users = {user_id for (user_id,) in db.session.query(Subscription.user_id).filter(*expired_filter).distinct()}
+            # Las bajas se suman a los acumulados en la misma transacción
+            record_churn(churn_counts(*expired_filter))
+            flipped = Subscription.query.filter(*expired_filter).update(
+                {Subscription.status: 'expired', Subscription.updated_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.session.info.setdefault('membership_dirty_users', set()).update(expired_users)
+
             db.session.commit()
-            print(f"✅ Verificación de membresías completada: {datetime.utcnow()}")
-            
+            elapsed = time.time() - start_time
+            print(f"✅ Membresías por expirar notificadas: {expiring_sent}, expiradas notificadas: {expired_sent}, marcadas como expiradas: {flipped}")
+            print(f"✅ Verificación de membresías completada en {elapsed:.2f}s: {datetime.utcnow()}")
+            return {'expiring_notified': expiring_sent, 'expired_notified': expired_sent, 'expired': flipped, 'elapsed': elapsed}
+
         except Exception as e:
             db.session.rollback()
             print(f"❌ Error verificando membresías: {e}")
 
 
+# Horas de anticipación de los recordatorios de citas y ventana de envío de cada uno
+REMINDER_OFFSETS = (24, 48)
+REMINDER_WINDOW = timedelta(hours=1)
+
+
 def check_appointment_reminders():
-    """Verificar citas próximas y enviar recordatorios"""
+    """Verificar citas próximas y enviar recordatorios (seguro de ejecutar cada minuto)"""
     with app.app_context():
         try:
-            from app import Appointment, User, AdvisorProfile
-            
-            # Buscar citas confirmadas en las próximas 24 y 48 horas
+            start_time = time.time()
             now = datetime.utcnow()
-            reminder_times = [
-                (now + timedelta(hours=24), 24),
-                (now + timedelta(hours=48), 48)
-            ]
-            
-            for reminder_time, hours_before in reminder_times:
-                # Buscar citas en el rango de tiempo (ventana de 1 hora)
-                start_window = reminder_time - timedelta(minutes=30)
-                end_window = reminder_time + timedelta(minutes=30)
-                
-                appointments = Appointment.query.filter(
-                    Appointment.status == 'confirmed',
-                    Appointment.start_datetime >= start_window,
-                    Appointment.start_datetime <= end_window
-                ).all()
-                
-                for appointment in appointments:
-                    user = User.query.get(appointment.user_id)
-                    advisor = User.query.get(appointment.advisor_id) if appointment.advisor_id else None
-                    
-                    if user and advisor:
-                        # Verificar si ya se envió recordatorio para esta hora
-                        existing_notification = Notification.query.filter(
-                            Notification.user_id == user.id,
-                            Notification.notification_type == 'appointment_reminder',
-                            Notification.created_at >= datetime.utcnow() - timedelta(hours=2)
-                        ).first()
-                        
-                        if not existing_notification:
-                            NotificationEngine.notify_appointment_reminder(appointment, user, advisor, hours_before)
-                            print(f"✅ Recordatorio enviado a {user.email}: cita en {hours_before} horas")
-            
+            advisor_user = aliased(User)
+
+            # Una sola consulta: citas confirmadas dentro de la ventana de alguna
+            # anticipación y sin entrada en el registro de recordatorios para ella
+            windows = []
+            for hours_before in REMINDER_OFFSETS:
+                due = now + timedelta(hours=hours_before)
+                already_sent = db.session.query(AppointmentReminder.id).filter(
+                    AppointmentReminder.appointment_id == Appointment.id,
+                    AppointmentReminder.offset_hours == hours_before
+                ).exists()
+                windows.append(db.and_(
+                    Appointment.start_datetime > due - REMINDER_WINDOW,
+                    Appointment.start_datetime <= due,
+                    ~already_sent
+                ))
+
+            rows = db.session.query(Appointment, User, advisor_user).join(
+                User, User.id == Appointment.user_id
+            ).join(
+                Advisor, Advisor.id == Appointment.advisor_id
+            ).join(
+                advisor_user, advisor_user.id == Advisor.user_id
+            ).filter(
+                Appointment.status == 'confirmed',
+                db.or_(*windows)
+            ).all()
+
+            entries = []
+            for appointment, user, advisor in rows:
+                for hours_before in REMINDER_OFFSETS:
+                    due = now + timedelta(hours=hours_before)
+                    if due - REMINDER_WINDOW < appointment.start_datetime <= due:
+                        entries.append((appointment, user, advisor, hours_before))
+                        break
+
+            if entries:
+                notification_ids = NotificationEngine.notify_appointment_reminders_bulk(entries)
+                # El índice único (appointment_id, offset_hours) impide duplicados si dos
+                # ejecuciones se solapan: la segunda falla al insertar y hace rollback
+                db.session.bulk_insert_mappings(AppointmentReminder, [{
+                    'appointment_id': appointment.id,
+                    'offset_hours': hours_before,
+                    'notification_id': notification_id,
+                    'sent_at': now
+                } for (appointment, _, _, hours_before), notification_id in zip(entries, notification_ids)])
+                Appointment.query.filter(
+                    Appointment.id.in_(sorted({appointment.id for appointment, _, _, _ in entries}))
+                ).update({
+                    Appointment.reminder_sent: True,
+                    Appointment.reminder_sent_at: now
+                }, synchronize_session=False)
+
             db.session.commit()
-            print(f"✅ Verificación de recordatorios de citas completada: {datetime.utcnow()}")
-            
+            for appointment, user, _, hours_before in entries:
+                print(f"✅ Recordatorio enviado a {user.email}: cita en {hours_before} horas")
+            print(f"✅ Verificación de recordatorios de citas completada en {time.time() - start_time:.2f}s: {datetime.utcnow()}")
+            return len(entries)
+
+        except IntegrityError:
+            db.session.rollback()
+            print("⚠️ Recordatorios ya registrados por otra ejecución en curso, se omite esta pasada")
         except Exception as e:
             db.session.rollback()
             print(f"❌ Error verificando recordatorios de citas: {e}")
 
 
+class TaskStats:
+    """Métricas de ejecución de una tarea programada"""
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = None
+        self.last_run_at = None
+
+    def record(self, elapsed, ok):
+        self.runs += 1
+        if not ok:
+            self.failures += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.last_time = elapsed
+        self.last_run_at = datetime.utcnow()
+
+    @property
+    def avg_time(self):
+        return self.total_time / self.runs if self.runs else 0.0
+
+    def summary(self):
+        return (f"{self.runs} ejecuciones, {self.failures} fallidas, {self.skipped} omitidas, "
+                f"media {self.avg_time:.3f}s, máx {self.max_time:.3f}s")
+
+
+# Tareas programadas: nombre -> (función, variable de entorno del intervalo, intervalo por defecto en segundos)
+SCHEDULED_TASKS = {
+    'expiring_memberships': (check_expiring_memberships, 'SCHEDULER_MEMBERSHIP_INTERVAL', 3600),
+    'appointment_reminders': (check_appointment_reminders, 'SCHEDULER_REMINDER_INTERVAL', 60),
+}
+TASK_STATS = {name: TaskStats() for name in SCHEDULED_TASKS}
+SCHEDULER_LOCK_DIR = os.getenv('SCHEDULER_LOCK_DIR', tempfile.gettempdir())
+
+
+@contextmanager
+def task_lock(name):
+    """
+    Candado entre procesos para que una tarea no se solape consigo misma
+    (daemon, cron u otra réplica). En PostgreSQL usa pg_try_advisory_lock; en
+    otras bases de datos, flock sobre un archivo de bloqueo.
+
+    Yields:
+        bool: True si se obtuvo el candado
+    """
+    if db.engine.dialect.name == 'postgresql':
+        key = zlib.crc32(f'notification_scheduler:{name}'.encode('utf-8')) & 0x7fffffff
+        with db.engine.connect() as connection:
+            acquired = connection.execute(db.text('SELECT pg_try_advisory_lock(:key)'), {'key': key}).scalar()
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    connection.execute(db.text('SELECT pg_advisory_unlock(:key)'), {'key': key})
+        return
+
+    if fcntl is None:
+        yield True
+        return
+
+    path = os.path.join(SCHEDULER_LOCK_DIR, f'relaticpanama_scheduler_{name}.lock')
+    with open(path, 'w') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def run_task(name):
+    """Ejecutar una tarea bajo su candado y registrar su tiempo"""
+    func = SCHEDULED_TASKS[name][0]
+    stats = TASK_STATS[name]
+    with app.app_context():
+        with task_lock(name) as acquired:
+            if not acquired:
+                stats.skipped += 1
+                print(f"⏭️ {name}: otra ejecución en curso, se omite")
+                return None
+            started = time.perf_counter()
+            result = func()
+            stats.record(time.perf_counter() - started, result is not None)
+    print(f"⏱️ {name}: {stats.last_time:.3f}s ({stats.summary()})")
+    return result
+
+
 def run_scheduled_tasks():
     """Ejecutar todas las tareas programadas"""
     print(f"\n{'='*60}")
     print(f"Ejecutando tareas programadas: {datetime.utcnow()}")
     print(f"{'='*60}\n")
     
-    check_expiring_memberships()
-    check_appointment_reminders()
+    for name in SCHEDULED_TASKS:
+        run_task(name)
     
     print(f"\n{'='*60}")
     print(f"Tareas programadas completadas: {datetime.utcnow()}")
     print(f"{'='*60}\n")
 
 
-if __name__ == '__main__':
-    run_scheduled_tasks()
+def run_daemon(stop_event=None):
+    """
+    Modo residente: un único proceso con la aplicación ya cargada que ejecuta
+    cada tarea en su intervalo, con una variación aleatoria (jitter) para que
+    varias réplicas no coincidan
+    """
+    stop_event = stop_event or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stop_event.set())
+
+    jitter = float(os.getenv('SCHEDULER_JITTER', 0.1))
+    intervals = {
+        name: float(os.getenv(env_var, default))
+        for name, (_, env_var, default) in SCHEDULED_TASKS.items()
+    }
+
+    def next_delay(interval):
+        return max(1.0, interval * (1 + random.uniform(-jitter, jitter)))
 
+    now = time.monotonic()
+    next_runs = {name: now + random.uniform(0, interval * jitter) for name, interval in intervals.items()}
+    print(f"✅ Scheduler residente iniciado: {', '.join(f'{name} cada {interval:.0f}s' for name, interval in intervals.items())}")
+
+    # Contexto de aplicación permanente: conexiones y configuración quedan calientes
+    with app.app_context():
+        while not stop_event.is_set():
+            name = min(next_runs, key=next_runs.get)
+            wait = next_runs[name] - time.monotonic()
+            if wait > 0:
+                stop_event.wait(wait)
+                continue
+            try:
+                run_task(name)
+            except Exception as e:
+                TASK_STATS[name].record(0.0, False)
+                print(f"❌ Error ejecutando {name}: {e}")
+            next_runs[name] = time.monotonic() + next_delay(intervals[name])
+
+    print("🛑 Scheduler residente detenido")
+    for name, stats in TASK_STATS.items():
+        print(f"   {name}: {stats.summary()}")
+
+
+if __name__ == '__main__':
+    # Uso: python notification_scheduler.py [--daemon]
+    if '--daemon' in sys.argv:
+        run_daemon()
+    else:
+        run_scheduled_tasks()
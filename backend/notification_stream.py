@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Canal de notificaciones en tiempo real (Server-Sent Events)
+Un pub/sub en memoria despierta las conexiones abiertas del usuario cuando
+se confirma una transacción que crea o cambia sus notificaciones; solo
+entonces se lee el contador de no leídas (una fila por clave primaria).
+Los cambios hechos en otros procesos (otros workers, el scheduler) se
+detectan con una relectura local cada poll_interval segundos
+"""
+
+import json
+import threading
+import time
+
+
+class NotificationBroker:
+    """Suscriptores por usuario dentro del proceso, seguro entre hilos"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Registrar una conexión; devuelve el threading.Event que se activa con cada cambio"""
+        signal = threading.Event()
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(signal)
+        return signal
+
+    def unsubscribe(self, user_id, signal):
+        with self._lock:
+            signals = self._subscribers.get(user_id)
+            if signals is not None:
+                signals.discard(signal)
+                if not signals:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_ids):
+        """Despertar las conexiones de estos usuarios (no consulta la base de datos)"""
+        with self._lock:
+            signals = [signal for user_id in user_ids for signal in self._subscribers.get(user_id, ())]
+        for signal in signals:
+            signal.set()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(signals) for signals in self._subscribers.values())
+
+
+def mark_changed(session, user_ids):
+    """Anotar usuarios con notificaciones nuevas o modificadas; se publican al confirmar"""
+    if session is not None:
+        session.info.setdefault('notification_changed_users', set()).update(
+            user_id for user_id in user_ids if user_id
+        )
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream(broker, user_id, read_unread_count, poll_interval=30, keepalive=15, max_seconds=300):
+    """
+    Generador SSE de un usuario
+
+    Envía el contador de no leídas al conectar y cada vez que cambia.
+    Entre cambios solo emite comentarios de keepalive; tras max_seconds
+    cierra la conexión y el navegador reconecta (EventSource), lo que
+    permite reciclar workers.
+
+    Args:
+        broker: NotificationBroker del proceso
+        read_unread_count: Función que devuelve el contador del usuario
+        poll_interval: Segundos entre relecturas sin aviso (cambios de otros procesos)
+        keepalive: Segundos entre comentarios que mantienen viva la conexión
+        max_seconds: Duración máxima de la conexión
+
+    Raises:
+        ValueError: Si algún intervalo no es positivo (con 0 el bucle no esperaría nunca)
+    """
+    if poll_interval <= 0 or keepalive <= 0 or max_seconds <= 0:
+        raise ValueError("poll_interval, keepalive y max_seconds deben ser mayores que 0")
+    signal = broker.subscribe(user_id)
+    started = time.monotonic()
+    try:
+        yield f"retry: {keepalive * 1000}\n\n"
+        last_count = read_unread_count()
+        yield _sse('unread', {'unread_count': last_count})
+        last_read = time.monotonic()
+
+        while time.monotonic() - started < max_seconds:
+            timeout = min(keepalive, max(0.0, poll_interval - (time.monotonic() - last_read)))
+            woken = signal.wait(timeout)
+            signal.clear()
+            if woken or time.monotonic() - last_read >= poll_interval:
+                count = read_unread_count()
+                last_read = time.monotonic()
+                if count != last_count:
+                    last_count = count
+                    yield _sse('unread', {'unread_count': count})
+                    continue
+            yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(user_id, signal)
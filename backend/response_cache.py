@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Caché en memoria de respuestas HTTP serializadas con soporte de ETag y
+Last-Modified, para endpoints públicos muy consultados
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, request
+
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'last_modified', 'mimetype'])
+
+
+class ResponseCache:
+    """LRU con TTL de cuerpos de respuesta ya serializados, seguro entre hilos"""
+
+    def __init__(self, maxsize=512, ttl=60):
+        """
+        Args:
+            maxsize: Número máximo de respuestas guardadas
+            ttl: Segundos de vida de cada respuesta (acota la desactualización entre procesos)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            cached, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return cached
+
+    def set(self, key, body, last_modified=None, mimetype='application/json'):
+        """Guardar un cuerpo serializado; el ETag se deriva de su contenido"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        cached = CachedResponse(body, hashlib.md5(body).hexdigest(), last_modified, mimetype)
+        with self._lock:
+            self._entries[key] = (cached, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return cached
+
+    def invalidate(self, predicate=None):
+        """Eliminar todas las entradas, o solo aquellas cuya clave cumpla predicate(key)"""
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    @staticmethod
+    def make_response(cached, max_age=0):
+        """Respuesta condicional: 304 si el cliente ya tiene esta versión"""
+        response = current_app.response_class(cached.body, mimetype=cached.mimetype)
+        response.set_etag(cached.etag)
+        if cached.last_modified:
+            response.last_modified = cached.last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response.make_conditional(request)
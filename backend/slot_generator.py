@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Generador de slots recurrentes a partir de AdvisorAvailability
+Expande las ventanas semanales de cada asesor activo en filas AppointmentSlot
+para un horizonte móvil, con inserciones masivas, de forma incremental
+(solo los días nuevos desde el último slot generado) e idempotente
+
+Las ventanas están en la hora local de su zona y los slots se guardan en UTC
+naive, la misma convención que los slots manuales (ver local_time.py).
+
+Un asesor no puede atender dos citas a la vez: los servicios asignados se
+recorren por prioridad y un slot que se cruza con otro ya existente se
+omite, así que el servicio de mayor prioridad ocupa las ventanas y los
+demás solo reciben los huecos que este deja (por ejemplo, el final de una
+ventana que no alcanza para su duración). Para ofrecer otro servicio en
+el mismo horario hay que crear slots manuales o cambiar las prioridades.
+"""
+
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from interval_index import AdvisorIntervalIndex
+from local_time import resolve_timezone, to_local, to_utc
+
+
+def generate_slots(horizon_days=90, advisor_ids=None, full=False, now=None, chunk_size=1000):
+    """
+    Materializar slots para todos los asesores activos hasta now + horizon_days
+
+    En modo incremental cada asesor continúa desde el día de su último slot
+    autogenerado, salvo que alguna de sus ventanas o asignaciones de servicio
+    haya cambiado después de la última generación: entonces se recorre su
+    horizonte completo (los slots existentes se respetan).
+
+    Args:
+        horizon_days: Días hacia adelante que deben quedar cubiertos
+        advisor_ids: Limitar a estos asesores (None = todos los activos)
+        full: Recorrer todo el horizonte en lugar de solo los días nuevos
+        now: Momento de referencia en UTC (por defecto datetime.utcnow())
+        chunk_size: Filas por inserción masiva
+
+    Returns:
+        dict: Estadísticas de la ejecución
+    """
+    from app import db, Advisor, AdvisorAvailability, AppointmentAdvisor, AppointmentType, AppointmentSlot
+
+    started = time.time()
+    now = (now or datetime.utcnow()).replace(second=0, microsecond=0)
+    horizon_end = now + timedelta(days=horizon_days)
+    stats = {'advisors': 0, 'candidates': 0, 'created': 0, 'skipped': 0}
+
+    # Ventanas activas de asesores activos
+    query = AdvisorAvailability.query.join(Advisor, AdvisorAvailability.advisor_id == Advisor.id).filter(
+        Advisor.is_active == True,  # noqa
+        AdvisorAvailability.is_active == True  # noqa
+    )
+    if advisor_ids is not None:
+        query = query.filter(AdvisorAvailability.advisor_id.in_(advisor_ids))
+    windows = defaultdict(list)
+    for window in query.all():
+        windows[window.advisor_id].append(window)
+    if not windows:
+        return dict(stats, seconds=round(time.time() - started, 3))
+
+    # Servicios asignados a cada asesor, por prioridad
+    services = defaultdict(list)
+    changed_at = {
+        advisor_id: max(window.updated_at or window.created_at or datetime.min for window in advisor_windows)
+        for advisor_id, advisor_windows in windows.items()
+    }
+    rows = db.session.query(AppointmentAdvisor.advisor_id, AppointmentAdvisor.created_at, AppointmentType).join(
+        AppointmentType, AppointmentAdvisor.appointment_type_id == AppointmentType.id
+    ).filter(
+        AppointmentAdvisor.advisor_id.in_(list(windows)),
+        AppointmentAdvisor.is_active == True,  # noqa
+        AppointmentType.is_active == True  # noqa
+    ).order_by(
+        AppointmentAdvisor.advisor_id.asc(),
+        AppointmentAdvisor.priority.asc(),
+        AppointmentType.display_order.asc(),
+        AppointmentType.id.asc()
+    ).all()
+    for advisor_id, assigned_at, appointment_type in rows:
+        services[advisor_id].append(appointment_type)
+        changed_at[advisor_id] = max(changed_at[advisor_id], assigned_at or datetime.min)
+
+    # Marca de agua: último slot autogenerado de cada asesor y cuándo se generó
+    watermarks = {}
+    if not full:
+        watermarks = {
+            advisor_id: (last_start, generated_at)
+            for advisor_id, last_start, generated_at in db.session.query(
+                AppointmentSlot.advisor_id,
+                db.func.max(AppointmentSlot.start_datetime),
+                db.func.max(AppointmentSlot.created_at)
+            ).filter(
+                AppointmentSlot.advisor_id.in_(list(services)),
+                AppointmentSlot.is_auto_generated == True  # noqa
+            ).group_by(AppointmentSlot.advisor_id).all()
+        }
+
+    # Desde dónde generar por asesor; el día de la marca se recorre de nuevo (es idempotente)
+    # y la disponibilidad modificada después de la última generación obliga a empezar desde now
+    generate_from = {}
+    for advisor_id in services:
+        last_start, generated_at = watermarks.get(advisor_id, (None, None))
+        since = now
+        if last_start and generated_at and changed_at[advisor_id] <= generated_at:
+            since = max(now, last_start.replace(hour=0, minute=0, second=0, microsecond=0))
+        if since < horizon_end:
+            generate_from[advisor_id] = since
+    if not generate_from:
+        return dict(stats, seconds=round(time.time() - started, 3))
+
+    # Slots y citas ya existentes en el rango, en una sola consulta
+    busy = AdvisorIntervalIndex.load(generate_from.keys(), min(generate_from.values()), horizon_end)
+
+    pending = []
+    for advisor_id, since in generate_from.items():
+        stats['advisors'] += 1
+        for appointment_type in services[advisor_id]:
+            duration = appointment_type.duration()
+            capacity = max(1, appointment_type.max_participants or 1) if appointment_type.is_group_allowed else 1
+            for window in windows[advisor_id]:
+                tz = resolve_timezone(window.timezone)
+                first_day = to_local(since, tz).date()
+                last_day = to_local(horizon_end, tz).date()
+                day = first_day + timedelta(days=(window.day_of_week - first_day.weekday()) % 7)
+                while day <= last_day:
+                    local_start = datetime.combine(day, window.start_time)
+                    local_end = datetime.combine(day, window.end_time)
+                    while local_start + duration <= local_end:
+                        start = to_utc(local_start, tz)
+                        end = to_utc(local_start + duration, tz)
+                        local_start += duration
+                        if start < since or start >= horizon_end:
+                            continue
+                        stats['candidates'] += 1
+                        if not busy.reserve(advisor_id, start, end):
+                            stats['skipped'] += 1
+                            continue
+                        pending.append({
+                            'appointment_type_id': appointment_type.id,
+                            'advisor_id': advisor_id,
+                            'start_datetime': start,
+                            'end_datetime': end,
+                            'capacity': capacity,
+                            'reserved_seats': 0,
+                            'is_available': True,
+                            'is_auto_generated': True,
+                            'created_at': now,
+                            'updated_at': now,
+                        })
+                    day += timedelta(days=7)
+
+    for offset in range(0, len(pending), chunk_size):
+        db.session.bulk_insert_mappings(AppointmentSlot, pending[offset:offset + chunk_size])
+    db.session.commit()
+
+    stats['created'] = len(pending)
+    stats['seconds'] = round(time.time() - started, 3)
+    print(f"✅ Slots generados: {stats['created']} nuevos, {stats['skipped']} omitidos por solapamiento "
+          f"({stats['advisors']} asesores, {stats['seconds']}s)")
+    return stats
+
+
+if __name__ == '__main__':
+    # Uso: python slot_generator.py [--days N] [--full]
+    from app import app
+
+    days = 90
+    if '--days' in sys.argv:
+        days = int(sys.argv[sys.argv.index('--days') + 1])
+
+    with app.app_context():
+        generate_slots(horizon_days=days, full='--full' in sys.argv)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Prueba de concurrencia de las reservas de cupo
+Lanza muchos hilos contra una base SQLite temporal en disco (nunca la base
+de la aplicación) y comprueba que los cupos no se sobrevenden:
+
+- evento: N usuarios se inscriben a la vez en un evento con capacidad K por
+  las rutas reales; la mitad cancela dos veces en paralelo. registered_count
+  debe ser igual a las inscripciones activas y nunca superar K.
+- slot de cita: N hilos reservan a la vez un slot con capacidad K; deben
+  lograrlo exactamente K y el slot debe quedar no disponible. Después cada
+  cita se cancela dos veces en paralelo y el slot debe quedar vacío y
+  disponible.
+
+Uso: python stress_seat_reservations.py [--threads N] [--capacity K]
+Sale con código 1 si se viola alguna invariante.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+WORKDIR = Path(tempfile.mkdtemp(prefix='relatic-stress-'))
+# Configurar antes de importar la aplicación: base temporal y sin workers de correo
+os.environ['DATABASE_URL'] = f"sqlite:///{WORKDIR / 'stress.db'}"
+os.environ['EMAIL_QUEUE_WORKERS'] = '0'
+
+from app import (  # noqa: E402
+    app, db, Advisor, Appointment, AppointmentSlot, AppointmentType, Event, EventRegistration, User
+)
+
+
+def _create_users(count, prefix):
+    users = [User(email=f'{prefix}{i}@stress.local', first_name='Stress', last_name=str(i),
+                  password_hash='x', is_active=True) for i in range(count)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [user.id for user in users]
+
+
+def _run_threads(target, args_list):
+    """Arranca todos los hilos a la vez (barrera) y devuelve los errores inesperados"""
+    barrier = threading.Barrier(len(args_list))
+    errors = []
+
+    def run(*args):
+        barrier.wait()
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=run, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def stress_event(threads, capacity):
+    """Inscripciones y cancelaciones concurrentes sobre un mismo evento"""
+    with app.app_context():
+        event = Event(title='Stress', slug='stress-event', start_date=datetime(2030, 1, 1),
+                      end_date=datetime(2030, 1, 2), publish_status='published',
+                      capacity=capacity, base_price=0)
+        db.session.add(event)
+        user_ids = _create_users(threads, 'event')
+
+    def attendee(user_id, cancels):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        response = client.post('/events/stress-event/register')
+        assert response.status_code == 302, response.status_code
+        if cancels:
+            client.post('/events/stress-event/cancel-registration')
+            client.post('/events/stress-event/cancel-registration')
+
+    errors = _run_threads(attendee, [(user_id, i % 2 == 0) for i, user_id in enumerate(user_ids)])
+
+    with app.app_context():
+        event = Event.query.filter_by(slug='stress-event').one()
+        active = EventRegistration.query.filter(
+            EventRegistration.event_id == event.id,
+            EventRegistration.registration_status != 'cancelled'
+        ).count()
+        total = EventRegistration.query.filter_by(event_id=event.id).count()
+    print(f"📊 Evento: {threads} hilos, capacidad {capacity}: {total} inscripciones, "
+          f"{active} activas, registered_count={event.registered_count}")
+    ok = not errors and event.registered_count == active and active <= capacity and total >= capacity
+    return ok, errors
+
+
+def stress_slot(threads, capacity):
+    """Reservas concurrentes de un slot y cancelaciones dobles de sus citas"""
+    with app.app_context():
+        advisor_user_id = _create_users(1, 'advisor')[0]
+        advisor = Advisor(user_id=advisor_user_id)
+        appointment_type = AppointmentType(name='Stress')
+        db.session.add_all([advisor, appointment_type])
+        db.session.flush()
+        slot = AppointmentSlot(appointment_type_id=appointment_type.id, advisor_id=advisor.id,
+                               start_datetime=datetime(2030, 1, 1, 9), end_datetime=datetime(2030, 1, 1, 10),
+                               capacity=capacity)
+        db.session.add(slot)
+        db.session.commit()
+        slot_id = slot.id
+        user_ids = _create_users(threads, 'slot')
+
+    booked = []
+    lock = threading.Lock()
+
+    def book(user_id):
+        with app.app_context():
+            try:
+                slot = db.session.get(AppointmentSlot, slot_id)
+                if not slot.reserve_seat():
+                    db.session.rollback()
+                    return
+                appointment = Appointment(appointment_type_id=slot.appointment_type_id, advisor_id=slot.advisor_id,
+                                          slot_id=slot.id, user_id=user_id, start_datetime=slot.start_datetime,
+                                          end_datetime=slot.end_datetime)
+                db.session.add(appointment)
+                db.session.commit()
+                with lock:
+                    booked.append(appointment.id)
+            finally:
+                db.session.remove()
+
+    errors = _run_threads(book, [(user_id,) for user_id in user_ids])
+    with app.app_context():
+        slot = db.session.get(AppointmentSlot, slot_id)
+        reserved, available = slot.reserved_seats, slot.is_available
+    print(f"📊 Slot: {threads} hilos, capacidad {capacity}: {len(booked)} reservas, "
+          f"reserved_seats={reserved}, is_available={available}")
+    ok = len(booked) == capacity and reserved == capacity and not available
+
+    cancelled = []
+
+    def cancel(appointment_id):
+        with app.app_context():
+            try:
+                appointment = db.session.get(Appointment, appointment_id)
+                if appointment.cancel('stress', 'user'):
+                    with lock:
+                        cancelled.append(appointment_id)
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    errors += _run_threads(cancel, [(appointment_id,) for appointment_id in booked * 2])
+    with app.app_context():
+        slot = db.session.get(AppointmentSlot, slot_id)
+        reserved, available = slot.reserved_seats, slot.is_available
+    print(f"📊 Slot tras cancelar dos veces cada cita: {len(cancelled)} cancelaciones efectivas, "
+          f"reserved_seats={reserved}, is_available={available}")
+    ok = ok and not errors and sorted(cancelled) == sorted(booked) and reserved == 0 and available
+    return ok, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de concurrencia de las reservas de cupo")
+    parser.add_argument('--threads', type=int, default=40, help="Hilos concurrentes")
+    parser.add_argument('--capacity', type=int, default=10, help="Capacidad del evento y del slot")
+    args = parser.parse_args()
+
+    try:
+        with app.app_context():
+            db.create_all()
+        ok = True
+        for scenario in (stress_event, stress_slot):
+            passed, errors = scenario(args.threads, args.capacity)
+            for error in errors[:5]:
+                print(f"   ⚠️ {error}")
+            ok = ok and passed
+        if not ok:
+            print("❌ Invariante de cupos violada")
+            sys.exit(1)
+        print("✅ Sin sobreventa: los contadores coinciden con las reservas activas")
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()